@@ -0,0 +1,155 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from helpers import predictions as pred
+from helpers import sequenceFetch as sf
+from benchmarks import synthetic
+'''
+    Benchmarks every stage of the pipeline on synthetic data, at several
+    input sizes, and writes the results as JSON.
+
+    Run from the repository root:
+        python -m benchmarks.run --sizes 100,200,400 --output bench.json
+        python -m benchmarks.run --baseline bench.json
+
+    With --baseline, every stage that got slower than the baseline by more
+    than --tolerance is reported and the exit code is 1.
+'''
+
+def measure(function, *args, **kwargs):
+    '''
+        Runs function twice, once under tracemalloc for its peak traced
+        memory and once for its wall and CPU time, since tracing slows Python
+        heavy stages down several times over. Returns the result of the timed
+        run together with the metrics. Output printed by the function is
+        swallowed, and the function has to be safe to run twice.
+    '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        try:
+            function(*args, **kwargs)
+            peakBytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        started = time.perf_counter()
+        cpuStarted = time.process_time()
+        result = function(*args, **kwargs)
+        metrics = {'seconds': time.perf_counter()-started, 'cpuSeconds': time.process_time()-cpuStarted, 'peakBytes': peakBytes}
+    return result, metrics
+
+def runSuite(records:list, classes:int, workDir:str, windows:list, ngramRanges:list, vectorizerModes:list, models:list, files:int=2):
+    '''
+        Runs every stage once on records and returns a dict of stage name to
+        metrics.
+    '''
+    results = {}
+    entries = workDir+"/entries/"
+    os.makedirs(entries)
+    for fileNo in range(files):
+        synthetic.writeFasta(entries+"part%i.fasta" % fileNo, records[fileNo::files])
+
+    # A single worker keeps parsing in this process, where tracemalloc can see it
+    _, results['sequenceToFile'] = measure(sf.getSequences, synthetic.termClassPairs(classes), inPath=entries, outPath=workDir+"/sequences/", workers=1)
+    _, results['combineSequences'] = measure(sf.combineSequences, inPath=workDir+"/sequences/", outPath=workDir+"/combined/")
+
+    sequences = sorted(sf.readSequences("combined_sequences.txt", workDir+"/combined/"), key=lambda record: record[1])
+    rawSequences = [sequence for sequence, _ in sequences]
+    matrices = {}
+    for window in windows:
+        kmerFile = "kmers%i.txt" % window
+        _, results['createKmers[w=%i]' % window] = measure(sf.createKmers, inPath=workDir+"/combined/", outPath=workDir+"/kmers/", outFile=kmerFile, windowSize=window)
+        (kmers, kmerClasses, _), results['separateSeqAndClass[w=%i]' % window] = measure(sf.separateSeqAndClass, kmerFile, workDir+"/kmers/")
+
+        for ngramRange in ngramRanges:
+            for mode in vectorizerModes:
+                name = 'vectorizeData[%s,w=%i,ngram=%i-%i]' % (mode, window, ngramRange[0], ngramRange[1])
+                if mode in ('kvec', 'ktfidf'):
+                    matrix, results[name] = measure(pred.vectorizeData, rawSequences, ngramRange, mode, windowSize=window)
+                else:
+                    matrix, results[name] = measure(pred.vectorizeData, kmers, ngramRange, mode)
+                results[name].update({'shape': list(matrix.shape), 'nnz': int(matrix.nnz)})
+                matrices.setdefault((window, ngramRange), (matrix, kmerClasses))
+
+    matrix, matrixClasses = matrices[(windows[0], ngramRanges[0])]
+    for mode in models:
+        x_train, x_test, y_train, y_test, _ = pred._splitAndScale(matrix, matrixClasses, None, 0.2, 64, scale=mode not in pred.UNSCALED_MODES)
+        with contextlib.redirect_stdout(io.StringIO()):
+            model = pred._buildModel(mode, iterations=1000)
+        # 'cnb' is measured with its densification, since that is part of its cost
+        densify = (lambda x: x.toarray()) if mode == 'cnb' else (lambda x: x)
+        _, results['fit[%s]' % mode] = measure(lambda: model.fit(densify(x_train), y_train))
+        prediction, results['predict[%s]' % mode] = measure(lambda: model.predict(densify(x_test)))
+        results['predict[%s]' % mode]['accuracy'] = float((prediction == y_test).mean())
+    return results
+
+def compare(results:dict, baseline:dict, tolerance:float=0.25, minSeconds:float=0.01):
+    '''
+        Returns the list of (size, stage, baseline seconds, seconds) that got
+        slower than the baseline by more than tolerance, ignoring differences
+        below minSeconds.
+    '''
+    regressions = []
+    for size, stages in results['sizes'].items():
+        for stage, metrics in stages.items():
+            previous = baseline.get('sizes', {}).get(size, {}).get(stage)
+            if previous is None:
+                continue
+            if metrics['seconds'] > previous['seconds']*(1+tolerance) and metrics['seconds']-previous['seconds'] > minSeconds:
+                regressions.append((size, stage, previous['seconds'], metrics['seconds']))
+    return regressions
+
+def _printCurves(results:dict):
+    sizes = list(results['sizes'])
+    stages = list(results['sizes'][sizes[0]])
+    width = max(len(stage) for stage in stages)
+    print("stage".ljust(width) + "".join(("n=%s" % size).rjust(12) for size in sizes))
+    for stage in stages:
+        print(stage.ljust(width) + "".join(("%.3fs" % results['sizes'][size][stage]['seconds']).rjust(12) for size in sizes))
+
+def _ranges(text:str):
+    return [tuple(int(value) for value in item.split('-')) for item in text.split(',')]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks the pipeline stages on synthetic genomes.")
+    parser.add_argument('--sizes', default="50,100,200", help="Comma separated record counts, one run each")
+    parser.add_argument('--length', type=int, default=1000, help="Mean sequence length")
+    parser.add_argument('--length-sigma', type=float, default=0.5)
+    parser.add_argument('--classes', type=int, default=4)
+    parser.add_argument('--gc', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=64)
+    parser.add_argument('--windows', default="3,4")
+    parser.add_argument('--ngrams', default="1-1,1-2", help="Comma separated ngram ranges, e.g. 1-1,1-4")
+    parser.add_argument('--vectorizers', default="cvec,tfidf,kvec,ktfidf")
+    parser.add_argument('--models', default="cnn,svc,dtc,cnb,mnb")
+    parser.add_argument('--output', default="bench_output.json")
+    parser.add_argument('--baseline', default=None, help="Results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown over the baseline, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    windows = [int(window) for window in args.windows.split(',')]
+    results = {'meta': {'timestamp': time.time(), 'python': platform.python_version(), 'machine': platform.machine(), 'args': vars(args)}, 'sizes': {}}
+    for size in [int(size) for size in args.sizes.split(',')]:
+        print("Benchmarking %i records" % size)
+        records = synthetic.makeRecords(size, args.classes, args.length, args.length_sigma, args.gc, args.seed)
+        with tempfile.TemporaryDirectory() as workDir:
+            results['sizes'][str(size)] = runSuite(records, args.classes, workDir, windows, _ranges(args.ngrams), args.vectorizers.split(','), args.models.split(','))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    _printCurves(results)
+    print("Results written to " + args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for size, stage, before, after in regressions:
+            print("REGRESSION n=%s %s: %.3fs -> %.3fs" % (size, stage, before, after))
+        if regressions:
+            raise SystemExit(1)
+        print("No regressions against " + args.baseline)
@@ -0,0 +1,64 @@
+import numpy as np
+'''
+    Seeded synthetic genome generator for the benchmarks. Everything is
+    generated locally, so the benchmarks never need to reach NCBI.
+'''
+
+def classTerm(classNo:int):
+    '''
+        Returns the term that marks a record of the given class in its
+        description. Terms don't contain each other, so each record matches
+        exactly one term.
+    '''
+    return "synthetic organism %03i" % classNo
+
+def termClassPairs(classes:int):
+    '''
+        Returns the termClassPairs to pass to getSequences() for records made
+        by makeRecords().
+    '''
+    return [(classTerm(classNo), classNo) for classNo in range(classes)]
+
+def makeRecords(count:int, classes:int=4, meanLength:int=1000, lengthSigma:float=0.5, gcContent:float=0.5, seed:int=64):
+    '''
+        Returns a list of (description, sequence, class) tuples.
+
+        count: Amount of records
+
+        classes: Amount of classes, assigned round robin
+
+        meanLength: Mean sequence length. Lengths follow a log-normal
+                    distribution around it
+
+        lengthSigma: Sigma of the log-normal length distribution, 0 for fixed
+                     length sequences
+
+        gcContent: Probability of each base being g or c. Each class gets its
+                   GC content shifted slightly so the classes are separable
+
+        seed: Seed for reproducible records
+    '''
+    rng = np.random.default_rng(seed)
+    mu = np.log(meanLength) - lengthSigma**2/2
+    lengths = np.maximum(rng.lognormal(mu, lengthSigma, count).astype(int), 1) if lengthSigma else np.full(count, meanLength)
+    bases = np.frombuffer(b'atgc', dtype=np.uint8)
+    records = []
+    for index, length in enumerate(lengths):
+        classNo = index % classes
+        gc = min(max(gcContent + 0.05*(classNo - (classes-1)/2), 0.0), 1.0)
+        probabilities = [(1-gc)/2, (1-gc)/2, gc/2, gc/2]
+        sequence = bases[rng.choice(4, size=length, p=probabilities)].tobytes().decode('ascii')
+        records.append(("SYN%07i %s record %i" % (index, classTerm(classNo), index), sequence, classNo))
+    return records
+
+def writeFasta(path:str, records:list, lineWidth:int=70):
+    '''
+        Writes records from makeRecords() to a FASTA file, with upper case
+        sequences wrapped at lineWidth like NCBI downloads.
+    '''
+    with open(path, "w") as output:
+        for description, sequence, _ in records:
+            output.write(">"+description+"\n")
+            sequence = sequence.upper()
+            for start in range(0, len(sequence), lineWidth):
+                output.write(sequence[start:start+lineWidth]+"\n")
@@ -0,0 +1,146 @@
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.model_selection import StratifiedKFold, StratifiedGroupKFold
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import precision_recall_fscore_support
+from helpers import predictions as pred
+from helpers import instrumentation as instr
+from helpers.experiments import shareMatrix, _runJob
+'''
+    K-fold cross-validation of several models at once.
+
+    The folds are split and scaled a single time in the main process, then
+    copied into shared memory like ExperimentRunner does, so every model is
+    fitted on the same scaled matrices without refitting a StandardScaler
+    per model. Every (fold, model) pair is a job on the process pool.
+
+    Sample use:
+        crossValidate(['svc', 'dtc', 'mnb'], vectorizedData, classes, classNames, folds=5)
+
+    Folds are stratified by class. Passing groups, e.g. the source term of
+    every record, keeps all records of a group in the same fold.
+'''
+
+def foldIndexes(classes, folds:int=5, groups=None, randState:int=64):
+    '''
+        Returns a list of (train, test) index arrays, stratified by class and,
+        when groups is given, without splitting any group across folds.
+    '''
+    classes = np.asarray(classes)
+    if groups is None:
+        splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=randState)
+    else:
+        splitter = StratifiedGroupKFold(n_splits=folds, shuffle=True, random_state=randState)
+    return list(splitter.split(np.zeros(len(classes)), classes, groups))
+
+def crossValidate(modes:list, data, classes, classNames, folds:int=5, groups=None, outPath:str='data/predictions/', termPath:str='crossValidation/', workers:int=None, threadsPerWorker:int=1, layers:tuple=(8, 4), iterations:int=3200, randState:int=64):
+    '''
+        Cross-validates every mode on data and writes one report per mode to
+        outPath/termPath/<mode>.txt, with the classification report of the
+        predictions of all folds together, the mean and standard deviation of
+        every metric over the folds, and how long each step took.
+        Returns {mode: {metric: per fold values}}.
+
+        modes: List of modes accepted by ExperimentRunner.addJob()
+
+        data: Feature matrix, e.g. from vectorizeData()
+
+        classes: Class of every row of data
+
+        folds: Amount of folds
+
+        groups: Optional group of every row of data. Rows of a group are never
+                split across training and test folds
+
+        workers, threadsPerWorker: Same as in ExperimentRunner
+    '''
+    if not os.path.isdir(outPath+termPath):
+        os.makedirs(outPath+termPath)
+    classes = np.asarray(classes)
+    labels = np.unique(classes)
+    indexes = foldIndexes(classes, folds, groups, randState)
+    started = time.perf_counter()
+
+    segments = []
+    prepared = {}
+    scaleSeconds = {}
+    try:
+        specs = []
+        for fold, (train, test) in enumerate(indexes):
+            for mode in modes:
+                scale = mode not in pred.UNSCALED_MODES
+                key = (fold, scale)
+                if key not in prepared:
+                    scaleStarted = time.perf_counter()
+                    with instr.stage('scale', fold=fold, termPath=termPath) as info:
+                        scaler = StandardScaler(with_mean=False, with_std=scale).fit(data[train])
+                        x_train, x_test = scaler.transform(data[train]), scaler.transform(data[test])
+                        info.update(instr.matrixInfo(x_train))
+                    handles = []
+                    for matrix in (x_train, x_test):
+                        handle, created = shareMatrix(matrix)
+                        segments.extend(created)
+                        handles.append(handle)
+                    prepared[key] = handles
+                    scaleSeconds[key] = time.perf_counter()-scaleStarted
+                trainHandle, testHandle = prepared[key]
+                specs.append({'mode': mode, 'fold': fold, 'termPath': termPath, 'classNames': classNames, 'report': False, 'layers': layers, 'iterations': iterations, 'randState': randState, 'instrument': instr.config(), 'x_train': trainHandle, 'x_test': testHandle, 'y_train': classes[train], 'y_test': classes[test]})
+
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = [pool.submit(_runJob, spec, threadsPerWorker) for spec in specs]
+            results = [future.result() for future in futures]
+    finally:
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+    wallSeconds = time.perf_counter()-started
+
+    scores = {}
+    for mode in modes:
+        modeResults = [(spec, result) for spec, result in zip(specs, results) if spec['mode'] == mode]
+        metrics = {'accuracy': [], 'precision': [], 'recall': [], 'f1': []}
+        perClass = []
+        for spec, result in modeResults:
+            metrics['accuracy'].append(float((result['prediction'] == spec['y_test']).mean()))
+            # A fold is only scored on the classes it tests, classes missing
+            # from it are left out instead of counting as 0
+            present = np.unique(spec['y_test'])
+            macro = precision_recall_fscore_support(spec['y_test'], result['prediction'], labels=present, average='macro', zero_division=0.0)
+            for name, value in zip(('precision', 'recall', 'f1'), macro):
+                metrics[name].append(float(value))
+            f1 = np.full(len(labels), np.nan)
+            f1[np.searchsorted(labels, present)] = precision_recall_fscore_support(spec['y_test'], result['prediction'], labels=present, zero_division=0.0)[2]
+            perClass.append(f1)
+        scores[mode] = metrics
+
+        yTrue = np.concatenate([spec['y_test'] for spec, _ in modeResults])
+        yPredicted = np.concatenate([result['prediction'] for _, result in modeResults])
+        fitSeconds = np.array([result['fitSeconds'] for _, result in modeResults])
+        predictSeconds = np.array([result['predictSeconds'] for _, result in modeResults])
+        scale = mode not in pred.UNSCALED_MODES
+        foldScaleSeconds = np.array([seconds for (_, scaled), seconds in scaleSeconds.items() if scaled == scale])
+        names = classNames if classNames is not None and len(classNames) == len(labels) else [str(label) for label in labels]
+        with open(outPath+termPath+mode+".txt", "w") as f:
+            f.write("%i-fold cross-validation%s\n\n" % (len(indexes), "" if groups is None else ", grouped"))
+            f.write("All folds:\n")
+            f.write(pred._report(yTrue, yPredicted, names, labels))
+            f.write("\nMean and standard deviation over the folds:\n")
+            for name, values in metrics.items():
+                f.write("%-20s %.4f +/- %.4f\n" % (name, np.mean(values), np.std(values)))
+            perClass = np.array(perClass)
+            for column, name in enumerate(names):
+                f.write("%-20s %.4f +/- %.4f\n" % ("f1 " + str(name)[:17], np.nanmean(perClass[:, column]), np.nanstd(perClass[:, column])))
+            f.write("\nTiming:\n")
+            f.write("%-20s %.3fs total, %.3fs per fold, shared by every model\n" % ("scale", foldScaleSeconds.sum(), foldScaleSeconds.mean()))
+            f.write("%-20s %.3fs total, %.3fs +/- %.3fs per fold\n" % ("fit", fitSeconds.sum(), fitSeconds.mean(), fitSeconds.std()))
+            f.write("%-20s %.3fs total, %.3fs +/- %.3fs per fold\n" % ("predict", predictSeconds.sum(), predictSeconds.mean(), predictSeconds.std()))
+            f.write("%-20s %.3fs for all models\n" % ("wall clock", wallSeconds))
+
+        stages = [record for _, result in modeResults for record in result['stages']]
+        if instr.isEnabled():
+            instr.addRecords(stages)
+            instr.writeMetrics(outPath+termPath+mode+".json", stages, mode=mode, termPath=termPath, folds=len(indexes), scores=metrics)
+        print("%s%s: accuracy %.4f +/- %.4f, fit %.2fs per fold" % (termPath, mode, np.mean(metrics['accuracy']), np.std(metrics['accuracy']), fitSeconds.mean()))
+    return scores
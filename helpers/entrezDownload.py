@@ -0,0 +1,236 @@
+import io
+import json
+import os
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from Bio import Entrez, bgzf
+from collections.abc import Iterable
+'''
+    Concurrent downloader behind getData(). Every term goes through the
+    esearch -> epost -> efetch flow, and the efetch batches of all terms are
+    spread over a pool of worker threads that share a single token bucket,
+    so the request rate allowed by NCBI is never exceeded.
+
+    Each finished batch is written to its own part file and recorded in a
+    per-term manifest, so an interrupted run picks up from the last finished
+    batch. The final file is only assembled once every batch of a term is in.
+    Changing maxRecords or batchSize between runs starts the term over.
+'''
+
+EUTILS_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+
+class TokenBucket:
+    '''
+        Thread safe token bucket. acquire() blocks until a token is available.
+
+        rate: Tokens added per second
+
+        capacity: Maximum amount of tokens that can be saved up. Defaults to
+                  1, which keeps requests evenly spaced
+    '''
+    def __init__(self, rate:float, capacity:int=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now-self.updated)*self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1-self.tokens)/self.rate
+            time.sleep(wait)
+
+_limiters = {}
+_limitersLock = threading.Lock()
+
+class EntrezClient:
+    '''
+        Minimal E-utilities client with rate limiting and retries.
+
+        email: Sent with every request to identify yourself to NCBI
+
+        apiKey: Optional NCBI API key, raises the allowed rate from 3 to 10
+                requests per second
+
+        baseUrl: Root of the E-utilities, can be pointed at a local stand-in
+                 server for testing, such as tests/entrezStub.py
+
+        retries: Amount of attempts for each request before giving up
+
+        backoff: Seconds to wait before the first retry, doubled on each
+                 further retry
+
+        rate: Requests per second. By default, clients of the same baseUrl
+              and apiKey share one limiter within the process, so clients
+              running side by side, e.g. concurrent pipeline stages, stay
+              within NCBI's limit together
+    '''
+    def __init__(self, email:str, apiKey:str=None, baseUrl:str=EUTILS_URL, retries:int=5, backoff:float=1.0, rate:float=None):
+        self.email = email
+        self.apiKey = apiKey
+        self.baseUrl = baseUrl if baseUrl.endswith('/') else baseUrl+'/'
+        self.retries = retries
+        self.backoff = backoff
+        if rate is not None:
+            self.limiter = TokenBucket(rate)
+        else:
+            with _limitersLock:
+                self.limiter = _limiters.setdefault((self.baseUrl, apiKey), TokenBucket(10 if apiKey else 3))
+
+    def request(self, utility:str, params:dict):
+        '''
+            POSTs params to the given utility, e.g. "esearch.fcgi", and
+            returns the body of the response as bytes.
+        '''
+        params = dict(params, tool="genome-classifier", email=self.email)
+        if self.apiKey:
+            params['api_key'] = self.apiKey
+        data = urllib.parse.urlencode(params).encode()
+
+        for attempt in range(self.retries):
+            self.limiter.acquire()
+            try:
+                with urllib.request.urlopen(self.baseUrl+utility, data=data, timeout=60) as response:
+                    return response.read()
+            except urllib.error.HTTPError as error:
+                if error.code not in (429, 500, 502, 503, 504) or attempt == self.retries-1:
+                    raise
+            except (urllib.error.URLError, TimeoutError, ConnectionError):
+                if attempt == self.retries-1:
+                    raise
+            time.sleep(self.backoff * 2**attempt)
+
+    def esearch(self, term:str, maxRecords:int, db:str="nucleotide"):
+        record = Entrez.read(io.BytesIO(self.request("esearch.fcgi", {'db': db, 'term': term, 'retmax': str(maxRecords)})))
+        return list(record['IdList'])
+
+    def epost(self, ids:list, db:str="nucleotide"):
+        record = Entrez.read(io.BytesIO(self.request("epost.fcgi", {'db': db, 'id': ','.join(ids)})))
+        return record['WebEnv'], record['QueryKey']
+
+    def efetch(self, webenv:str, queryKey:str, start:int, batchSize:int, returnType:str="fasta", db:str="nucleotide"):
+        return self.request("efetch.fcgi", {'db': db, 'rettype': returnType, 'retmode': 'text', 'retstart': str(start), 'retmax': str(batchSize), 'WebEnv': webenv, 'query_key': queryKey})
+
+class _TermDownload:
+    '''
+        State of a single term: its manifest, the batches still to download
+        and the throughput counters.
+    '''
+    def __init__(self, term:str, outPath:str, returnType:str, compress:bool=False):
+        self.term = term
+        self.outFile = outPath+term+"."+returnType+(".gz" if compress else "")
+        self.compress = compress
+        self.partPath = outPath+".parts/"+term+"/"
+        self.manifestFile = self.partPath+"manifest.json"
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.started = None
+        self.elapsed = 0.0
+        self.manifest = None
+        if os.path.isfile(self.manifestFile):
+            with open(self.manifestFile) as f:
+                self.manifest = json.load(f)
+
+    def prepare(self, client:EntrezClient, maxRecords:int, batchSize:int):
+        self.started = time.monotonic()
+        if self.manifest is None or self.manifest['batchSize'] != batchSize or self.manifest.get('maxRecords') != maxRecords:
+            print("Searching for %s" % self.term)
+            ids = client.esearch(self.term, maxRecords)
+            # Parts of an earlier search don't line up with the new batches
+            if os.path.isdir(self.partPath):
+                shutil.rmtree(self.partPath)
+            self.manifest = {'term': self.term, 'ids': ids, 'maxRecords': maxRecords, 'batchSize': batchSize, 'done': []}
+            os.makedirs(self.partPath)
+            self._saveManifest()
+        else:
+            print("Resuming %s, %i of %i batches already downloaded" % (self.term, len(self.manifest['done']), len(self.pending())+len(self.manifest['done'])))
+        if self.pending():
+            # The history server session may have expired since the last run
+            self.webenv, self.queryKey = client.epost(self.manifest['ids'])
+        return self
+
+    def pending(self):
+        count = len(self.manifest['ids'])
+        return [start for start in range(0, count, self.manifest['batchSize']) if start not in self.manifest['done']]
+
+    def fetch(self, client:EntrezClient, start:int, returnType:str):
+        count = len(self.manifest['ids'])
+        end = min(count, start + self.manifest['batchSize'])
+        print("Downloading %s record %i to %i" % (self.term, start+1, end))
+        data = client.efetch(self.webenv, self.queryKey, start, self.manifest['batchSize'], returnType)
+        part = self.partPath+"%010i" % start
+        with open(part+".tmp", "wb") as f:
+            f.write(data)
+        os.replace(part+".tmp", part)
+        with self.lock:
+            self.bytes += len(data)
+            self.manifest['done'].append(start)
+            self._saveManifest()
+            return not self.pending()
+
+    def assemble(self):
+        with (bgzf.BgzfWriter(self.outFile, "wb") if self.compress else open(self.outFile, "wb")) as output:
+            for start in sorted(self.manifest['done']):
+                with open(self.partPath+"%010i" % start, "rb") as part:
+                    output.write(part.read())
+        for start in self.manifest['done']:
+            os.remove(self.partPath+"%010i" % start)
+        os.remove(self.manifestFile)
+        os.rmdir(self.partPath)
+        self.elapsed = time.monotonic() - self.started
+
+    def _saveManifest(self):
+        with open(self.manifestFile+".tmp", "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(self.manifestFile+".tmp", self.manifestFile)
+
+def downloadTerms(terms:Iterable, maxRecords:int, batchSize:int, client:EntrezClient, outPath:str="data/entries/", returnType:str="fasta", workers:int=3, compress:bool=False):
+    '''
+        Downloads every term concurrently and returns a dict of throughput
+        statistics per term, plus an "overall" entry.
+
+        compress: Whether each term's file is written BGZF compressed, as
+                  <term>.<returnType>.gz
+
+        workers: Amount of threads issuing requests. The shared rate limit
+                 still applies, so more workers mostly help hide latency
+    '''
+    started = time.monotonic()
+    downloads = [_TermDownload(term, outPath, returnType, compress) for term in terms]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        downloads = list(pool.map(lambda download: download.prepare(client, maxRecords, batchSize), downloads))
+        jobs = [(download, start) for download in downloads for start in download.pending()]
+        finished = pool.map(lambda job: (job[0], job[0].fetch(client, job[1], returnType)), jobs)
+        for download, complete in finished:
+            if complete:
+                download.assemble()
+    for download in downloads:
+        if os.path.isdir(download.partPath):
+            # Terms without any pending batches, e.g. no results or already done
+            download.assemble()
+    if os.path.isdir(outPath+".parts/") and not os.listdir(outPath+".parts/"):
+        os.rmdir(outPath+".parts/")
+
+    stats = {}
+    for download in downloads:
+        stats[download.term] = _throughput(len(download.manifest['ids']), download.bytes, download.elapsed)
+    stats['overall'] = _throughput(sum(len(download.manifest['ids']) for download in downloads), sum(download.bytes for download in downloads), time.monotonic()-started)
+    for term, stat in stats.items():
+        print("%s: %i records, %.1f records/s, %.1f KiB/s" % (term, stat['records'], stat['recordsPerSecond'], stat['bytesPerSecond']/1024))
+    return stats
+
+def _throughput(records:int, size:int, elapsed:float):
+    elapsed = max(elapsed, 1e-9)
+    return {'records': records, 'bytes': size, 'seconds': elapsed, 'recordsPerSecond': records/elapsed, 'bytesPerSecond': size/elapsed}
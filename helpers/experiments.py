@@ -0,0 +1,208 @@
+import os
+import time
+import numpy as np
+from scipy import sparse
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from threadpoolctl import threadpool_limits
+from sklearn.preprocessing import StandardScaler
+from sklearn.utils import shuffle
+from helpers import predictions as pred
+from helpers import instrumentation as instr
+'''
+    Runs a whole matrix of predictionFunction() experiments across a pool of
+    processes.
+
+    Every distinct training set is split and scaled once in the main process.
+    The resulting matrices are copied into shared memory a single time, and
+    the workers rebuild CSR matrices on top of those buffers without copying,
+    so nothing bigger than the class vectors is pickled per job. Each worker
+    is limited to threadsPerWorker BLAS/OpenMP threads to avoid
+    oversubscribing the machine.
+
+    Sample use:
+        runner = ExperimentRunner(workers=4)
+        runner.addDataset('all', vectorizedData, classes)
+        runner.addJob('svc', 'all', classNames, testSize=0.2, iterations=8192)
+        runner.run()
+
+    Reports are written to the same outPath/termPath/mode.txt files
+    predictionFunction() writes.
+'''
+
+def shareMatrix(matrix):
+    '''
+        Copies a CSR matrix or a NumPy array into shared memory. Returns a
+        small picklable handle for attachMatrix() and the list of segments,
+        which the owner should close and unlink once done.
+    '''
+    if sparse.issparse(matrix):
+        matrix = matrix.tocsr()
+        arrays = [matrix.data, matrix.indices, matrix.indptr]
+        handle = {'format': 'csr', 'shape': matrix.shape, 'parts': []}
+    else:
+        arrays = [np.ascontiguousarray(matrix)]
+        handle = {'format': 'dense', 'shape': arrays[0].shape, 'parts': []}
+
+    segments = []
+    for array in arrays:
+        segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+        handle['parts'].append((segment.name, array.dtype.str, array.shape))
+        segments.append(segment)
+    return handle, segments
+
+def attachMatrix(handle:dict):
+    '''
+        Rebuilds the matrix described by a handle from shareMatrix() on top of
+        the shared buffers. Returns the matrix and the attached segments, which
+        have to be kept alive for as long as the matrix is used.
+    '''
+    segments = [shared_memory.SharedMemory(name=name) for name, _, _ in handle['parts']]
+    arrays = [np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf) for segment, (_, dtype, shape) in zip(segments, handle['parts'])]
+    if handle['format'] == 'csr':
+        matrix = sparse.csr_matrix(tuple(arrays), shape=handle['shape'], copy=False)
+    else:
+        matrix = arrays[0]
+    return matrix, segments
+
+def _runJob(job:dict, threads:int):
+    x_train, trainSegments = attachMatrix(job['x_train'])
+    x_test, testSegments = attachMatrix(job['x_test'])
+    # Spawned workers start with instrumentation off, forked ones inherit it
+    if job['instrument'] is not None and not instr.isEnabled():
+        instr.enable(**job['instrument'])
+    mark = len(instr.records())
+    try:
+        with threadpool_limits(limits=threads):
+            model = pred._buildModel(job['mode'], job['layers'], job['iterations'], job['randState'])
+            started = time.perf_counter()
+            with instr.stage('fit', mode=job['mode'], termPath=job['termPath'], samples=x_train.shape[0], worker=os.getpid()):
+                model.fit(x_train, job['y_train'])
+            fitted = time.perf_counter()
+            with instr.stage('predict', mode=job['mode'], termPath=job['termPath'], samples=x_test.shape[0], worker=os.getpid()):
+                prediction = model.predict(x_test)
+            predicted = time.perf_counter()
+
+        # Cross-validation folds may lack classes, and only need the predictions
+        report = pred._report(job['y_test'], prediction, job['classNames']) if job.get('report', True) else None
+        return {'mode': job['mode'], 'termPath': job['termPath'], 'report': report, 'prediction': prediction, 'fitSeconds': fitted-started, 'predictSeconds': predicted-fitted, 'stages': instr.records(mark)}
+    finally:
+        # The CSR matrix views the shared buffers, drop it before closing them
+        del x_train, x_test
+        for segment in trainSegments+testSegments:
+            segment.close()
+
+class ExperimentRunner:
+    '''
+        Collects datasets and (model, train set, test set, params) jobs, then
+        runs them all at once with run().
+
+        workers: Amount of worker processes. Defaults to the amount of CPUs
+
+        threadsPerWorker: Amount of BLAS/OpenMP threads each worker may use.
+                          Defaults to 1
+
+        outPath: Root path for predictions. Defaults to "data/predictions/"
+
+        randState: Integer to allow for reproducible predictions.
+                   Defaults to 64
+    '''
+    def __init__(self, workers:int=None, threadsPerWorker:int=1, outPath:str='data/predictions/', randState:int=64):
+        self.workers = workers or os.cpu_count()
+        self.threadsPerWorker = threadsPerWorker
+        self.outPath = outPath
+        self.randState = randState
+        self.datasets = {}
+        self.jobs = []
+
+    def addDataset(self, name:str, data, classes=None):
+        '''
+            Registers a matrix under a name that jobs refer to. Test sets that
+            are only used with an integer testSize don't need classes.
+        '''
+        self.datasets[name] = (data, None if classes is None else np.asarray(classes))
+
+    def addJob(self, mode:str, train:str, classNames, test:str=None, testSize=0.2, termPath:str='defaultPath/', layers:tuple=(8, 4), iterations:int=3200):
+        '''
+            Adds a job. The parameters are the same as predictionFunction()'s,
+            except train and test, which are names given to addDataset().
+        '''
+        if mode not in ('cnn', 'svc', 'dtc', 'cnb', 'mnb'):
+            raise Exception("Unsupported mode. Expected: \'cnn\', \'svc\', \'dtc\', \'cnb\' or \'mnb\'. Got:", mode)
+        if type(testSize) is int and test is None:
+            raise AttributeError("A test dataset is required when testSize is an integer.")
+        self.jobs.append({'mode': mode, 'train': train, 'test': test, 'testSize': testSize, 'classNames': classNames, 'termPath': termPath, 'layers': layers, 'iterations': iterations})
+
+    def run(self):
+        '''
+            Prepares every distinct split once, runs all jobs across the pool
+            and returns the fit and predict time of each of them.
+        '''
+        segments = []
+        splits = {}
+        tests = {}
+        scalers = {}
+        try:
+            specs = []
+            for job in self.jobs:
+                trainData, trainClasses = self.datasets[job['train']]
+                scale = job['mode'] not in pred.UNSCALED_MODES
+                if type(job['testSize']) is float:
+                    key = (job['train'], job['testSize'], scale)
+                    if key not in splits:
+                        with instr.stage('scale', train=job['train']) as info:
+                            x_train, x_test, y_train, y_test, _ = pred._splitAndScale(trainData, trainClasses, None, job['testSize'], self.randState, scale)
+                            info.update(instr.matrixInfo(x_train))
+                        splits[key] = self._share(x_train, segments), y_train
+                        tests[key] = self._share(x_test, segments), y_test
+                    x_train, y_train = splits[key]
+                    x_test, y_test = tests[key]
+                else:
+                    key = (job['train'], 'shuffled', scale)
+                    testKey = (job['train'], job['test'], scale)
+                    if key not in splits:
+                        with instr.stage('scale', train=job['train']) as info:
+                            x_train, y_train = shuffle(trainData, trainClasses, random_state=self.randState)
+                            scalers[key] = StandardScaler(with_mean=False, with_std=scale).fit(x_train)
+                            splits[key] = self._share(scalers[key].transform(x_train), segments), y_train
+                            info.update(instr.matrixInfo(x_train))
+                    if testKey not in tests:
+                        # Every test set reuses the scaler fitted on the shuffled training set
+                        with instr.stage('scale', train=job['train'], test=job['test']):
+                            x_test = shuffle(self.datasets[job['test']][0], random_state=self.randState)
+                            tests[testKey] = self._share(scalers[key].transform(x_test), segments), None
+                    x_train, y_train = splits[key]
+                    x_test, _ = tests[testKey]
+                    y_test = shuffle(y_train, random_state=self.randState, n_samples=job['testSize'])
+
+                specs.append(dict(job, x_train=x_train, x_test=x_test, y_train=y_train, y_test=y_test, outPath=self.outPath, randState=self.randState, instrument=instr.config()))
+
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(_runJob, spec, self.threadsPerWorker) for spec in specs]
+                results = [future.result() for future in futures]
+        finally:
+            for segment in segments:
+                segment.close()
+                segment.unlink()
+
+        # Reports are written here, in job order, so jobs sharing a report
+        # path end up with the same file as running them one by one would
+        for result in results:
+            path = self.outPath+result['termPath']
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            with open(path+result['mode']+".txt", "w") as f:
+                f.write(result.pop('report'))
+            result.pop('prediction')
+            stages = result.pop('stages')
+            if instr.isEnabled():
+                instr.addRecords(stages)
+                instr.writeMetrics(path+result['mode']+".json", stages, mode=result['mode'], termPath=result['termPath'])
+            print("%s%s: fit %.2fs, predict %.2fs" % (result['termPath'], result['mode'], result['fitSeconds'], result['predictSeconds']))
+        return results
+
+    def _share(self, matrix, segments:list):
+        handle, created = shareMatrix(matrix)
+        segments.extend(created)
+        return handle
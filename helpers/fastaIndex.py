@@ -0,0 +1,187 @@
+import gzip
+import os
+from Bio import bgzf, SeqIO
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from collections.abc import Iterable
+from helpers.termMatcher import TermMatcher
+'''
+    Reading of plain, gzip and BGZF compressed FASTA files, and a faidx-style
+    index for pulling single records out of them without parsing the whole
+    file.
+
+    The index is a sidecar <file>.gcfai with one tab separated line per
+    record:
+        name  length  offset  lineBases  lineWidth  description
+    which are laid out like the five samtools faidx columns, followed by the
+    full description, so records can be selected by term from the index
+    alone. For BGZF files offset is a BGZF virtual offset, which allows
+    seeking straight to the record. samtools keeps those in a separate .gzi
+    instead, so the index has its own suffix and isn't mistaken for a .fai
+    by samtools or pysam. Plain gzip files can't be seeked into, so
+    fetching from them decompresses up to the record, and BGZF (e.g. as
+    written by getData(compress=True) or bgzip) should be preferred.
+'''
+
+COMPRESSED_SUFFIXES = ('.gz', '.bgz')
+INDEX_SUFFIX = ".gcfai"
+# Index files kept next to the entries, ours and those of samtools
+SIDECAR_SUFFIXES = (INDEX_SUFFIX, '.fai', '.gzi')
+
+def compression(path:str):
+    '''
+        Returns 'bgzf', 'gzip' or None depending on the magic bytes of a file.
+    '''
+    with open(path, 'rb') as f:
+        header = f.read(18)
+    if header[:2] != b'\x1f\x8b':
+        return None
+    # BGZF blocks are gzip members with a 'BC' extra subfield
+    if len(header) >= 14 and header[3] & 4 and header[12:14] == b'BC':
+        return 'bgzf'
+    return 'gzip'
+
+def openFasta(path:str, mode:str='rt'):
+    '''
+        Opens a plain or compressed file for streaming, decompressing as it
+        is read. mode is 'rt' or 'rb'.
+    '''
+    kind = compression(path)
+    if kind == 'bgzf':
+        return bgzf.open(path, mode)
+    if kind == 'gzip':
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+def isSidecar(fileName:str):
+    '''
+        Returns whether fileName is an index file rather than entries.
+    '''
+    return fileName.endswith(SIDECAR_SUFFIXES)
+
+def plainName(fileName:str):
+    '''
+        Returns fileName without a compression suffix.
+    '''
+    for suffix in COMPRESSED_SUFFIXES:
+        if fileName.endswith(suffix):
+            return fileName[:-len(suffix)]
+    return fileName
+
+def parseFile(path:str, datatype:str="fasta"):
+    '''
+        Generator over the records of a plain or compressed file, like
+        SeqIO.parse(), closing the file once done.
+    '''
+    with openFasta(path) as handle:
+        yield from SeqIO.parse(handle, datatype)
+
+def buildIndex(path:str, indexPath:str=None):
+    '''
+        Scans a FASTA file once and writes its index. Returns the index path.
+    '''
+    indexPath = path+INDEX_SUFFIX if indexPath is None else indexPath
+    entries = []
+    with openFasta(path, 'rb') as handle:
+        entry = None
+        while True:
+            line = handle.readline()
+            offset = handle.tell()
+            if not line:
+                break
+            if line.startswith(b'>'):
+                description = line[1:].decode().strip().replace('\t', ' ')
+                entry = {'name': description.split(' ', 1)[0], 'description': description, 'length': 0, 'offset': offset, 'lineBases': 0, 'lineWidth': 0}
+                entries.append(entry)
+                continue
+            bases = len(line.rstrip(b'\r\n'))
+            if entry is not None and bases:
+                if not entry['lineBases']:
+                    entry['lineBases'], entry['lineWidth'] = bases, len(line)
+                entry['length'] += bases
+
+    with open(indexPath+".tmp", "w") as f:
+        for entry in entries:
+            f.write("%s\t%i\t%i\t%i\t%i\t%s\n" % (entry['name'], entry['length'], entry['offset'], entry['lineBases'], entry['lineWidth'], entry['description']))
+    os.replace(indexPath+".tmp", indexPath)
+    return indexPath
+
+class FastaIndex:
+    '''
+        Random access to the records of a plain, gzip or BGZF FASTA file.
+        The index is built on first use, and rebuilt when the file is newer
+        than it.
+    '''
+    def __init__(self, path:str, indexPath:str=None):
+        self.path = path
+        self.indexPath = path+INDEX_SUFFIX if indexPath is None else indexPath
+        if not os.path.isfile(self.indexPath) or os.path.getmtime(self.indexPath) < os.path.getmtime(path):
+            buildIndex(path, self.indexPath)
+        self.entries = {}
+        with open(self.indexPath) as f:
+            for line in f:
+                name, length, offset, lineBases, lineWidth, description = line.rstrip("\n").split("\t", 5)
+                self.entries[name] = (int(length), int(offset), int(lineBases), int(lineWidth), description)
+        self.handle = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name:str):
+        return name in self.entries
+
+    def names(self):
+        return list(self.entries)
+
+    def description(self, name:str):
+        return self.entries[name][4]
+
+    def fetch(self, name:str):
+        '''
+            Returns the lower case sequence of a record.
+        '''
+        length, offset, lineBases, lineWidth, _ = self.entries[name]
+        if not length:
+            return ""
+        if self.handle is None:
+            self.handle = openFasta(self.path, 'rb')
+        self.handle.seek(offset)
+        lines, rest = divmod(length, lineBases)
+        data = self.handle.read(lines*lineWidth+rest)
+        return data.replace(b'\n', b'').replace(b'\r', b'').decode().lower()
+
+    def record(self, name:str):
+        '''
+            Returns a record as a SeqRecord, the same as SeqIO.parse() gives.
+        '''
+        return SeqRecord(Seq(self.fetch(name)), id=name, name=name, description=self.description(name))
+
+    def select(self, termClassPairs:Iterable, classes:Iterable[int]=None):
+        '''
+            Generator over the (sequence, class) of the records whose
+            description contains a term, matched on the index alone, so only
+            the matching records are read.
+
+            classes: Optional subset of classes to return
+        '''
+        termClassPairs = list(termClassPairs)
+        classes = None if classes is None else set(classes)
+        matcher = TermMatcher(term for term, _ in termClassPairs)
+        for name, (_, _, _, _, description) in self.entries.items():
+            wanted = [termClassPairs[position][1] for position in matcher.match(description)]
+            wanted = [classNo for classNo in wanted if classes is None or classNo in classes]
+            if wanted:
+                sequence = self.fetch(name)
+                for classNo in wanted:
+                    yield sequence, classNo
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+from scipy import sparse
+from helpers import predictions as pred
+from helpers import sequenceFetch as sf
+'''
+    Content-addressed on-disk cache for vectorizeData() results.
+
+    Entries are keyed by the hash of the input file together with the
+    vectorizer mode, ngram range, window size and step. Each entry holds the
+    CSR arrays, the vocabulary and the class vector as plain .npy files, so a
+    hit only memory maps them and nothing is read until it is used.
+
+    Sample use:
+        cache = FeatureCache(maxBytes=8*1024**3)
+        vectorizedData, classes, classCounts, vocabulary = cachedVectorize("kmers.txt", (1, 4), 'cvec', windowSize=3, cache=cache)
+        print(cache.stats())
+'''
+
+_ARRAYS = ('data', 'indices', 'indptr', 'vocabulary', 'classes')
+
+def fileHash(path:str, blockSize:int=1 << 20):
+    '''
+        Returns the SHA-256 of a file, read in blocks of blockSize bytes.
+    '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class FeatureCache:
+    '''
+        LRU bounded cache of vectorized feature matrices.
+
+        cacheDir: Directory in which the entries are kept. Defaults to
+                  "data/cache/features/"
+
+        maxBytes: Total size of all entries after which the least recently
+                  used ones are evicted. Defaults to 4 GiB
+    '''
+    def __init__(self, cacheDir:str="data/cache/features/", maxBytes:int=4*1024**3):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        self.indexFile = cacheDir+"index.json"
+        self.index = {}
+        if os.path.isfile(self.indexFile):
+            with open(self.indexFile) as f:
+                self.index = json.load(f)
+
+    def key(self, path:str, mode:str, ngramRange:tuple, windowSize:int=None, step:int=1):
+        '''
+            Returns the cache key for vectorizing the file at path with the
+            given parameters.
+        '''
+        params = json.dumps([fileHash(path), mode, list(ngramRange), windowSize, step])
+        return hashlib.sha256(params.encode()).hexdigest()
+
+    def get(self, key:str):
+        '''
+            Returns the memory mapped (matrix, classes, classCounts, vocabulary)
+            for key, or None if it isn't cached.
+        '''
+        entryPath = self.cacheDir+key+"/"
+        if key not in self.index or not os.path.isdir(entryPath):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.index[key]['lastUsed'] = time.time()
+        self._saveIndex()
+        return self._load(key)
+
+    def _load(self, key:str):
+        entryPath = self.cacheDir+key+"/"
+        arrays = {name: np.load(entryPath+name+".npy", mmap_mode='r') for name in _ARRAYS}
+        matrix = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(self.index[key]['shape']), copy=False)
+        return matrix, arrays['classes'], self.index[key]['classCounts'], arrays['vocabulary']
+
+    def put(self, key:str, matrix, classes, classCounts:list, vocabulary):
+        '''
+            Stores an entry and evicts the least recently used ones if the
+            cache grows over maxBytes. Returns the stored entry the same way
+            get() does.
+        '''
+        matrix = sparse.csr_matrix(matrix)
+        entryPath = self.cacheDir+key+"/"
+        tempPath = self.cacheDir+key+".tmp/"
+        if os.path.isdir(tempPath):
+            shutil.rmtree(tempPath)
+        os.makedirs(tempPath)
+        arrays = {'data': matrix.data, 'indices': matrix.indices, 'indptr': matrix.indptr, 'vocabulary': np.asarray(vocabulary, dtype=str), 'classes': np.asarray(classes)}
+        for name, array in arrays.items():
+            np.save(tempPath+name+".npy", array)
+        if os.path.isdir(entryPath):
+            shutil.rmtree(entryPath)
+        os.replace(tempPath, entryPath)
+
+        size = sum(os.path.getsize(entryPath+name+".npy") for name in _ARRAYS)
+        self.index[key] = {'bytes': size, 'lastUsed': time.time(), 'shape': list(matrix.shape), 'classCounts': list(classCounts)}
+        self._evict(keep=key)
+        self._saveIndex()
+        return self._load(key)
+
+    def stats(self):
+        '''
+            Returns the hits, misses and evictions of this instance, and the
+            amount of entries and bytes currently cached.
+        '''
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(self.index), 'bytes': sum(entry['bytes'] for entry in self.index.values())}
+
+    def _evict(self, keep:str):
+        total = sum(entry['bytes'] for entry in self.index.values())
+        for key in sorted(self.index, key=lambda key: self.index[key]['lastUsed']):
+            if total <= self.maxBytes:
+                break
+            if key == keep:
+                continue
+            total -= self.index[key]['bytes']
+            shutil.rmtree(self.cacheDir+key+"/", ignore_errors=True)
+            del self.index[key]
+            self.evictions += 1
+
+    def _saveIndex(self):
+        with open(self.indexFile+".tmp", "w") as f:
+            json.dump(self.index, f)
+        os.replace(self.indexFile+".tmp", self.indexFile)
+
+def cachedVectorize(fileName:str, ngramRange:tuple=(4,4), mode:str='cvec', windowSize:int=None, step:int=1, inPath:str=None, cache:FeatureCache=None):
+    '''
+        Cached version of separateSeqAndClass() followed by vectorizeData().
+        Returns the vectorized data, classes, class counts and vocabulary.
+
+        fileName: For 'cvec' and 'tfidf' the output of createKmers(), for
+                  'kvec' and 'ktfidf' the output of combineSequences()
+
+        inPath: Directory of fileName. Defaults to "data/kmers/" for the
+                k-mer file and to "data/combined_data/" for the sequences
+
+        cache: FeatureCache to use. Defaults to one in "data/cache/features/"
+
+        The remaining parameters are the same as vectorizeData()'s.
+    '''
+    rawSequences = mode in ('kvec', 'ktfidf')
+    if inPath is None:
+        inPath = "data/combined_data/" if rawSequences else "data/kmers/"
+    if cache is None:
+        cache = FeatureCache()
+
+    key = cache.key(inPath+fileName, mode, ngramRange, windowSize, step)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    if rawSequences:
+        records = sorted(sf.readSequences(fileName, inPath), key=lambda record: record[1])
+        sequences = [sequence for sequence, _ in records]
+        classes = [classNo for _, classNo in records]
+        classCounts = {}
+        for classNo in classes:
+            classCounts[classNo] = classCounts.get(classNo, 0) + 1
+        classCounts = [classCounts[classNo] for classNo in sorted(classCounts)]
+    else:
+        sequences, classes, classCounts = sf.separateSeqAndClass(fileName, inPath)
+    matrix, vocabulary = pred.vectorizeData(sequences, ngramRange, mode, windowSize=windowSize, step=step, returnVocabulary=True)
+    return cache.put(key, matrix, classes, classCounts, vocabulary)
@@ -0,0 +1,227 @@
+import json
+import os
+import time
+import numpy as np
+from scipy import sparse
+from sklearn.feature_selection import chi2
+from sklearn.random_projection import SparseRandomProjection
+from sklearn.preprocessing import StandardScaler
+from sklearn.model_selection import train_test_split
+from helpers import predictions as pred
+'''
+    Optional reduction of the feature space between vectorizeData() and
+    model training. The 1-4 gram vocabulary of k-mers dominates memory and
+    the fitting time of the models, and most of its columns are rare.
+
+    Methods:
+        'mindf'      - keeps the columns present in at least minDf rows, and
+                       at most the dimension most frequent of them. Document
+                       frequencies are counted in chunks of rows
+        'chi2'       - keeps the dimension columns with the highest chi2
+                       score against the classes
+        'mi'         - keeps the dimension columns with the highest mutual
+                       information between their presence and the classes
+        'projection' - sparse random projection to dimension columns
+        'hashing'    - adds every column into one of dimension buckets, with
+                       a random sign unless signed=False, using a hash of the
+                       column index
+
+    All of them work on the CSR matrix without densifying it. The selecting
+    methods ('mindf', 'chi2', 'mi') keep the original columns, so their
+    vocabulary can be reduced to match with reduceVocabulary().
+
+    Sample use:
+        reducer = FeatureReducer('chi2', dimension=20000).fit(x_train, y_train)
+        x_train, x_test = reducer.transform(x_train), reducer.transform(x_test)
+
+    reductionReport() compares methods and dimensions by accuracy and fit
+    time, to help pick an operating point.
+'''
+
+METHODS = ('mindf', 'chi2', 'mi', 'projection', 'hashing')
+# Naive Bayes modes, which reject the negative values of signed reductions
+NONNEGATIVE_MODES = pred.UNSCALED_MODES + ('cnb',)
+
+def mutualInformation(matrix, classes):
+    '''
+        Returns the mutual information between the presence of every column
+        and the classes, computed from sparse co-occurrence counts.
+    '''
+    matrix = sparse.csr_matrix(matrix)
+    presence = sparse.csr_matrix((np.ones(matrix.nnz), matrix.indices, matrix.indptr), shape=matrix.shape)
+    labels, inverse = np.unique(np.asarray(classes), return_inverse=True)
+    oneHot = sparse.csr_matrix((np.ones(len(inverse)), (np.arange(len(inverse)), inverse)), shape=(len(inverse), len(labels)))
+    total = matrix.shape[0]
+    together = np.asarray((presence.T @ oneHot).todense())
+    present = together.sum(axis=1, keepdims=True)
+    perClass = np.asarray(oneHot.sum(axis=0))
+    information = np.zeros(matrix.shape[1])
+    # Sum over present (x=1) and absent (x=0) cells of p(x,c) log(p(x,c)/(p(x)p(c)))
+    for joint, marginal in ((together, present), (perClass-together, total-present)):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            terms = joint/total*np.log(joint*total/(marginal*perClass))
+        information += np.nansum(np.where(joint > 0, terms, 0.0), axis=1)
+    return information
+
+class FeatureReducer:
+    '''
+        method: One of 'mindf', 'chi2', 'mi', 'projection' or 'hashing'
+
+        dimension: Amount of columns to keep or project to. Required by every
+                   method but 'mindf', where it is an optional upper bound
+
+        minDf: Only used by 'mindf'. Minimum amount of rows a column has to be
+               present in. Defaults to 2
+
+        chunkSize: Amount of rows counted at once by 'mindf'
+
+        randState: Integer to allow for reproducible projections
+
+        signed: Only used by 'hashing'. Whether columns are added with a
+                random sign, which keeps the inner products unbiased.
+                Unsigned hashing keeps counts non-negative, as the naive
+                Bayes modes need. Defaults to True
+    '''
+    def __init__(self, method:str='mindf', dimension:int=None, minDf:int=2, chunkSize:int=10000, randState:int=64, signed:bool=True):
+        if method not in METHODS:
+            raise Exception("Unsupported reduction method. Expected one of " + str(METHODS) + ", got: " + str(method))
+        if dimension is None and method != 'mindf':
+            raise AttributeError("dimension is required for the " + method + " method.")
+        self.method = method
+        self.dimension = dimension
+        self.minDf = minDf
+        self.chunkSize = chunkSize
+        self.randState = randState
+        self.signed = signed
+        self.columns = None
+        self.projection = None
+        self.documentFrequency = None
+
+    def partialFit(self, matrix):
+        '''
+            Adds the document frequencies of a chunk of rows. Only for
+            'mindf', call finishFit() after the last chunk.
+        '''
+        if self.method != 'mindf':
+            raise Exception("partialFit() is only supported by the mindf method.")
+        matrix = sparse.csr_matrix(matrix)
+        matrix.sum_duplicates()
+        counts = np.bincount(matrix.indices[matrix.data != 0], minlength=matrix.shape[1])
+        self.documentFrequency = counts if self.documentFrequency is None else self.documentFrequency+counts
+        return self
+
+    def finishFit(self):
+        frequency = self.documentFrequency
+        kept = np.nonzero(frequency >= self.minDf)[0]
+        if self.dimension is not None and len(kept) > self.dimension:
+            kept = kept[np.argsort(-frequency[kept], kind='stable')[:self.dimension]]
+        self.columns = np.sort(kept)
+        return self
+
+    def fit(self, matrix, classes=None):
+        '''
+            Fits the reducer on a training matrix. classes are required by
+            'chi2' and 'mi'.
+        '''
+        matrix = sparse.csr_matrix(matrix)
+        if self.method == 'mindf':
+            self.documentFrequency = None
+            for start in range(0, matrix.shape[0], self.chunkSize):
+                self.partialFit(matrix[start:start+self.chunkSize])
+            return self.finishFit()
+
+        if self.method in ('chi2', 'mi'):
+            if classes is None:
+                raise AttributeError("classes are required for the " + self.method + " method.")
+            scores = chi2(matrix, classes)[0] if self.method == 'chi2' else mutualInformation(matrix, classes)
+            scores = np.nan_to_num(scores)
+            dimension = min(self.dimension, matrix.shape[1])
+            self.columns = np.sort(np.argpartition(-scores, dimension-1)[:dimension]) if dimension < matrix.shape[1] else np.arange(matrix.shape[1])
+        elif self.method == 'projection':
+            self.projection = SparseRandomProjection(n_components=self.dimension, dense_output=False, random_state=self.randState).fit(matrix)
+        else:
+            self.projection = self._hashingMatrix(matrix.shape[1])
+        return self
+
+    def _hashingMatrix(self, features:int):
+        # splitmix64 of the column index and the seed picks a bucket and a sign
+        with np.errstate(over='ignore'):
+            x = np.arange(features, dtype=np.uint64) + np.uint64(self.randState & 0xFFFFFFFF) * np.uint64(0x9E3779B97F4A7C15)
+            x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            x = x ^ (x >> np.uint64(31))
+        buckets = (x % np.uint64(self.dimension)).astype(np.int64)
+        signs = np.where((x >> np.uint64(63)) == 1, -1.0, 1.0) if self.signed else np.ones(features)
+        return sparse.csr_matrix((signs, (np.arange(features), buckets)), shape=(features, self.dimension))
+
+    def transform(self, matrix):
+        '''
+            Returns the reduced CSR matrix.
+        '''
+        matrix = sparse.csr_matrix(matrix)
+        if self.columns is not None:
+            return matrix[:, self.columns]
+        if self.method == 'projection':
+            return sparse.csr_matrix(self.projection.transform(matrix))
+        if self.projection is None:
+            raise Exception("The reducer has to be fitted before transform().")
+        return matrix @ self.projection
+
+    def fit_transform(self, matrix, classes=None):
+        return self.fit(matrix, classes).transform(matrix)
+
+    def reduceVocabulary(self, vocabulary):
+        '''
+            Returns the vocabulary of the kept columns, e.g. to save a pipeline
+            with inference.savePipeline(). Only for the selecting methods.
+        '''
+        if self.columns is None:
+            raise Exception("Only the mindf, chi2 and mi methods keep the original columns.")
+        return np.asarray(vocabulary)[self.columns]
+
+def reductionReport(matrix, classes, settings:list, mode:str='svc', testSize:float=0.2, layers:tuple=(8, 4), iterations:int=3200, outPath:str='data/predictions/', termPath:str='reduction/', randState:int=64):
+    '''
+        Fits every reducer setting on the same training split, trains mode on
+        the reduced matrix, and writes the accuracy, dimension and timings of
+        each to outPath/termPath/reduction_<mode>.txt and .json. A run
+        without reduction is included as the baseline. Returns the rows.
+
+        settings: List of (method, dimension) pairs, or (method, dimension,
+                  minDf) for 'mindf', e.g. [('chi2', 1000), ('hashing', 4096)]
+
+        The naive Bayes modes in NONNEGATIVE_MODES can't be fitted on
+        negative values, so for them 'hashing' is unsigned and 'projection'
+        is skipped.
+    '''
+    if not os.path.isdir(outPath+termPath):
+        os.makedirs(outPath+termPath)
+    x_train, x_test, y_train, y_test = train_test_split(sparse.csr_matrix(matrix), np.asarray(classes), test_size=testSize, random_state=randState)
+    rows = []
+    nonNegative = mode in NONNEGATIVE_MODES
+    for setting in [None]+list(settings):
+        if setting is not None and nonNegative and setting[0] == 'projection':
+            print("Skipping %s, its negative values can't be fitted by %s" % (setting[0], mode))
+            continue
+        started = time.perf_counter()
+        if setting is None:
+            train, test = x_train, x_test
+        else:
+            reducer = FeatureReducer(setting[0], setting[1], *setting[2:], randState=randState, signed=not nonNegative).fit(x_train, y_train)
+            train, test = reducer.transform(x_train), reducer.transform(x_test)
+        reduced = time.perf_counter()
+        scaler = StandardScaler(with_mean=False, with_std=mode not in pred.UNSCALED_MODES).fit(train)
+        train, test = scaler.transform(train), scaler.transform(test)
+        model = pred._buildModel(mode, layers, iterations, randState)
+        fitStarted = time.perf_counter()
+        model.fit(train, y_train)
+        fitted = time.perf_counter()
+        accuracy = float((model.predict(test) == y_test).mean())
+        rows.append({'method': 'none' if setting is None else setting[0], 'dimension': train.shape[1], 'nnz': int(train.nnz), 'accuracy': accuracy, 'reduceSeconds': reduced-started, 'fitSeconds': fitted-fitStarted, 'predictSeconds': time.perf_counter()-fitted})
+
+    with open(outPath+termPath+"reduction_"+mode+".txt", "w") as f:
+        f.write("%-12s %10s %12s %9s %10s %10s\n" % ("method", "dimension", "nnz", "accuracy", "reduce s", "fit s"))
+        for row in rows:
+            f.write("%-12s %10i %12i %9.4f %10.3f %10.3f\n" % (row['method'], row['dimension'], row['nnz'], row['accuracy'], row['reduceSeconds'], row['fitSeconds']))
+    with open(outPath+termPath+"reduction_"+mode+".json", "w") as f:
+        json.dump(rows, f, indent=2)
+    return rows
@@ -0,0 +1,152 @@
+import numpy as np
+from collections.abc import Iterable
+'''
+    Splits long sequences into fixed-length, optionally overlapping
+    fragments, and keeps a bounded, class-balanced sample of them.
+
+    Host assemblies are orders of magnitude longer than viral genomes, so
+    instead of one document per record, every record becomes many fragments
+    of the same length. With perClass set, every class keeps a uniform
+    reservoir sample of at most perClass fragments over all its records, so
+    the output size and the memory held by the sample no longer depend on
+    the largest genome or on how unbalanced the classes are. Each record is
+    still read into memory whole while its fragments are offered.
+
+    Fragments are only sliced out of a record once they are sampled. Where
+    each fragment came from is written to a tab separated provenance file,
+    named after the output with PROVENANCE_SUFFIX:
+        record  class  start  end
+'''
+
+PROVENANCE_SUFFIX = ".fragments.tsv"
+
+def fragmentStarts(length:int, fragmentLength:int, overlap:int=0, minLength:int=None):
+    '''
+        Returns the start of every fragment of a sequence of the given length.
+
+        fragmentLength: Length of each fragment
+
+        overlap: Amount of nucleotides consecutive fragments share
+
+        minLength: Shortest trailing fragment that is kept. Defaults to
+                   fragmentLength, which drops the trailing partial fragment,
+                   except that a sequence shorter than fragmentLength is kept
+                   whole as a single fragment, so classes of short records
+                   aren't lost. When given, a sequence shorter than minLength
+                   gives no fragments
+    '''
+    if not 0 <= overlap < fragmentLength:
+        raise AttributeError("overlap should be within [0, fragmentLength). Got: " + str(overlap))
+    if minLength is None:
+        minLength = fragmentLength if length >= fragmentLength else 1
+    starts = np.arange(0, max(length-minLength+1, 0), fragmentLength-overlap)
+    full = starts[starts+fragmentLength <= length]
+    partial = starts[starts+fragmentLength > length]
+    # One shorter trailing fragment is kept, unless the full ones already reach the end
+    if len(partial) and (not len(full) or full[-1]+fragmentLength < length):
+        full = np.append(full, partial[0])
+    return full
+
+def fragmentSequence(sequence:str, fragmentLength:int, overlap:int=0, minLength:int=None):
+    '''
+        Generator over the (start, fragment) pairs of a sequence.
+    '''
+    for start in fragmentStarts(len(sequence), fragmentLength, overlap, minLength):
+        yield int(start), sequence[start:start+fragmentLength]
+
+class FragmentSampler:
+    '''
+        Per-class reservoir sample of the fragments of many records.
+
+        perClass: Maximum amount of fragments kept for each class
+
+        seed: Seed for a reproducible sample
+    '''
+    def __init__(self, fragmentLength:int, overlap:int=0, perClass:int=1000, minLength:int=None, seed:int=64):
+        self.fragmentLength = fragmentLength
+        self.overlap = overlap
+        self.perClass = perClass
+        self.minLength = minLength
+        self.rng = np.random.default_rng(seed)
+        self.seen = {}
+        self.reservoirs = {}
+        self.records = 0
+
+    def add(self, sequence:str, classNo:int, record=None):
+        '''
+            Offers every fragment of a record to the reservoir of its class.
+            record identifies the record in the provenance, and defaults to
+            the amount of records added before it.
+        '''
+        record = self.records if record is None else record
+        self.records += 1
+        starts = fragmentStarts(len(sequence), self.fragmentLength, self.overlap, self.minLength)
+        reservoir = self.reservoirs.setdefault(classNo, [])
+        seen = self.seen.get(classNo, 0)
+        self.seen[classNo] = seen+len(starts)
+
+        fill = min(self.perClass-len(reservoir), len(starts))
+        for start in starts[:fill]:
+            reservoir.append((self.records, int(start), record, sequence[start:start+self.fragmentLength]))
+        if fill == len(starts):
+            return
+        # Algorithm R for the rest: the i-th fragment seen replaces a random
+        # slot with probability perClass/i
+        totals = seen+fill+np.arange(1, len(starts)-fill+1)
+        slots = self.rng.integers(0, totals)
+        for offset in np.nonzero(slots < self.perClass)[0]:
+            start = int(starts[fill+offset])
+            reservoir[slots[offset]] = (self.records, start, record, sequence[start:start+self.fragmentLength])
+
+    def fragments(self):
+        '''
+            Generator over the sampled (fragment, class, record, start), by
+            class and then in the order the records were added.
+        '''
+        for classNo in sorted(self.reservoirs):
+            for _, start, record, fragment in sorted(self.reservoirs[classNo], key=lambda item: item[:2]):
+                yield fragment, classNo, record, start
+
+    def classCounts(self):
+        '''
+            Returns {class: (fragments seen, fragments kept)}.
+        '''
+        return {classNo: (self.seen[classNo], len(self.reservoirs[classNo])) for classNo in sorted(self.reservoirs)}
+
+def fragmentRecords(records:Iterable, fragmentLength:int, overlap:int=0, perClass:int=None, minLength:int=None, seed:int=64, provenancePath:str=None):
+    '''
+        Generator over the (fragment, class) pairs of records.
+
+        records: Iterable of (sequence, class) or (sequence, class, record id)
+
+        perClass: Optional. Maximum amount of fragments kept for each class.
+                  Without it every fragment is yielded as soon as its record
+                  is read, in record order
+
+        provenancePath: Optional path of the provenance file to write
+    '''
+    provenance = None if provenancePath is None else open(provenancePath, "w")
+    try:
+        if provenance is not None:
+            provenance.write("record\tclass\tstart\tend\n")
+        if perClass is None:
+            fragments = (
+                (fragment, classNo, rest[0] if rest else number, start)
+                for number, (sequence, classNo, *rest) in enumerate(records)
+                for start, fragment in fragmentSequence(sequence, fragmentLength, overlap, minLength)
+            )
+        else:
+            sampler = FragmentSampler(fragmentLength, overlap, perClass, minLength, seed)
+            for sequence, classNo, *rest in records:
+                sampler.add(sequence, classNo, rest[0] if rest else None)
+            for classNo, (seen, kept) in sampler.classCounts().items():
+                print("Class %i: %i of %i fragments sampled" % (classNo, kept, seen))
+            fragments = sampler.fragments()
+
+        for fragment, classNo, record, start in fragments:
+            if provenance is not None:
+                provenance.write("%s\t%i\t%i\t%i\n" % (record, classNo, start, start+len(fragment)))
+            yield fragment, classNo
+    finally:
+        if provenance is not None:
+            provenance.close()
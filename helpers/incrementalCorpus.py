@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from scipy import sparse
+from collections.abc import Iterable
+from helpers import kmerCounter as kc
+from helpers import fastaIndex as fa
+from helpers import instrumentation as instr
+from helpers.featureCache import fileHash
+from helpers.termMatcher import TermMatcher
+'''
+    Incrementally updated k-mer count matrix, as an alternative to rerunning
+    getSequences(), combineSequences(), createKmers() and vectorizeData()
+    every time an entry file is added.
+
+    A manifest records the content hash of every entry file processed and
+    the hash of every record taken from it. update() skips files whose hash
+    is unchanged, and within changed files it only counts k-mers for records
+    that aren't in the corpus yet. Records that disappeared from a changed
+    file, or whose file was deleted, are dropped from the index, not from
+    disk. Records are identified within their file, so identical records of
+    different files, or repeated within one, each keep their own row, the
+    same as in the text files of getSequences().
+
+    Everything on disk is append only:
+        <path>/manifest.json    - parameters, files, record hashes, sizes
+        <path>/vocabulary.bin   - int64 n-gram key of every column
+        <path>/rows.bin         - int64 amount of non-zero counts per row
+        <path>/columns.bin      - int32 column of every count
+        <path>/counts.bin       - int32 counts
+        <path>/classes.bin      - int32 class of every row
+
+    New n-grams are appended to the vocabulary, so existing rows keep their
+    column indices and the matrix only grows to the right. Rows are stored in
+    the order they were added, and matrix() orders them by class with a
+    stable argsort of the class vector instead of rewriting anything.
+
+    Sample use:
+        corpus = IncrementalCorpus("data/corpus/", windowSize=3, ngramRange=(1, 4))
+        corpus.update(termClassPairs, inPath="data/entries/")
+        vectorizedData, classes, classCounts, vocabulary = corpus.matrix()
+'''
+
+_FILES = {'vocabulary': np.int64, 'rows': np.int64, 'columns': np.int32, 'counts': np.int32, 'classes': np.int32}
+
+def recordHash(sequence:str, classNo:int, file:str="", occurrence:int=0):
+    '''
+        Returns the hash identifying a record of a class in the corpus.
+        occurrence tells apart identical records within the same file.
+    '''
+    digest = hashlib.sha1(("%s %i %s" % (sequence, classNo, file)).encode()).hexdigest()
+    return digest if not occurrence else "%s-%i" % (digest, occurrence)
+
+class IncrementalCorpus:
+    '''
+        path: Directory the corpus is kept in. Defaults to "data/corpus/"
+
+        windowSize, ngramRange, step: Same as in createKmers() and
+                                      vectorizeData(). They are fixed when the
+                                      corpus is created
+    '''
+    def __init__(self, path:str="data/corpus/", windowSize:int=3, ngramRange:tuple=(1,4), step:int=1):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.manifestFile = path+"manifest.json"
+        params = {'windowSize': windowSize, 'ngramRange': list(ngramRange), 'step': step}
+        if os.path.isfile(self.manifestFile):
+            with open(self.manifestFile) as f:
+                self.manifest = json.load(f)
+            if self.manifest['params'] != params:
+                raise Exception("The corpus in " + path + " was created with " + str(self.manifest['params']) + ", got: " + str(params))
+        else:
+            if not kc._packable(windowSize, tuple(ngramRange)):
+                raise Exception("windowSize and ngramRange are too large for packed n-gram keys. Got: " + str(params))
+            self.manifest = {'params': params, 'files': {}, 'records': {}, 'removed': [], 'sizes': {name: 0 for name in _FILES}}
+        self.windowSize = windowSize
+        self.ngramRange = tuple(ngramRange)
+        self.step = step
+        self._truncate()
+        vocabulary = self._read('vocabulary')
+        self.vocabularySize = len(vocabulary)
+        self._order = np.argsort(vocabulary, kind='stable')
+        self._sortedVocabulary = vocabulary[self._order]
+
+    def _file(self, name:str):
+        return self.path+name+".bin"
+
+    def _read(self, name:str):
+        if not os.path.isfile(self._file(name)):
+            return np.zeros(0, dtype=_FILES[name])
+        return np.fromfile(self._file(name), dtype=_FILES[name], count=self.manifest['sizes'][name])
+
+    def _truncate(self):
+        # Drops anything written after the last saved manifest, e.g. by an
+        # update that was interrupted
+        for name, dtype in _FILES.items():
+            size = self.manifest['sizes'][name]*np.dtype(dtype).itemsize
+            if os.path.isfile(self._file(name)) and os.path.getsize(self._file(name)) > size:
+                with open(self._file(name), 'r+b') as f:
+                    f.truncate(size)
+
+    def _columns(self, keys:np.ndarray):
+        '''
+            Returns the column of every key, adding unseen keys to the end of
+            the vocabulary.
+        '''
+        positions = np.searchsorted(self._sortedVocabulary, keys)
+        known = positions < len(self._sortedVocabulary)
+        known[known] = self._sortedVocabulary[positions[known]] == keys[known]
+        columns = np.empty(len(keys), dtype=np.int64)
+        columns[known] = self._order[positions[known]]
+        newKeys = keys[~known]
+        if len(newKeys):
+            columns[~known] = np.arange(self.vocabularySize, self.vocabularySize+len(newKeys))
+            self._pending['vocabulary'].append(newKeys)
+            self.vocabularySize += len(newKeys)
+            # Keys arrive unique and sorted from np.unique, merge them in
+            insertAt = np.searchsorted(self._sortedVocabulary, newKeys)
+            self._sortedVocabulary = np.insert(self._sortedVocabulary, insertAt, newKeys)
+            self._order = np.insert(self._order, insertAt, columns[~known])
+        return columns
+
+    def _addRecord(self, sequence:str, classNo:int):
+        codes, valid = kc.kmerCodes(kc.encodeSequence(sequence), self.windowSize, self.step)
+        keys, counts = np.unique(kc.ngramKeys(codes, valid, self.windowSize, self.ngramRange), return_counts=True)
+        columns = self._columns(keys)
+        order = np.argsort(columns)
+        self._pending['columns'].append(columns[order].astype(np.int32))
+        self._pending['counts'].append(counts[order].astype(np.int32))
+        self._pending['rows'].append(np.array([len(keys)], dtype=np.int64))
+        self._pending['classes'].append(np.array([classNo], dtype=np.int32))
+
+    @instr.timed('kmer')
+    def update(self, termClassPairs:Iterable, inPath:str="data/entries/", fileName=None, datatype:str="fasta"):
+        '''
+            Adds the records of new or changed entry files to the corpus.
+            Terms are matched against the descriptions like getSequences()
+            does. Returns the amount of files skipped, processed and deleted
+            and the amount of records added, kept and removed.
+
+            fileName: Optional file name or list of file names within inPath.
+                      Defaults to every file in inPath, in which case the
+                      records of files no longer in inPath are removed
+
+            Entry files can be plain, gzip or BGZF compressed, the same as
+            for getSequences().
+        '''
+        termClassPairs = list(termClassPairs)
+        matcher = TermMatcher(term for term, _ in termClassPairs)
+        if fileName is None:
+            files = [file for file in sorted(os.listdir(inPath)) if os.path.isfile(inPath+file) and not fa.isSidecar(file)]
+        else:
+            files = [fileName] if type(fileName) is str else fileName
+        stats = {'skipped': 0, 'processed': 0, 'deleted': 0, 'added': 0, 'kept': 0, 'removed': 0}
+        started = time.perf_counter()
+        self._pending = {name: [] for name in _FILES}
+        records = self.manifest['records']
+        removed = set(self.manifest['removed'])
+        rows = self.manifest['sizes']['classes']
+
+        for file in files:
+            digest = fileHash(inPath+file)
+            previous = self.manifest['files'].get(file)
+            if previous is not None and previous['hash'] == digest:
+                stats['skipped'] += 1
+                continue
+            stats['processed'] += 1
+            hashes = []
+            occurrences = {}
+            for item in fa.parseFile(inPath+file, datatype):
+                matches = matcher.match(item.description)
+                if not matches:
+                    continue
+                sequence = str(item.seq).lower()
+                for position in matches:
+                    classNo = termClassPairs[position][1]
+                    digestOfRecord = recordHash(sequence, classNo, file)
+                    occurrences[digestOfRecord] = occurrences.get(digestOfRecord, -1)+1
+                    digestOfRecord = recordHash(sequence, classNo, file, occurrences[digestOfRecord])
+                    hashes.append(digestOfRecord)
+                    if digestOfRecord in records and records[digestOfRecord] not in removed:
+                        stats['kept'] += 1
+                        continue
+                    records[digestOfRecord] = rows
+                    self._addRecord(sequence, classNo)
+                    rows += 1
+                    stats['added'] += 1
+
+            if previous is not None:
+                # Records only the old version of the file had leave the index
+                for digestOfRecord in set(previous['records'])-set(hashes):
+                    removed.add(records[digestOfRecord])
+                    stats['removed'] += 1
+            self.manifest['files'][file] = {'hash': digest, 'records': hashes}
+
+        if fileName is None:
+            for file in sorted(set(self.manifest['files'])-set(files)):
+                stats['deleted'] += 1
+                for digestOfRecord in set(self.manifest['files'].pop(file)['records']):
+                    removed.add(records[digestOfRecord])
+                    stats['removed'] += 1
+
+        for name, parts in self._pending.items():
+            if parts:
+                values = np.concatenate(parts).astype(_FILES[name])
+                with open(self._file(name), 'ab') as f:
+                    values.tofile(f)
+                self.manifest['sizes'][name] += len(values)
+        self.manifest['removed'] = sorted(removed)
+        with open(self.manifestFile+".tmp", "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(self.manifestFile+".tmp", self.manifestFile)
+        del self._pending
+
+        elapsed = max(time.perf_counter()-started, 1e-9)
+        print("%i files skipped, %i processed, %i deleted in %.2fs: %i records added, %i kept, %i removed" % (stats['skipped'], stats['processed'], stats['deleted'], elapsed, stats['added'], stats['kept'], stats['removed']))
+        return stats
+
+    def index(self):
+        '''
+            Returns the rows currently in the corpus, ordered by class and then
+            by the order they were added in.
+        '''
+        classes = self._read('classes')
+        rows = np.arange(len(classes))
+        if self.manifest['removed']:
+            rows = np.delete(rows, self.manifest['removed'])
+        return rows[np.argsort(classes[rows], kind='stable')]
+
+    def matrix(self):
+        '''
+            Returns the count matrix ordered by class, the class of every row,
+            the amount of rows of each class and the feature name of every
+            column, in the same form as cachedVectorize(). Unlike there, the
+            columns are in the order their n-grams were first added instead
+            of sorted. The names can be passed on as the vocabulary of a
+            'kvec' pipeline, e.g. to inference.savePipeline().
+        '''
+        nnz = self._read('rows')
+        indptr = np.zeros(len(nnz)+1, dtype=np.int64)
+        np.cumsum(nnz, out=indptr[1:])
+        keys = self._read('vocabulary')
+        matrix = sparse.csr_matrix((self._read('counts'), self._read('columns'), indptr), shape=(len(nnz), len(keys)))
+        rows = self.index()
+        classes = self._read('classes')[rows]
+        _, classCounts = np.unique(classes, return_counts=True)
+        return matrix[rows], classes, classCounts.tolist(), kc.kmerFeatureNames(keys, self.windowSize, self.ngramRange)
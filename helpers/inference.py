@@ -0,0 +1,281 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import joblib
+import numpy as np
+from collections import deque
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+from helpers import kmerCounter as kc
+from helpers.sequenceFetch import kmerDocument
+'''
+    Persistence of fitted pipelines and a local inference service.
+
+    savePipeline() writes a new version of a pipeline (vectorizer, scaler,
+    model) to its own directory:
+        <path>/<version>/meta.json       - vectorizer parameters, class names
+        <path>/<version>/vocabulary.npy  - feature names, or k-mer keys for 'kvec'
+        <path>/<version>/scale.npy       - StandardScaler.scale_
+        <path>/<version>/model.joblib    - the fitted model
+
+    Arrays are loaded memory mapped, so loading doesn't depend on the size of
+    the vocabulary for 'kvec' pipelines.
+
+    The service is started with:
+        python -m helpers.inference data/models/ --port 8080
+
+    and answers:
+        POST /predict   {"sequences": ["acgt...", ...]}
+        GET  /metrics
+'''
+
+def savePipeline(path:str, vectorizer:dict, scaler, model, classNames=None):
+    '''
+        Saves a fitted pipeline as a new version within path and returns the
+        directory it was written to.
+
+        vectorizer: Dict with the 'mode', 'ngramRange', 'windowSize', 'step'
+                    and 'vocabulary' the training data was vectorized with.
+                    Only the counting modes 'cvec' and 'kvec' are supported
+
+        scaler: The fitted StandardScaler(with_mean=False), or None if the
+                model was fitted on unscaled counts
+
+        model: The fitted model
+
+        classNames: Optional names of the classes, in the order of
+                    model.classes_, the same as predictionFunction() takes
+    '''
+    mode = vectorizer['mode']
+    if mode not in ('cvec', 'kvec'):
+        raise Exception("Unsupported vectorizer mode for saving. Expected 'cvec' or 'kvec', got:" + mode)
+    if not vectorizer.get('windowSize'):
+        raise AttributeError("The windowSize the k-mers were created with is required to vectorize new sequences.")
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    versions = [int(name) for name in os.listdir(path) if name.isdigit()]
+    version = max(versions, default=0)+1
+    versionPath = os.path.join(path, str(version))+"/"
+    os.makedirs(versionPath)
+
+    ngramRange = tuple(vectorizer['ngramRange'])
+    if mode == 'kvec':
+        vocabulary = kc.kmerFeatureKeys(vectorizer['vocabulary'], vectorizer['windowSize'], ngramRange)
+    else:
+        vocabulary = np.asarray(vectorizer['vocabulary'], dtype=str)
+    np.save(versionPath+"vocabulary.npy", vocabulary)
+    scale = None if scaler is None else scaler.scale_
+    np.save(versionPath+"scale.npy", np.asarray(scale if scale is not None else np.ones(len(vocabulary))))
+    joblib.dump(model, versionPath+"model.joblib")
+
+    meta = {'version': version, 'created': time.time(), 'mode': mode, 'ngramRange': list(ngramRange), 'windowSize': vectorizer['windowSize'], 'step': vectorizer.get('step', 1), 'classNames': None if classNames is None else list(classNames)}
+    with open(versionPath+"meta.json", "w") as f:
+        json.dump(meta, f)
+    print("Saved pipeline version %i to %s" % (version, versionPath))
+    return versionPath
+
+def loadPipeline(path:str, version:int=None):
+    '''
+        Loads a pipeline saved by savePipeline(). Defaults to the latest
+        version within path.
+    '''
+    if version is None:
+        versions = [int(name) for name in os.listdir(path) if name.isdigit()]
+        if not versions:
+            raise Exception("No saved pipelines were found in " + path)
+        version = max(versions)
+    return Pipeline(os.path.join(path, str(version))+"/")
+
+class Pipeline:
+    '''
+        A loaded pipeline. Use predict() on raw sequences.
+    '''
+    def __init__(self, versionPath:str):
+        with open(versionPath+"meta.json") as f:
+            self.meta = json.load(f)
+        self.version = self.meta['version']
+        self.classNames = self.meta['classNames']
+        self.ngramRange = tuple(self.meta['ngramRange'])
+        self.vocabulary = np.load(versionPath+"vocabulary.npy", mmap_mode='r')
+        self.inverseScale = sparse.diags(1/np.load(versionPath+"scale.npy"))
+        self.model = joblib.load(versionPath+"model.joblib", mmap_mode='r')
+        self.vectorizer = None
+        if self.meta['mode'] == 'cvec':
+            self.vectorizer = CountVectorizer(ngram_range=self.ngramRange, vocabulary={name: column for column, name in enumerate(self.vocabulary.tolist())})
+
+    def vectorize(self, sequences):
+        '''
+            Returns the scaled feature matrix of raw sequences.
+        '''
+        sequences = [sequence.lower() for sequence in sequences]
+        if self.vectorizer is not None:
+            counts = self.vectorizer.transform([kmerDocument(sequence, self.meta['windowSize'], self.meta['step']) for sequence in sequences])
+        else:
+            counts = kc.transformKmers(sequences, np.asarray(self.vocabulary), self.meta['windowSize'], self.ngramRange, self.meta['step'])
+        return sparse.csr_matrix(counts @ self.inverseScale)
+
+    def predict(self, sequences):
+        '''
+            Returns the predicted class of every sequence in one call to the
+            model.
+        '''
+        if not len(sequences):
+            return np.zeros(0, dtype=int)
+        return self.model.predict(self.vectorize(sequences))
+
+    def namesOf(self, predictions):
+        '''
+            Returns the class name of every predicted label, or None if the
+            pipeline was saved without class names. Names are looked up by
+            the position of the label within model.classes_, since labels
+            don't have to start at 0.
+        '''
+        if not self.classNames:
+            return None
+        positions = {label: position for position, label in enumerate(self.model.classes_.tolist())}
+        names = []
+        for prediction in predictions:
+            position = positions.get(prediction)
+            names.append(self.classNames[position] if position is not None and position < len(self.classNames) else None)
+        return names
+
+class MicroBatcher:
+    '''
+        Collects concurrent predict requests into a single call to
+        Pipeline.predict().
+
+        maxBatchSize: Maximum amount of sequences predicted at once
+
+        maxWait: Maximum amount of seconds the first request of a batch waits
+                 for more requests to arrive
+
+        latencyWindow: Amount of most recent requests the latency percentiles
+                       are computed over
+    '''
+    def __init__(self, pipeline:Pipeline, maxBatchSize:int=64, maxWait:float=0.01, latencyWindow:int=10000):
+        self.pipeline = pipeline
+        self.maxBatchSize = maxBatchSize
+        self.maxWait = maxWait
+        self.queue = asyncio.Queue()
+        self.latencies = deque(maxlen=latencyWindow)
+        self.requests = 0
+        self.batches = 0
+        self.sequences = 0
+
+    async def predict(self, sequences:list):
+        future = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        await self.queue.put((sequences, future))
+        result = await future
+        self.latencies.append(time.perf_counter()-started)
+        self.requests += 1
+        return result
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time()+self.maxWait
+            while size < self.maxBatchSize:
+                timeout = deadline-loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            sequences = [sequence for request, _ in batch for sequence in request]
+            try:
+                predictions = await loop.run_in_executor(None, self.pipeline.predict, sequences)
+            except Exception as error:
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+            self.batches += 1
+            self.sequences += len(sequences)
+            offset = 0
+            for request, future in batch:
+                future.set_result(predictions[offset:offset+len(request)].tolist())
+                offset += len(request)
+
+    def metrics(self):
+        latencies = np.array(self.latencies)*1000
+        percentiles = {'p50': None, 'p90': None, 'p99': None}
+        if len(latencies):
+            percentiles = dict(zip(percentiles, np.percentile(latencies, [50, 90, 99]).tolist()))
+        return {'version': self.pipeline.version, 'requests': self.requests, 'batches': self.batches, 'sequences': self.sequences, 'meanBatchSize': self.sequences/self.batches if self.batches else 0, 'maxBatchSize': self.maxBatchSize, 'maxWait': self.maxWait, 'latencyMs': percentiles}
+
+async def _respond(writer, status:str, body:dict):
+    payload = json.dumps(body).encode()
+    writer.write(("HTTP/1.1 %s\r\nContent-Type: application/json\r\nContent-Length: %i\r\nConnection: close\r\n\r\n" % (status, len(payload))).encode()+payload)
+    await writer.drain()
+    writer.close()
+
+async def _handle(batcher:MicroBatcher, reader, writer):
+    try:
+        method, target, _ = (await reader.readline()).decode().split(' ', 2)
+        length = 0
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        body = await reader.readexactly(length) if length else b''
+    except (ValueError, asyncio.IncompleteReadError):
+        await _respond(writer, "400 Bad Request", {'error': "Malformed request"})
+        return
+
+    if method == 'GET' and target == '/metrics':
+        await _respond(writer, "200 OK", batcher.metrics())
+    elif method == 'POST' and target == '/predict':
+        try:
+            sequences = json.loads(body)['sequences']
+        except (ValueError, KeyError, TypeError):
+            await _respond(writer, "400 Bad Request", {'error': "Expected a JSON body with a list of sequences"})
+            return
+        try:
+            predictions = await batcher.predict(sequences)
+        except Exception as error:
+            await _respond(writer, "500 Internal Server Error", {'error': str(error)})
+            return
+        result = {'predictions': predictions}
+        names = batcher.pipeline.namesOf(predictions)
+        if names is not None:
+            result['classNames'] = names
+        await _respond(writer, "200 OK", result)
+    else:
+        await _respond(writer, "404 Not Found", {'error': "Unknown endpoint"})
+
+async def serve(path:str, host:str="127.0.0.1", port:int=8080, maxBatchSize:int=64, maxWait:float=0.01, version:int=None):
+    '''
+        Loads the pipeline saved in path and serves it until cancelled.
+    '''
+    batcher = MicroBatcher(loadPipeline(path, version), maxBatchSize, maxWait)
+    worker = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(lambda reader, writer: _handle(batcher, reader, writer), host, port)
+    print("Serving pipeline version %i on http://%s:%i" % (batcher.pipeline.version, host, port))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        worker.cancel()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local micro-batching inference service for saved pipelines.")
+    parser.add_argument('path', help="Directory the pipeline was saved to")
+    parser.add_argument('--version', type=int, default=None)
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait', type=float, default=0.01, help="Seconds")
+    args = parser.parse_args()
+    asyncio.run(serve(args.path, args.host, args.port, args.max_batch_size, args.max_wait, args.version))
@@ -0,0 +1,185 @@
+import cProfile
+import itertools
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from functools import wraps
+'''
+    Stage level instrumentation for the pipeline. It is off by default and
+    costs nothing until enable() is called.
+
+    Every stage (fetch, parse, combine, kmer, vectorize, scale, fit, predict)
+    records its wall time, CPU time and the process' peak RSS, plus whatever
+    details the stage adds, such as matrix shape and nnz. predictionFunction()
+    writes the records of each call as JSON next to its report, and
+    writeRunSummary() writes the totals of the whole run.
+
+    Sample use:
+        instrumentation.enable(profileStage='fit')
+        ...
+        instrumentation.writeRunSummary("data/predictions/run_summary.json")
+
+    A single named stage can be profiled with cProfile, or with pyinstrument's
+    sampling profiler if it is installed.
+'''
+
+# Never reset, so profiles of a process get distinct names across enable() calls
+_profileNumbers = itertools.count()
+
+_state = {'enabled': False, 'profileStage': None, 'profiler': 'cprofile', 'profilePath': "data/profiles/", 'records': [], 'started': None}
+
+def enable(profileStage:str=None, profiler:str='cprofile', profilePath:str="data/profiles/"):
+    '''
+        Switches instrumentation on and clears previous records.
+
+        profileStage: Optional name of a stage to profile every time it runs
+
+        profiler: 'cprofile' or 'pyinstrument'. Defaults to 'cprofile'
+
+        profilePath: Directory profiles are written to. Defaults to
+                     "data/profiles/"
+    '''
+    if profiler not in ('cprofile', 'pyinstrument'):
+        raise Exception("Unsupported profiler. Expected 'cprofile' or 'pyinstrument', got:" + profiler)
+    _state.update(enabled=True, profileStage=profileStage, profiler=profiler, profilePath=profilePath, records=[], started=time.time())
+
+def disable():
+    _state['enabled'] = False
+
+def isEnabled():
+    return _state['enabled']
+
+def config():
+    '''
+        Returns the keyword arguments enable() was called with, e.g. to
+        enable instrumentation the same way in worker processes, or None
+        while instrumentation is off.
+    '''
+    if not _state['enabled']:
+        return None
+    return {'profileStage': _state['profileStage'], 'profiler': _state['profiler'], 'profilePath': _state['profilePath']}
+
+def records(start:int=0):
+    '''
+        Returns the records collected so far, starting from index start.
+    '''
+    return _state['records'][start:]
+
+def _peakRss():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak*1024
+
+@contextmanager
+def stage(name:str, **info):
+    '''
+        Records a stage. Yields a dict the stage can add details to, which
+        ends up in its record. Does nothing while instrumentation is off.
+    '''
+    if not _state['enabled']:
+        yield info
+        return
+
+    profiler = None
+    if name == _state['profileStage']:
+        profiler = _startProfiler()
+    peakBefore = _peakRss()
+    started = time.perf_counter()
+    cpuStarted = time.process_time()
+    try:
+        yield info
+    finally:
+        record = {'stage': name, 'wallSeconds': time.perf_counter()-started, 'cpuSeconds': time.process_time()-cpuStarted}
+        if profiler is not None:
+            record['profile'] = _stopProfiler(profiler, name, info.get('mode'))
+        peak = _peakRss()
+        record.update(peakRssBytes=peak, peakRssIncreaseBytes=peak-peakBefore, **info)
+        _state['records'].append(record)
+
+def timed(name:str):
+    '''
+        Decorator recording every call of a function as a stage.
+    '''
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name, function=function.__name__):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def addRecords(stageRecords:list):
+    '''
+        Adds records collected elsewhere, e.g. in a worker process.
+    '''
+    if _state['enabled']:
+        _state['records'].extend(stageRecords)
+
+def matrixInfo(matrix, vocabularySize:int=None):
+    '''
+        Returns the shape, nnz and vocabulary size of a feature matrix for
+        adding to a stage.
+    '''
+    info = {'shape': list(matrix.shape), 'nnz': int(matrix.nnz) if hasattr(matrix, 'nnz') else int(matrix.size)}
+    info['vocabularySize'] = matrix.shape[1] if vocabularySize is None else vocabularySize
+    return info
+
+def writeMetrics(path:str, stageRecords:list, **extra):
+    '''
+        Writes stage records, and any extra fields, as JSON.
+    '''
+    with open(path, "w") as f:
+        json.dump(dict(extra, stages=stageRecords), f, indent=2)
+
+def runSummary():
+    '''
+        Returns the totals per stage name over everything recorded since
+        enable(), along with every record.
+    '''
+    totals = {}
+    for record in _state['records']:
+        total = totals.setdefault(record['stage'], {'count': 0, 'wallSeconds': 0.0, 'cpuSeconds': 0.0, 'peakRssBytes': 0})
+        total['count'] += 1
+        total['wallSeconds'] += record['wallSeconds']
+        total['cpuSeconds'] += record['cpuSeconds']
+        total['peakRssBytes'] = max(total['peakRssBytes'], record['peakRssBytes'])
+    return {'started': _state['started'], 'finished': time.time(), 'peakRssBytes': _peakRss(), 'totals': totals, 'stages': _state['records']}
+
+def writeRunSummary(path:str="data/predictions/run_summary.json"):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, "w") as f:
+        json.dump(runSummary(), f, indent=2)
+
+def _startProfiler():
+    if _state['profiler'] == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise Exception("pyinstrument is required for the 'pyinstrument' profiler. Install it, or use 'cprofile'.")
+        profiler = Profiler()
+        profiler.start()
+        return profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def _stopProfiler(profiler, name:str, mode:str=None):
+    # Worker processes may create the directory at the same time
+    os.makedirs(_state['profilePath'], exist_ok=True)
+    # Worker processes number their profiles separately, the pid keeps them apart
+    path = _state['profilePath']+"%s_%s%i_%i" % (name, "" if mode is None else mode+"_", os.getpid(), next(_profileNumbers))
+    if _state['profiler'] == 'pyinstrument':
+        profiler.stop()
+        path += ".html"
+        with open(path, "w") as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        path += ".prof"
+        profiler.dump_stats(path)
+    return path
@@ -0,0 +1,233 @@
+import numpy as np
+from scipy import sparse
+from collections.abc import Iterable
+'''
+    Integer-encoded k-mer counting. Every nucleotide is 2-bit encoded
+    (a=0, c=1, g=2, t=3), k-mers become integers computed over the whole
+    sequence at once, and n-grams of consecutive k-mers are packed into a
+    single sortable key. The result is a scipy.sparse CSR matrix with the
+    same columns, in the same order, as CountVectorizer would produce from
+    the output of createKmers() using the same window, step and ngram range.
+
+    The encoding is alphabetical, so sorting keys numerically sorts the
+    features the same way CountVectorizer sorts its vocabulary.
+
+    Differences to the text path worth knowing about:
+        - k-mers containing anything other than a, c, g or t are dropped,
+          together with every n-gram that contains them
+        - a windowSize of 1 is supported, whereas CountVectorizer ignores
+          single character tokens
+'''
+
+_LOOKUP = np.full(256, -1, dtype=np.int8)
+for _code, _base in enumerate(b'acgt'):
+    _LOOKUP[_base] = _code
+    _LOOKUP[ord(chr(_base).upper())] = _code
+
+_BASES = np.array(list('acgt'))
+
+def encodeSequence(sequence):
+    '''
+        Returns a NumPy int8 array with the 2-bit code of every nucleotide.
+        Ambiguous bases are encoded as -1.
+
+        sequence: str or bytes of nucleotides, upper or lower case. Arrays that
+                  are already encoded, e.g. from SequenceStore.encoded(), are
+                  returned as they are
+    '''
+    if isinstance(sequence, np.ndarray):
+        return sequence
+    if isinstance(sequence, str):
+        sequence = sequence.encode('ascii', 'replace')
+    return _LOOKUP[np.frombuffer(sequence, dtype=np.uint8)]
+
+def kmerCodes(encoded:np.ndarray, windowSize:int, step:int=1):
+    '''
+        Returns the integer code of every k-mer in an encoded sequence and a
+        boolean mask of which of them only contain valid nucleotides.
+
+        encoded: Output of encodeSequence()
+
+        windowSize: Length of each k-mer, at most 31
+
+        step: Distance between the starting positions of two k-mers
+    '''
+    if windowSize > 31:
+        raise Exception("windowSize should be at most 31 for integer encoded k-mers. Got: " + str(windowSize))
+    starts = np.arange(0, len(encoded)-windowSize+1, step)
+    codes = np.zeros(len(starts), dtype=np.int64)
+    valid = np.ones(len(starts), dtype=bool)
+    for offset in range(windowSize):
+        bases = encoded[starts+offset]
+        valid &= bases >= 0
+        codes = (codes << 2) | (bases.astype(np.int64) & 3)
+    return codes, valid
+
+def _slotBits(windowSize:int):
+    # Every n-gram slot holds a k-mer code shifted up by one, so that 0 can
+    # mark an empty slot and shorter n-grams sort before their extensions.
+    return 2*windowSize+1
+
+def _packable(windowSize:int, ngramRange:tuple):
+    return _slotBits(windowSize)*ngramRange[1] <= 63
+
+def ngramKeys(codes:np.ndarray, valid:np.ndarray, windowSize:int, ngramRange:tuple=(1,1)):
+    '''
+        Returns the key of every n-gram of consecutive k-mers in a sequence.
+        Keys are int64 when they fit, otherwise rows of a 2D array with one
+        k-mer per column, padded with -1.
+
+        codes, valid: Output of kmerCodes()
+
+        windowSize: Length of each k-mer
+
+        ngramRange: Inclusive (min, max) number of k-mers per n-gram
+    '''
+    minN, maxN = ngramRange
+    packed = _packable(windowSize, ngramRange)
+    bits = _slotBits(windowSize)
+    keys = []
+    for n in range(minN, maxN+1):
+        count = len(codes)-n+1
+        if count <= 0:
+            continue
+        ngramValid = np.ones(count, dtype=bool)
+        for offset in range(n):
+            ngramValid &= valid[offset:offset+count]
+        if packed:
+            key = np.zeros(count, dtype=np.int64)
+            for offset in range(maxN):
+                key <<= bits
+                if offset < n:
+                    key |= codes[offset:offset+count]+1
+            keys.append(key[ngramValid])
+        else:
+            key = np.full((count, maxN), -1, dtype=np.int64)
+            for offset in range(n):
+                key[:, offset] = codes[offset:offset+count]
+            keys.append(key[ngramValid])
+    if not keys:
+        return np.zeros(0, dtype=np.int64) if packed else np.zeros((0, maxN), dtype=np.int64)
+    return np.concatenate(keys)
+
+def countKmers(sequences:Iterable[str], windowSize:int, ngramRange:tuple=(1,1), step:int=1):
+    '''
+        Returns a CSR matrix of n-gram counts with one row per sequence, and
+        the sorted array of keys matching its columns.
+
+        sequences: Raw nucleotide sequences, e.g. from getSequences(mode='s')
+
+        windowSize: Length of each k-mer, same as in createKmers()
+
+        ngramRange: Same as the ngramRange of vectorizeData()
+
+        step: Same as the step of createKmers()
+    '''
+    packed = _packable(windowSize, ngramRange)
+    rowKeys = []
+    rowCounts = []
+    for sequence in sequences:
+        codes, valid = kmerCodes(encodeSequence(sequence), windowSize, step)
+        keys, counts = np.unique(ngramKeys(codes, valid, windowSize, ngramRange), return_counts=True, axis=None if packed else 0)
+        rowKeys.append(keys)
+        rowCounts.append(counts)
+
+    lengths = np.array([len(counts) for counts in rowCounts], dtype=np.int64)
+    indptr = np.zeros(len(rowCounts)+1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    if indptr[-1] == 0:
+        raise Exception("No k-mers were found. Check windowSize and the contents of the sequences.")
+
+    vocabulary, columns = np.unique(np.concatenate(rowKeys), return_inverse=True, axis=None if packed else 0)
+    matrix = sparse.csr_matrix((np.concatenate(rowCounts), columns.ravel(), indptr), shape=(len(rowCounts), len(vocabulary)))
+    matrix.sort_indices()
+    return matrix, vocabulary
+
+def kmerFeatureNames(vocabulary:np.ndarray, windowSize:int, ngramRange:tuple=(1,1)):
+    '''
+        Decodes the keys returned by countKmers() into the space separated
+        n-gram strings CountVectorizer uses as feature names.
+    '''
+    maxN = ngramRange[1]
+    if vocabulary.ndim == 1:
+        bits = _slotBits(windowSize)
+        slots = np.empty((len(vocabulary), maxN), dtype=np.int64)
+        for offset in range(maxN):
+            shift = bits*(maxN-offset-1)
+            slots[:, offset] = ((vocabulary >> shift) & ((1 << bits)-1))-1
+    else:
+        slots = vocabulary
+
+    names = []
+    for row in slots:
+        kmers = []
+        for code in row:
+            if code < 0:
+                break
+            kmers.append(''.join(_BASES[(int(code) >> 2*(windowSize-position-1)) & 3] for position in range(windowSize)))
+        names.append(' '.join(kmers))
+    return np.array(names, dtype=object)
+
+def kmerFeatureKeys(names:Iterable[str], windowSize:int, ngramRange:tuple=(1,1)):
+    '''
+        Inverse of kmerFeatureNames(). Names containing anything other than
+        a, c, g or t can't be encoded and are given the key -1 (or a row of
+        -2 when the keys don't fit in an int64), which never matches.
+    '''
+    maxN = ngramRange[1]
+    packed = _packable(windowSize, ngramRange)
+    bits = _slotBits(windowSize)
+    names = list(names)
+    keys = np.zeros(len(names), dtype=np.int64) if packed else np.full((len(names), maxN), -1, dtype=np.int64)
+    for row, name in enumerate(names):
+        codes = []
+        for kmer in name.split():
+            encoded = encodeSequence(kmer)
+            if len(encoded) != windowSize or (encoded < 0).any():
+                codes = None
+                break
+            codes.append(int(kmerCodes(encoded, windowSize)[0][0]))
+        if packed:
+            keys[row] = -1 if codes is None else sum((code+1) << bits*(maxN-offset-1) for offset, code in enumerate(codes))
+        elif codes is None:
+            keys[row] = -2
+        else:
+            keys[row, :len(codes)] = codes
+    return keys
+
+def transformKmers(sequences:Iterable[str], vocabulary:np.ndarray, windowSize:int, ngramRange:tuple=(1,1), step:int=1):
+    '''
+        Returns a CSR matrix of n-gram counts over a fixed vocabulary, such as
+        the one returned by countKmers(). N-grams outside of the vocabulary
+        are ignored, the same as CountVectorizer.transform() does.
+    '''
+    packed = vocabulary.ndim == 1
+    if packed:
+        order = np.argsort(vocabulary, kind='stable')
+        sortedKeys = vocabulary[order]
+    else:
+        lookup = {tuple(row): column for column, row in enumerate(vocabulary.tolist())}
+
+    rowColumns = []
+    rowCounts = []
+    for sequence in sequences:
+        codes, valid = kmerCodes(encodeSequence(sequence), windowSize, step)
+        keys, counts = np.unique(ngramKeys(codes, valid, windowSize, ngramRange), return_counts=True, axis=None if packed else 0)
+        if packed:
+            positions = np.minimum(np.searchsorted(sortedKeys, keys), max(len(sortedKeys)-1, 0))
+            known = sortedKeys[positions] == keys if len(sortedKeys) else np.zeros(len(keys), dtype=bool)
+            columns = order[positions[known]]
+        else:
+            columns = np.array([lookup.get(tuple(row), -1) for row in keys.tolist()], dtype=np.int64)
+            known = columns >= 0
+            columns = columns[known]
+        rowColumns.append(columns)
+        rowCounts.append(counts[known])
+
+    indptr = np.zeros(len(rowCounts)+1, dtype=np.int64)
+    np.cumsum([len(counts) for counts in rowCounts], out=indptr[1:])
+    data = np.concatenate(rowCounts) if rowCounts else np.zeros(0, dtype=np.int64)
+    indices = np.concatenate(rowColumns) if rowColumns else np.zeros(0, dtype=np.int64)
+    matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(rowCounts), len(vocabulary)))
+    matrix.sort_indices()
+    return matrix
@@ -0,0 +1,234 @@
+import os
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.neural_network import MLPClassifier
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import precision_recall_fscore_support
+from helpers import instrumentation as instr
+'''
+    Out-of-core training for k-mer files larger than memory, used by the
+    'ooc' mode of predictionFunction().
+
+    K-mers are hashed into a fixed feature space with a HashingVectorizer,
+    so no vocabulary has to be fitted first, and batches are streamed from the
+    k-mer file into estimators that support partial_fit. Since createKmers()
+    sorts its output by class, every class is read through its own file
+    handle and each batch takes records from all classes in proportion to how
+    many each has left. Memory use depends on batchSize and nFeatures only.
+
+    Records are held out for testing by hashing their position within their
+    class, so the split is the same on every pass without storing it.
+'''
+
+ESTIMATORS = ('sgd', 'nb', 'mlp')
+
+def _classSegments(path:str):
+    '''
+        Returns {class: [(byte offset, record count), ...]} with one segment
+        for every run of consecutive records of a class.
+    '''
+    segments = {}
+    with open(path, 'rb') as f:
+        f.readline()
+        previous = None
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            classNo = int(line.rsplit(b',', 1)[1])
+            if classNo != previous:
+                segments.setdefault(classNo, []).append([offset, 0])
+                previous = classNo
+            segments[classNo][-1][1] += 1
+    return segments
+
+class _ClassReader:
+    def __init__(self, path:str, segments:list):
+        self.file = open(path, 'rb')
+        self.segments = list(segments)
+        self.remaining = sum(count for _, count in segments)
+        self.read = 0
+        self.segmentLeft = 0
+
+    def take(self, amount:int):
+        documents = []
+        while amount and self.remaining:
+            if not self.segmentLeft:
+                offset, self.segmentLeft = self.segments.pop(0)
+                self.file.seek(offset)
+            line = self.file.readline().decode()
+            if not line.strip():
+                continue
+            documents.append(line.rsplit(',', 1)[0])
+            self.segmentLeft -= 1
+            self.remaining -= 1
+            amount -= 1
+        start = self.read
+        self.read += len(documents)
+        return documents, np.arange(start, self.read)
+
+    def close(self):
+        self.file.close()
+
+def _holdout(classNo:int, positions:np.ndarray, testSize:float, randState:int):
+    # splitmix64 over (seed, class, position), mapped to [0, 1)
+    with np.errstate(over='ignore'):
+        x = positions.astype(np.uint64) + np.uint64((randState * 1000003 + classNo * 7919) & 0xFFFFFFFF) * np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        x = x ^ (x >> np.uint64(31))
+    return (x >> np.uint64(11)).astype(np.float64) / float(1 << 53) < testSize
+
+def streamBatches(path:str, batchSize:int=1000, randState:int=64, segments:dict=None):
+    '''
+        Generator over (documents, classes, positions) batches of a k-mer
+        file, mixing all classes in every batch. positions are the indexes of
+        the records within their class.
+    '''
+    segments = _classSegments(path) if segments is None else segments
+    readers = {classNo: _ClassReader(path, classSegments) for classNo, classSegments in segments.items()}
+    rng = np.random.default_rng(randState)
+    try:
+        while True:
+            remaining = {classNo: reader.remaining for classNo, reader in readers.items() if reader.remaining}
+            total = sum(remaining.values())
+            if not total:
+                break
+            documents, classes, positions = [], [], []
+            for classNo, left in remaining.items():
+                quota = max(1, round(batchSize*left/total))
+                taken, takenPositions = readers[classNo].take(quota)
+                documents.extend(taken)
+                classes.extend([classNo]*len(taken))
+                positions.extend(takenPositions.tolist())
+            order = rng.permutation(len(documents))
+            yield [documents[x] for x in order], np.array(classes)[order], np.array(positions)[order]
+    finally:
+        for reader in readers.values():
+            reader.close()
+
+def _buildEstimator(estimator:str, layers:tuple, randState:int):
+    if estimator == 'sgd':
+        return SGDClassifier(random_state=randState)
+    elif estimator == 'nb':
+        return MultinomialNB()
+    elif estimator == 'mlp':
+        return MLPClassifier(hidden_layer_sizes=layers, random_state=randState)
+    raise Exception("Unsupported estimator. Expected 'sgd', 'nb' or 'mlp'. Got:", estimator)
+
+def outOfCorePrediction(kmerPath:str, classNames, testData:str=None, testSize:float=0.2, estimator:str='sgd', ngramRange:tuple=(1,4), nFeatures:int=2**18, batchSize:int=1000, epochs:int=1, layers:tuple=(8, 4), outPath:str='data/predictions/', termPath:str='defaultPath/', randState:int=64):
+    '''
+        Trains an estimator incrementally over a k-mer file and writes the
+        classification report of the held out records to
+        outPath/termPath/ooc_<estimator>.txt.
+
+        kmerPath: Path of a k-mer file created by createKmers()
+
+        testData: Optional path of a second k-mer file to evaluate on. When
+                  given, all of kmerPath is used for training
+
+        testSize: Float fraction of the records of kmerPath held out for
+                  testing when testData isn't given
+
+        estimator: 'sgd' for SGDClassifier, 'nb' for MultinomialNB or 'mlp'
+                   for MLPClassifier
+
+        nFeatures: Size of the hashed feature space
+
+        batchSize: Amount of records per batch
+
+        epochs: Amount of passes over the training records
+    '''
+    if testData is None and type(testSize) is not float:
+        raise AttributeError("Records are held out by fraction without testData, expected testSize of type float. Got: "+str(type(testSize)))
+    if not os.path.isdir(outPath+termPath):
+        os.makedirs(outPath+termPath)
+    print(f'Metrics for out-of-core {estimator} using {nFeatures} hashed features, {epochs} epochs')
+
+    vectorizer = HashingVectorizer(ngram_range=ngramRange, n_features=nFeatures, alternate_sign=False, norm=None)
+    model = _buildEstimator(estimator, layers, randState)
+    # MultinomialNB needs the raw counts, the other estimators are scaled like in predictionFunction()
+    scaler = None if estimator == 'nb' else StandardScaler(with_mean=False)
+    segments = _classSegments(kmerPath)
+    labels = np.array(sorted(segments))
+    holdout = testData is None
+
+    def trainingBatches():
+        for documents, classes, positions in streamBatches(kmerPath, batchSize, randState, segments):
+            if holdout:
+                train = np.ones(len(documents), dtype=bool)
+                for classNo in np.unique(classes):
+                    inClass = classes == classNo
+                    train[inClass] = ~_holdout(classNo, positions[inClass], testSize, randState)
+                documents = [document for document, keep in zip(documents, train) if keep]
+                classes = classes[train]
+            if len(documents):
+                yield vectorizer.transform(documents), classes
+
+    if scaler is not None:
+        with instr.stage('scale', mode='ooc', estimator=estimator, termPath=termPath):
+            for x_batch, _ in trainingBatches():
+                scaler.partial_fit(x_batch)
+
+    for epoch in range(epochs):
+        with instr.stage('fit', mode='ooc', estimator=estimator, termPath=termPath, epoch=epoch):
+            for x_batch, y_batch in trainingBatches():
+                if scaler is not None:
+                    x_batch = scaler.transform(x_batch)
+                model.partial_fit(x_batch, y_batch, classes=labels)
+
+    testSegments = segments if holdout else _classSegments(testData)
+    testLabels = np.array(sorted(set(labels) | set(testSegments)))
+    confusion = np.zeros((len(testLabels), len(testLabels)), dtype=np.int64)
+    with instr.stage('predict', mode='ooc', estimator=estimator, termPath=termPath):
+        for documents, classes, positions in streamBatches(kmerPath if holdout else testData, batchSize, randState, testSegments):
+            if holdout:
+                test = np.zeros(len(documents), dtype=bool)
+                for classNo in np.unique(classes):
+                    inClass = classes == classNo
+                    test[inClass] = _holdout(classNo, positions[inClass], testSize, randState)
+                documents = [document for document, keep in zip(documents, test) if keep]
+                classes = classes[test]
+            if not len(documents):
+                continue
+            x_batch = vectorizer.transform(documents)
+            if scaler is not None:
+                x_batch = scaler.transform(x_batch)
+            prediction = model.predict(x_batch)
+            np.add.at(confusion, (np.searchsorted(testLabels, classes), np.searchsorted(testLabels, prediction)), 1)
+
+    with open(outPath+termPath+"ooc_"+estimator+".txt", "w") as f:
+        f.write(confusionReport(confusion, testLabels, classNames))
+    return model
+
+def confusionReport(confusion:np.ndarray, labels:np.ndarray, classNames=None, digits:int=2):
+    '''
+        Returns the same text as classification_report() would for the
+        records counted in a confusion matrix, whose rows are the true and
+        columns the predicted labels. Only the non-zero cells are passed on
+        as weighted samples, so memory doesn't depend on the amount of
+        records, and support is written as an integer count.
+    '''
+    trueCells, predictedCells = np.nonzero(confusion)
+    counts = confusion[trueCells, predictedCells]
+    metrics = {average: precision_recall_fscore_support(labels[trueCells], labels[predictedCells], labels=labels, average=average, sample_weight=counts, zero_division=0.0)[:3] for average in (None, 'macro', 'weighted')}
+    support = confusion.sum(axis=1)
+    total = int(support.sum())
+    names = [str(label) for label in labels] if classNames is None else [str(name) for name in classNames]
+
+    width = max(max(len(name) for name in names), len("weighted avg"), digits)
+    rowFormat = "{:>{width}s} " + " {:>9.{digits}f}"*3 + " {:>9}\n"
+    report = ("{:>{width}s} " + " {:>9}"*4).format("", "precision", "recall", "f1-score", "support", width=width) + "\n\n"
+    for position, name in enumerate(names):
+        report += rowFormat.format(name, *(float(values[position]) for values in metrics[None]), int(support[position]), width=width, digits=digits)
+    report += "\n"
+    accuracy = np.trace(confusion)/total if total else 0.0
+    report += ("{:>{width}s} " + " {:>9.{digits}}"*2 + " {:>9.{digits}f}" + " {:>9}\n").format("accuracy", "", "", accuracy, total, width=width, digits=digits)
+    for average in ('macro', 'weighted'):
+        report += rowFormat.format(average+" avg", *(float(value) for value in metrics[average]), total, width=width, digits=digits)
+    return report
@@ -0,0 +1,223 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from helpers import sequenceFetch as sf
+from helpers.featureCache import fileHash
+'''
+    Dependency-aware runner for the data preparation stages, driven by a
+    JSON config instead of commenting calls in and out of main.py:
+        python -m helpers.pipeline pipeline.json
+
+    Every stage names a helper function, its parameters, and the paths it
+    reads and writes:
+        {
+            "stages": {
+                "parseHosts": {
+                    "function": "getSequences",
+                    "params": {"termClassPairs": [["agapornis roseicollis", 3]], "outPath": "data/sequences/hosts/"},
+                    "inputs": ["data/entries/"],
+                    "outputs": ["data/sequences/hosts/"]
+                },
+                ...
+            }
+        }
+
+    A stage runs after every stage whose outputs contain, or are contained
+    in, one of its inputs, plus any stage listed in its optional "after".
+    Stages whose dependencies are done run concurrently.
+
+    Before running, a stage is fingerprinted from its function, parameters
+    and the contents of its inputs. If the fingerprint matches the last
+    successful run and the outputs still exist, the stage is skipped.
+    Results are saved after every stage, so rerunning after a failure
+    resumes with the stage that failed.
+'''
+
+FUNCTIONS = {
+    'getData': sf.getData,
+    'getSequences': sf.getSequences,
+    'combineSequences': sf.combineSequences,
+    'createKmers': sf.createKmers,
+}
+
+def _normalize(path:str):
+    return os.path.normpath(path)
+
+def _contains(outer:str, inner:str):
+    outer, inner = _normalize(outer), _normalize(inner)
+    return inner == outer or inner.startswith(outer.rstrip(os.sep)+os.sep)
+
+class Pipeline:
+    '''
+        config: Dict with a "stages" entry, as described above, or the path
+                of a JSON file holding it
+
+        statePath: File the fingerprints of finished stages are kept in.
+                   Defaults to .pipeline_state.json next to the config file
+    '''
+    def __init__(self, config, statePath:str=None):
+        if type(config) is str:
+            directory = os.path.dirname(config)
+            with open(config) as f:
+                config = json.load(f)
+            statePath = statePath or os.path.join(directory, ".pipeline_state.json")
+        self.statePath = statePath or ".pipeline_state.json"
+        self.stages = config['stages']
+        for name, stage in self.stages.items():
+            if stage.get('function') not in FUNCTIONS:
+                raise Exception("Unsupported function for stage " + name + ". Expected one of " + str(list(FUNCTIONS)) + ", got: " + str(stage.get('function')))
+            for other in stage.get('after', []):
+                if other not in self.stages:
+                    raise Exception("Stage " + name + " runs after unknown stage " + other)
+        self.dependencies = {name: self._dependencies(name) for name in self.stages}
+        self._order()
+        self.state = {}
+        if os.path.isfile(self.statePath):
+            with open(self.statePath) as f:
+                self.state = json.load(f)
+        self.hashes = self.state.pop('_hashes', {})
+
+    def _dependencies(self, name:str):
+        stage = self.stages[name]
+        dependencies = set(stage.get('after', []))
+        for other, otherStage in self.stages.items():
+            if other == name:
+                continue
+            for path in stage.get('inputs', []):
+                if any(_contains(output, path) or _contains(path, output) for output in otherStage.get('outputs', [])):
+                    dependencies.add(other)
+        return dependencies
+
+    def _order(self):
+        # Kahn's algorithm, only to reject cycles up front
+        remaining = {name: set(dependencies) for name, dependencies in self.dependencies.items()}
+        while remaining:
+            ready = [name for name, dependencies in remaining.items() if not dependencies]
+            if not ready:
+                raise Exception("The stages depend on each other in a cycle: " + ", ".join(sorted(remaining)))
+            for name in ready:
+                del remaining[name]
+            for dependencies in remaining.values():
+                dependencies.difference_update(ready)
+
+    def _pathHash(self, path:str):
+        '''
+            Content hash of a file or of every file within a directory. Hashes
+            are reused while a file's size and modification time are unchanged.
+        '''
+        if not os.path.exists(path):
+            return None
+        if os.path.isfile(path):
+            info = os.stat(path)
+            cached = self.hashes.get(path)
+            if cached is None or cached[0] != info.st_size or cached[1] != info.st_mtime_ns:
+                cached = self.hashes[path] = [info.st_size, info.st_mtime_ns, fileHash(path)]
+            return cached[2]
+        digest = hashlib.sha256()
+        for root, directories, files in os.walk(path):
+            directories[:] = sorted(directory for directory in directories if not directory.startswith('.'))
+            for file in sorted(files):
+                filePath = os.path.join(root, file)
+                digest.update(os.path.relpath(filePath, path).encode()+b'\0'+self._pathHash(filePath).encode())
+        return digest.hexdigest()
+
+    def fingerprint(self, name:str):
+        stage = self.stages[name]
+        digest = hashlib.sha256(json.dumps([stage['function'], stage.get('params', {})], sort_keys=True).encode())
+        for path in sorted(stage.get('inputs', [])):
+            digest.update(("%s=%s;" % (path, self._pathHash(path))).encode())
+        return digest.hexdigest()
+
+    def upToDate(self, name:str):
+        previous = self.state.get(name)
+        outputs = self.stages[name].get('outputs', [])
+        return previous is not None and previous['fingerprint'] == self.fingerprint(name) and all(os.path.exists(path) for path in outputs)
+
+    def _saveState(self):
+        with open(self.statePath+".tmp", "w") as f:
+            json.dump(dict(self.state, _hashes=self.hashes), f, indent=2)
+        os.replace(self.statePath+".tmp", self.statePath)
+
+    def _runStage(self, name:str):
+        stage = self.stages[name]
+        started = time.perf_counter()
+        FUNCTIONS[stage['function']](**stage.get('params', {}))
+        return time.perf_counter()-started
+
+    def run(self, workers:int=4, force:list=(), dryRun:bool=False):
+        '''
+            Runs every stage that isn't up to date, independent ones
+            concurrently, and returns {stage: 'skipped', 'ran' or 'failed'}.
+
+            force: Names of stages to run even when they are up to date. The
+                   stages depending on them only run if their inputs changed
+
+            dryRun: Only reports what would run. Since nothing runs, every
+                    stage depending on one that would run is reported too
+        '''
+        status = {}
+        done = set()
+        wouldRun = set()
+        pending = dict(self.dependencies)
+        running = {}
+        fingerprints = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending or running:
+                ready = [name for name, dependencies in pending.items() if dependencies <= done]
+                for name in ready:
+                    del pending[name]
+                    if any(status.get(dependency) == 'failed' for dependency in self.dependencies[name]):
+                        status[name] = 'failed'
+                        print("%s: not run, a stage it depends on failed" % name)
+                        done.add(name)
+                    elif name not in force and not (self.dependencies[name] & wouldRun) and self.upToDate(name):
+                        status[name] = 'skipped'
+                        print("%s: up to date, skipped" % name)
+                        done.add(name)
+                    elif dryRun:
+                        status[name] = 'ran'
+                        wouldRun.add(name)
+                        print("%s: would run" % name)
+                        done.add(name)
+                    else:
+                        print("%s: running %s" % (name, self.stages[name]['function']))
+                        # Fingerprinted here, so only this thread touches the hash cache
+                        fingerprints[name] = self.fingerprint(name)
+                        running[pool.submit(self._runStage, name)] = name
+                if not running:
+                    if pending and not ready:
+                        break
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    done.add(name)
+                    try:
+                        seconds = future.result()
+                    except Exception as error:
+                        status[name] = 'failed'
+                        print("%s: failed: %r" % (name, error))
+                        continue
+                    status[name] = 'ran'
+                    self.state[name] = {'fingerprint': fingerprints[name], 'finished': time.time(), 'seconds': seconds}
+                    self._saveState()
+                    print("%s: finished in %.2fs" % (name, seconds))
+        if not dryRun:
+            self._saveState()
+        return status
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs the data preparation stages of a pipeline config, skipping the ones that are up to date.")
+    parser.add_argument('config', help="JSON file describing the stages")
+    parser.add_argument('--workers', type=int, default=4, help="Amount of stages run at once")
+    parser.add_argument('--force', default="", help="Comma separated stages to run even when up to date")
+    parser.add_argument('--state', default=None, help="File the fingerprints of finished stages are kept in")
+    parser.add_argument('--dry-run', action='store_true', help="Only print what would run")
+    args = parser.parse_args()
+    status = Pipeline(args.config, args.state).run(args.workers, [name for name in args.force.split(',') if name], args.dry_run)
+    if 'failed' in status.values():
+        raise SystemExit(1)
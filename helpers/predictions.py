@@ -1,24 +1,51 @@
 from collections.abc import Iterable
-from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer 
+from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer, TfidfTransformer
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
 from sklearn.utils import shuffle
-from sklearn.naive_bayes import CategoricalNB
+from sklearn.naive_bayes import CategoricalNB, MultinomialNB
 from sklearn.neural_network import MLPClassifier
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.svm import LinearSVC
 from sklearn.metrics import classification_report
+from helpers import kmerCounter as kc
+from helpers import inference as inf
+from helpers import instrumentation as instr
+from helpers import outOfCore as ooc
+from helpers import sketches as sk
+import numpy as np
 import os
 import warnings
 
-def predictionFunction(mode:str, trainingData:Iterable, classes:Iterable[int], classNames:Iterable[str], testData=None, testSize=0.2, layers:tuple=(8, 4), iterations:int=3200, outPath:str='data/predictions/', termPath:str='defaultPath/', randState:int=64):
+# Modes fitted on the raw counts, without a StandardScaler
+UNSCALED_MODES = ('mnb',)
+# Modes taking raw sequences instead of a feature matrix
+SEQUENCE_MODES = ('msh',)
+
+def predictionFunction(mode:str, trainingData:Iterable, classes:Iterable[int], classNames:Iterable[str], testData=None, testSize=0.2, layers:tuple=(8, 4), iterations:int=3200, outPath:str='data/predictions/', termPath:str='defaultPath/', randState:int=64, savePath:str=None, vectorizer:dict=None, estimator:str='sgd', ngramRange:tuple=(1,4), batchSize:int=1000, epochs:int=1, nFeatures:int=2**18, windowSize:int=21, sketchSize:int=512, bands:int=128, neighbours:int=1, workers:int=None):
     '''
         Holds all the prediction models inside. This is the main method
         with which the performance of a selected model is tested.
 
         mode: Required to select which model is used. Depending on
               selection, some function parameters might not be used.
-              Options are: 'cnn', 'svc', 'dtc', 'cnb'
+              Options are: 'cnn', 'svc', 'dtc', 'cnb', 'mnb', 'msh', 'ooc'
+
+              'mnb' is a multinomial naive Bayes that works on the sparse
+              k-mer counts directly and fits them in chunks, so unlike
+              'cnb' it doesn't need trainingData densified. Its data is
+              not scaled, to keep the counts intact
+
+              'msh' classifies by the nearest neighbours of MinHash
+              sketches, see sketches.SketchClassifier. trainingData and
+              testData are then lists of raw sequences, e.g. from
+              getSequences(mode='s'), instead of matrices
+
+              'ooc' trains out-of-core over a k-mer file instead of a
+              matrix, see outOfCore.outOfCorePrediction(). trainingData
+              (and testData, if given) are then paths of files created
+              by createKmers(), classes are read from them and may be
+              None, and the report goes to "ooc_<estimator>.txt"
 
         trainingData: Numpy ndarray which is acquired by using
                       separateSequences()
@@ -53,6 +80,25 @@ def predictionFunction(mode:str, trainingData:Iterable, classes:Iterable[int], c
 
         randState: Integer to allow for reproducible predictions.
                    Defaults to 64
+
+        savePath: Optional. Directory in which a new version of the fitted
+                  pipeline is saved for later use with inference.loadPipeline().
+                  Not supported by 'msh' and 'ooc'
+
+        vectorizer: Required with savePath. Dict with the 'mode', 'ngramRange',
+                    'windowSize', 'step' and 'vocabulary' (as returned by
+                    vectorizeData() with returnVocabulary) trainingData was
+                    built with
+
+        estimator, ngramRange, batchSize, epochs, nFeatures: Only used by
+                   'ooc'. The partial_fit estimator ('sgd', 'nb' or 'mlp'),
+                   the ngram range of the hashed features, records per batch,
+                   passes over the data and size of the hashed feature space
+
+        windowSize, sketchSize, bands, neighbours, workers: Only used by
+                   'msh'. The k-mer length, bins per sketch, LSH bands,
+                   neighbours voting on the class and processes building the
+                   sketches
     '''
     if not os.path.isdir(outPath+termPath):
         os.makedirs(outPath+termPath)
@@ -60,67 +106,134 @@ def predictionFunction(mode:str, trainingData:Iterable, classes:Iterable[int], c
     if termPath == "termPath/":
         warnings.warn("termPath should not be left at default. This will overwrite any prediction, unless it's being used to test a single model.")
     
-    scaler = StandardScaler(with_mean=False)
+    if savePath is not None and (mode == 'ooc' or mode in SEQUENCE_MODES):
+        raise Exception("Saving the fitted pipeline is not supported for the '" + mode + "' mode.")
+
+    mark = len(instr.records())
+    if mode == 'ooc':
+        model = ooc.outOfCorePrediction(trainingData, classNames, testData=testData, testSize=testSize, estimator=estimator, ngramRange=ngramRange, nFeatures=nFeatures, batchSize=batchSize, epochs=epochs, layers=layers, outPath=outPath, termPath=termPath, randState=randState)
+        if instr.isEnabled():
+            instr.writeMetrics(outPath+termPath+"ooc_"+estimator+".json", instr.records(mark), mode=mode, termPath=termPath)
+        return model
+
+    if mode == 'msh':
+        print('Metrics for MinHash nearest neighbours')
+        model = sk.SketchClassifier(windowSize, sketchSize, bands, neighbours, workers, randState)
+    else:
+        model = _buildModel(mode, layers, iterations, randState)
+    with instr.stage('scale', mode=mode, termPath=termPath) as info:
+        x_train, x_test, y_train, y_test, scaler = _splitAndScale(trainingData, classes, testData, testSize, randState, scale=None if mode in SEQUENCE_MODES else mode not in UNSCALED_MODES)
+        if scaler is not None:
+            info.update(instr.matrixInfo(x_train))
+
+    with open(outPath+termPath+mode+".txt", "w") as f:
+        with instr.stage('fit', mode=mode, termPath=termPath, samples=_samples(x_train)):
+            model.fit(x_train, y_train)
+        with instr.stage('predict', mode=mode, termPath=termPath, samples=_samples(x_test)):
+            prediction = model.predict(x_test)
+        f.write(_report(y_test, prediction, classNames))
+
+    if instr.isEnabled():
+        instr.writeMetrics(outPath+termPath+mode+".json", instr.records(mark), mode=mode, termPath=termPath)
+
+    if savePath is not None:
+        if vectorizer is None:
+            raise AttributeError("vectorizer is required to save the fitted pipeline.")
+        inf.savePipeline(savePath, vectorizer, scaler, model, classNames)
+
+def _splitAndScale(trainingData, classes, testData, testSize, randState:int, scale:bool=True):
+    '''
+        Splits (or shuffles) the data the way predictionFunction() describes
+        it and scales it with a StandardScaler fitted on the training part.
+        With scale=False the scaler leaves the data as it is, and with
+        scale=None there is no scaler at all, for data that isn't a matrix.
+        Returns x_train, x_test, y_train, y_test and the fitted scaler.
+    '''
+    scaler = None if scale is None else StandardScaler(with_mean=False, with_std=scale)
 
     if type(testSize) is float:
         x_train, x_test, y_train, y_test = train_test_split(trainingData, classes, test_size=testSize, random_state=randState)
 
-        scaler.fit(x_train)
-        x_train = scaler.transform(x_train)
-        x_test = scaler.transform(x_test) 
+        if scaler is not None:
+            scaler.fit(x_train)
+            x_train = scaler.transform(x_train)
+            x_test = scaler.transform(x_test) 
 
     elif type(testSize) is int:
         if testData is not None or []:
             x_train, y_train = shuffle(trainingData, classes, random_state=randState)
             x_test = shuffle(testData, random_state=randState)
 
-            scaler.fit(x_train)
-            x_train = scaler.transform(x_train)
-            x_test = scaler.transform(x_test)
+            if scaler is not None:
+                scaler.fit(x_train)
+                x_train = scaler.transform(x_train)
+                x_test = scaler.transform(x_test)
             y_test = shuffle(y_train, random_state=randState, n_samples=testSize)
         else:
             raise AttributeError("testData is likely None or an empty array.")
     else:
         raise AttributeError("Expected testSize of type int or float. Got: "+str(type(testSize)))
 
-    if mode == 'cnn':
+    return x_train, x_test, y_train, y_test, scaler
 
+def _buildModel(mode:str, layers:tuple=(8, 4), iterations:int=3200, randState:int=64):
+    '''
+        Returns the unfitted estimator for a predictionFunction() mode.
+    '''
+    if mode == 'cnn':
         print(f'Metrics for CNN prediction using {layers} for hidden layer sizes, {iterations} iterations')
-
-        clf = MLPClassifier(solver='lbfgs', hidden_layer_sizes=layers , max_iter=iterations, random_state=randState)
-        with open(outPath+termPath+mode+".txt", "w") as f:
-            clf.fit(x_train, y_train)
-            prediction = clf.predict(x_test)
-            f.write(str(classification_report(y_test, prediction, zero_division=0.0, target_names=classNames)))
+        return MLPClassifier(solver='lbfgs', hidden_layer_sizes=layers , max_iter=iterations, random_state=randState)
 
     elif mode == 'svc':
         print('Metrics for LinearSVC')
-        svc = LinearSVC(max_iter=iterations, random_state=randState)
-        with open(outPath+termPath+mode+".txt", "w") as f:
-            svc.fit(x_train, y_train)
-            prediction = svc.predict(x_test)
-            f.write(str(classification_report(y_test, prediction, zero_division=0.0, target_names=classNames)))
+        return LinearSVC(max_iter=iterations, random_state=randState)
 
     elif mode == 'dtc':
         print('Metrics for DecisionTreeClassifier')
-        dtc = DecisionTreeClassifier(criterion='entropy', random_state=randState)
-        with open(outPath+termPath+mode+".txt", "w") as f:
-            dtc.fit(x_train, y_train)
-            prediction = dtc.predict(x_test)
-            f.write(str(classification_report(y_test, prediction, zero_division=0.0, target_names=classNames)))
+        return DecisionTreeClassifier(criterion='entropy', random_state=randState)
 
     elif mode == 'cnb':
         print('Metrtics for CategoricalNB')
-        cnb = CategoricalNB(min_categories=244)
-        with open(outPath+termPath+mode+".txt", "w") as f:
-            cnb.fit(x_train, y_train)
-            prediction = cnb.predict(x_test)
-            f.write(str(classification_report(y_test, prediction, zero_division=0.0, target_names=classNames)))
+        return CategoricalNB(min_categories=244)
+
+    elif mode == 'mnb':
+        print('Metrics for sparse MultinomialNB')
+        return ChunkedMultinomialNB()
 
     else:
-        raise Exception("Unsupported mode. Expected: \'cnn\', \'svc\', \'dtc\', or \'cnb\'. Got:", mode)
+        raise Exception("Unsupported mode. Expected: \'cnn\', \'svc\', \'dtc\', \'cnb\', \'mnb\', \'msh\' or \'ooc\'. Got:", mode)
+
+class ChunkedMultinomialNB(MultinomialNB):
+    '''
+        MultinomialNB that fits a CSR matrix in chunks of rows through
+        partial_fit(), so only one chunk's worth of temporaries exists at a
+        time. The counts are never densified. Use predict_log_proba() for the
+        log-probability of every class.
+
+        chunkSize: Amount of rows per chunk. Defaults to 10000
+    '''
+    def __init__(self, *, alpha=1.0, force_alpha=True, fit_prior=True, class_prior=None, chunkSize:int=10000):
+        super().__init__(alpha=alpha, force_alpha=force_alpha, fit_prior=fit_prior, class_prior=class_prior)
+        self.chunkSize = chunkSize
+
+    def fit(self, X, y, sample_weight=None):
+        for attribute in ('classes_', 'class_count_', 'feature_count_'):
+            if hasattr(self, attribute):
+                delattr(self, attribute)
+        y = np.asarray(y)
+        labels = np.unique(y)
+        for start in range(0, X.shape[0], self.chunkSize):
+            end = start+self.chunkSize
+            self.partial_fit(X[start:end], y[start:end], classes=labels, sample_weight=None if sample_weight is None else sample_weight[start:end])
+        return self
+
+def _samples(data):
+    return data.shape[0] if hasattr(data, 'shape') else len(data)
 
-def vectorizeData(kmerList, ngramRange:tuple=(4,4), mode:str='cvec'):
+def _report(y_test, prediction, classNames, labels=None):
+    return str(classification_report(y_test, prediction, labels=labels, zero_division=0.0, target_names=classNames))
+
+def vectorizeData(kmerList, ngramRange:tuple=(4,4), mode:str='cvec', windowSize:int=None, step:int=1, returnVocabulary:bool=False):
     '''
         Returns a NumPy ndarray with vectorized k-mer sequences using the 
         TfidfVectorizer.
@@ -132,17 +245,41 @@ def vectorizeData(kmerList, ngramRange:tuple=(4,4), mode:str='cvec'):
         in an orderly fashion without having any skewed data.
         
         kmerList: A complete list of kmers generated from the full list of sequences
-                  obtained by using createData()
+                  obtained by using createData(). For the 'kvec' and 'ktfidf' modes
+                  this is the list of raw sequences instead
+
+        mode: Selects vectorizer. 'cvec' for CountVectorizer, 'tfidf' for TfidfVectorizer,
+              'kvec' and 'ktfidf' for their integer encoded counterparts, which count
+              k-mers straight from the sequences without building any strings
 
-        mode: Selects vectorizer. 'cvec' for CountVectorizer, 'tfidf' for TfidfVectorizer
+        windowSize: Required by 'kvec' and 'ktfidf', same as in createKmers()
+
+        step: Only used by 'kvec' and 'ktfidf', same as in createKmers()
+
+        returnVocabulary: Also return the array of feature names, one for each
+                          column of the matrix. Defaults to False
         
         ngramRange was added for finer control and testing for the vectorizer.
     '''
-    if mode == 'cvec':
-        vectorizer = CountVectorizer(ngram_range=ngramRange)
-    elif mode == 'tfidf':
-        vectorizer = TfidfVectorizer(ngram_range=ngramRange)
-    else:
-        raise Exception("Unsupported vectorizer mode. Expected 'cvec' or 'tfidf', got:" + mode)
-    return vectorizer.fit_transform(kmerList)
- 
+    with instr.stage('vectorize', mode=mode, ngramRange=list(ngramRange), windowSize=windowSize) as info:
+        if mode in ('kvec', 'ktfidf'):
+            if windowSize is None:
+                raise AttributeError("windowSize is required for the '" + mode + "' mode.")
+            matrix, vocabulary = kc.countKmers(kmerList, windowSize, ngramRange, step)
+            if mode == 'ktfidf':
+                matrix = TfidfTransformer().fit_transform(matrix)
+            getNames = lambda: kc.kmerFeatureNames(vocabulary, windowSize, ngramRange)
+        else:
+            if mode == 'cvec':
+                vectorizer = CountVectorizer(ngram_range=ngramRange)
+            elif mode == 'tfidf':
+                vectorizer = TfidfVectorizer(ngram_range=ngramRange)
+            else:
+                raise Exception("Unsupported vectorizer mode. Expected 'cvec', 'tfidf', 'kvec' or 'ktfidf', got:" + mode)
+            matrix = vectorizer.fit_transform(kmerList)
+            getNames = vectorizer.get_feature_names_out
+        info.update(instr.matrixInfo(matrix))
+
+    if returnVocabulary:
+        return matrix, getNames()
+    return matrix
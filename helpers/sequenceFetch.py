@@ -1,6 +1,13 @@
-import pandas as pd
 import os
-from Bio import SeqIO, Entrez 
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from helpers import entrezDownload as ed
+from helpers import sequenceStore as ss
+from helpers import instrumentation as instr
+from helpers import fragments as fr
+from helpers import fastaIndex as fa
+from helpers.termMatcher import TermMatcher
 from collections.abc import Iterable
 import warnings
 '''
@@ -25,7 +32,8 @@ import warnings
                                   of this application
 '''
 
-def getData(terms:Iterable, maxRecords:int, batchSize:int, email:str="A.N.Other@example.com", outPath:str="data/entries/", returnType:str="fasta"):
+@instr.timed('fetch')
+def getData(terms:Iterable, maxRecords:int, batchSize:int, email:str="A.N.Other@example.com", outPath:str="data/entries/", returnType:str="fasta", workers:int=3, apiKey:str=None, baseUrl:str=ed.EUTILS_URL, retries:int=5, compress:bool=False):
     '''
         This will export each entry's search results to a separate file.
         It does not support stitching together the files into one.
@@ -44,7 +52,27 @@ def getData(terms:Iterable, maxRecords:int, batchSize:int, email:str="A.N.Other@
                  Defaults to "data/entries/"
         
         returnType: Datatype to use. Defaults to "fasta"
-        
+
+        workers: Amount of batches downloaded concurrently. Requests are
+                 limited to 3 per second, or 10 per second with an apiKey,
+                 regardless of this. Defaults to 3
+
+        apiKey: Optional NCBI API key
+
+        baseUrl: Root of the E-utilities. Only needs changing for testing
+                 against a local server
+
+        retries: Amount of attempts for each request, with exponential backoff
+                 in between. Defaults to 5
+
+        compress: Whether to write BGZF compressed files, named after the
+                  term with a ".gz" suffix. getSequences() reads them as they
+                  are, and fastaIndex.FastaIndex gives random access to them.
+                  Defaults to False
+
+        Finished batches are checkpointed in outPath/.parts/, so running this
+        again after an interruption resumes from the last finished batch.
+        Returns the throughput of each term and overall.
     '''
     if not os.path.isdir(outPath):
         os.makedirs(outPath)
@@ -55,32 +83,11 @@ def getData(terms:Iterable, maxRecords:int, batchSize:int, email:str="A.N.Other@
     if not terms:
         raise Exception("List of terms should not be empty. Add some terms first, then run again.")
 
-    record_ids = []
-    Entrez.email = email
-    for term in terms:
-        print("Searching for %s" %term)
-        stream = Entrez.esearch(db="nucleotide", term=term,retmax=str(maxRecords))
-        record = Entrez.read(stream)
-        record_ids = record['IdList']
-        stream.close()
-
-        count = len(record_ids)
-
-        results = Entrez.read(Entrez.epost('nucleotide', id=','.join(record_ids)))
-        webenv = results['WebEnv']
-        query_key = results['QueryKey']
-
-        with open(str(outPath) + str(term) +"."+returnType, "w") as output:
-            for start in range(0, count, batchSize):
-                end = min(count, start + batchSize)
-                print("Downloading record %i to %i" % (start+1, end))
-                stream = Entrez.efetch(db='nucleotide', rettype=returnType, retmode='text', retstart='start', retmax='batchSize', webenv=webenv, query_key=query_key)
-                data = stream.read()
-                if type(data) is str:
-                    output.write(data)
-                stream.close()
-
-def createKmers(inPath:str="data/combined_data/", outPath:str="data/kmers/", inFile:str='combined_sequences.txt', outFile:str='kmers.txt', sequences=[], windowSize:int=1, step:int=1, mode:str='l'):
+    client = ed.EntrezClient(email, apiKey=apiKey, baseUrl=baseUrl, retries=retries)
+    return ed.downloadTerms(terms, maxRecords, batchSize, client, outPath=outPath, returnType=returnType, workers=workers, compress=compress)
+
+@instr.timed('kmer')
+def createKmers(inPath:str="data/combined_data/", outPath:str="data/kmers/", inFile:str='combined_sequences.txt', outFile:str='kmers.txt', sequences=[], windowSize:int=1, step:int=1, mode:str='l', chunkSize:int=1000, fragmentLength:int=None, overlap:int=0, perClass:int=None, seed:int=64, minLength:int=None):
 
     '''
         Generates a list of k-mers created from groups of k sequential nucleotides
@@ -97,7 +104,9 @@ def createKmers(inPath:str="data/combined_data/", outPath:str="data/kmers/", inF
                  outFile
 
         inFile: Input file from which sequences for processing are read. Defaults to
-                "combined_sequences.txt" which is the output of combineSequences()
+                "combined_sequences.txt" which is the output of combineSequences().
+                Can also be a sequence store, which is read in class order
+                through its index without sorting
 
         outFile: File to ouput the generated k-mers within the outPath directory.
                   Defaults to "kmers", and is combined with windowSize
@@ -110,67 +119,184 @@ def createKmers(inPath:str="data/combined_data/", outPath:str="data/kmers/", inF
 
         mode: Use 'l' to output to file, 's' to output to iterable. Defaults to 'l'
 
+        chunkSize: Only used with 'l'. Amount of k-mer records held in memory per
+                   class before they are flushed to disk. The input is read one
+                   record at a time and sorted by class on disk, so peak memory
+                   is bounded by this rather than by the size of the input.
+                   Defaults to 1000
+
+        fragmentLength: Optional. Splits every sequence into fragments of this
+                        length, each of which becomes its own k-mer record.
+                        Where each fragment came from is written to
+                        outPath/outFile+".fragments.tsv"
+
+        overlap: Amount of nucleotides consecutive fragments share. Defaults to 0
+
+        perClass: Optional, only used with fragmentLength. Keeps a random
+                  sample of at most this many fragments of each class, see
+                  fragments.FragmentSampler
+
+        seed: Seed of the fragment sample. Defaults to 64
 
+        minLength: Optional, only used with fragmentLength. Shortest trailing
+                   fragment kept, see fragments.fragmentStarts(). By default
+                   trailing partial fragments are dropped, and records
+                   shorter than fragmentLength are kept whole
+
+        Returns the amount of entries for each class, sorted by number of class,
+        when writing to file, or the list of k-mers when outputting to iterable.
     '''
 
     if not os.path.isdir(outPath):
         os.makedirs(outPath)
     
-    if mode.lower() == 'l' and outFile!= '':
+    if mode.lower() == 'l' and outFile!= '' and ss.isStore(inPath+inFile) and fragmentLength is None:
+        store = ss.SequenceStore(inPath+inFile)
         with open(outPath+outFile, 'w') as output:
             output.write("sequence,class\n")
-            
-            data = pd.read_csv(inPath+inFile, sep=" ")
-            data.sort_values('class', inplace=True)
-            sequences = data['sequence'].tolist()
-            dataClasses = data['class'].tolist()
-            for index, sequence in enumerate(sequences):
-                temp = ''
-                for x in range(0, len(sequence)-windowSize+1, step):
-                    temp += sequence[x:x+windowSize]+' '
-                output.write(temp+','+str(dataClasses[index])+"\n")
+            for sequence, classNo in store.iterByClass():
+                output.write(kmerDocument(sequence, windowSize, step)+','+str(classNo)+"\n")
+        return store.classCounts()
+
+    elif mode.lower() == 'l' and outFile!= '':
+        classCounts = {}
+        buffers = {}
+        with tempfile.TemporaryDirectory(dir=outPath) as tempDir:
+            records = readSequences(inFile, inPath)
+            if fragmentLength is not None:
+                records = fr.fragmentRecords(records, fragmentLength, overlap, perClass, minLength, seed, provenancePath=outPath+outFile+fr.PROVENANCE_SUFFIX)
+            for sequence, classNo in records:
+                buffer = buffers.setdefault(classNo, [])
+                buffer.append(kmerDocument(sequence, windowSize, step)+','+str(classNo)+"\n")
+                classCounts[classNo] = classCounts.get(classNo, 0) + 1
+                if len(buffer) >= chunkSize:
+                    _flushBucket(tempDir, classNo, buffer)
+
+            with open(outPath+outFile, 'w') as output:
+                output.write("sequence,class\n")
+                for classNo in sorted(classCounts):
+                    _flushBucket(tempDir, classNo, buffers[classNo])
+                    with open(os.path.join(tempDir, str(classNo))) as bucket:
+                        for line in bucket:
+                            output.write(line)
+        return [classCounts[classNo] for classNo in sorted(classCounts)]
 
     elif mode.lower() == 's' and sequences:
-        kmers = []
-        for sequence in sequences:
-            temp = ''
-            for x in range(0, len(sequence)-windowSize+1, step):
-                temp += sequence[x:x+windowSize]+' '
-            kmers.append(temp)
-        return kmers
-
-def sequenceToFile(sequences, termClassPairs, outPath:str, outfile:str):
+        if fragmentLength is not None:
+            sequences = [fragment for fragment, _ in fr.fragmentRecords(((sequence, 0) for sequence in sequences), fragmentLength, overlap, perClass, minLength, seed)]
+        return [kmerDocument(sequence, windowSize, step) for sequence in sequences]
+
+def kmerDocument(sequence:str, windowSize:int, step:int=1):
+    '''
+        Returns the space separated k-mers of a single sequence, in the same
+        format createKmers() writes them.
+    '''
+    return ''.join(sequence[x:x+windowSize]+' ' for x in range(0, len(sequence)-windowSize+1, step))
+
+def _flushBucket(tempDir:str, classNo:int, buffer:list):
+    with open(os.path.join(tempDir, str(classNo)), 'a') as bucket:
+        bucket.writelines(buffer)
+    buffer.clear()
+
+def readSequences(fileName:str, inPath:str="data/combined_data/"):
+    '''
+        Generator over the sequence and class of every record in a file created
+        by sequenceToFile() or combineSequences(), read one line at a time.
+        Sequence stores are read one record at a time in store order.
+    '''
+    if ss.isStore(inPath+fileName):
+        store = ss.SequenceStore(inPath+fileName)
+        for record in range(len(store)):
+            yield store.sequence(record), int(store.index['classNo'][record])
+        return
+
+    with open(inPath+fileName) as infile:
+        for line in infile:
+            line = line.strip()
+            if not line or line == "sequence class":
+                continue
+            sequence, classNo = line.rsplit(' ', 1)
+            yield sequence, int(classNo)
+
+def sequenceToFile(sequences, termClassPairs, outPath:str, outfile:str, fileFormat:str='txt', fragmentLength:int=None, overlap:int=0, perClass:int=None, seed:int=64, minLength:int=None):
     '''
         Moves all the sequences acquired from getSequences() to a file. This method
         shouldn't be called separately.
 
         sequences: List of sequences obtained from getSequences(), though you won't
                    need to call it yourself. This is done directly from the
-                   getSequences() function, and only if it's selected.
+                   getSequences() function, and only if it's selected. Any
+                   iterable of records works, and records are written as they
+                   are read, so a generator keeps memory use flat.
 
         outFile: Output file without extension for the finished sequences and their
                  classes. Retrieve these using pandas.read_csv() using " " as the
                  delimiter.
-    '''
-    seqs = []
-    for item in sequences:
-        unavailable = False
-        for term, classNo in termClassPairs:
-            if term.lower() in item.description.lower():
-                seqs.append(item.seq+" "+str(classNo))
-            elif not unavailable:
-                unavailable = True
-                print("The term and class pair for " + term + " - class " + str(classNo) + " has not been found.")
 
+        fileFormat: 'txt' for a text file, 'store' for a packed sequence store,
+                    which is written to outFile+".store/". Either replaces
+                    an existing output. Defaults to 'txt'
+
+        Every description is matched against all terms at once. A record is
+        written once for every term found in its description, in the order
+        of termClassPairs. Returns the amount of records read, written and
+        unmatched and the records processed per second.
+
+        fragmentLength, overlap, perClass, seed, minLength: Optional, see createKmers().
+                        Fragments of the records are written instead of the
+                        records, with their provenance in outFile+".fragments.tsv"
+    '''
     if not os.path.isdir(outPath):
         os.makedirs(outPath)
 
-    with open(outPath+outfile+".txt", "w") as output:
+    termClassPairs = list(termClassPairs)
+    matcher = TermMatcher(term for term, _ in termClassPairs)
+    records = 0
+    written = 0
+    unmatched = 0
+    termCounts = [0]*len(termClassPairs)
+    started = time.perf_counter()
+
+    if fileFormat == 'store':
+        print("Writing into "+outPath+outfile+".store/")
+        output = ss.SequenceStore(outPath+outfile+".store/", overwrite=True)
+        write = output.append
+    else:
         print("Writing into "+outPath+outfile+".txt")
-        for x in range(0, len(seqs)):
-            output.write(str(seqs[x]).lower()+"\n")
-
-def getSequences(termClassPairs:Iterable, mode:str='l', inPath:str="data/entries/", outPath:str="data/sequences/", datatype:str="fasta", fileName=None):
+        output = open(outPath+outfile+".txt", "w")
+        write = lambda sequence, classNo: output.write(sequence+" "+str(classNo)+"\n")
+
+    def matched():
+        nonlocal records, unmatched
+        for item in sequences:
+            records += 1
+            matches = matcher.match(item.description)
+            if not matches:
+                unmatched += 1
+                continue
+            sequence = str(item.seq).lower()
+            for position in matches:
+                termCounts[position] += 1
+                yield sequence, termClassPairs[position][1], item.id
+
+    matchedRecords = matched()
+    if fragmentLength is not None:
+        matchedRecords = fr.fragmentRecords(matchedRecords, fragmentLength, overlap, perClass, minLength, seed, provenancePath=outPath+outfile+fr.PROVENANCE_SUFFIX)
+
+    with output:
+        for sequence, classNo, *_ in matchedRecords:
+            write(sequence, classNo)
+            written += 1
+
+    elapsed = max(time.perf_counter()-started, 1e-9)
+    for position, (term, classNo) in enumerate(termClassPairs):
+        if not termCounts[position]:
+            print("The term and class pair for " + term + " - class " + str(classNo) + " has not been found.")
+    print("%i records in %.2fs (%.1f records/s), %i written, %i unmatched" % (records, elapsed, records/elapsed, written, unmatched))
+    return {'records': records, 'written': written, 'unmatched': unmatched, 'seconds': elapsed, 'recordsPerSecond': records/elapsed}
+
+@instr.timed('parse')
+def getSequences(termClassPairs:Iterable, mode:str='l', inPath:str="data/entries/", outPath:str="data/sequences/", datatype:str="fasta", fileName=None, fileFormat:str='txt', fragmentLength:int=None, overlap:int=0, perClass:int=None, seed:int=64, minLength:int=None, workers:int=None):
     
     '''
         This will take the relative path and file type on which to perform sequence
@@ -197,28 +323,51 @@ def getSequences(termClassPairs:Iterable, mode:str='l', inPath:str="data/entries
         outPath: Output directory, defaults to "data/sequences/"
 
         datatype: Datatype matching the file type, defaults to "fasta"
+
+        fileFormat: Output format used with 'l', either 'txt' or 'store'.
+                    Defaults to 'txt'
+
+        fragmentLength, overlap, perClass, seed, minLength: Optional. Outputs fixed-length
+                    fragments of the sequences instead of whole sequences, see
+                    createKmers(). With 'l', perClass applies to each output
+                    file separately
+
+        workers: Amount of processes parsing files in parallel with 'l', one
+                 file per process. Defaults to the amount of CPUs
+
+        Input files can be plain, gzip or BGZF compressed, and are decompressed
+        while they are read. Output files are named without the compression
+        suffix. Returns the statistics of sequenceToFile() for every file with
+        'l', or the list of sequences of the first file with 's'.
     '''
-    
+    fragmentOptions = {'fragmentLength': fragmentLength, 'overlap': overlap, 'perClass': perClass, 'seed': seed, 'minLength': minLength}
+
     if type(fileName) is str:
-        sequences = list(SeqIO.parse(inPath+fileName, datatype))
-        if mode.lower() == 'l':
-            sequenceToFile(sequences, termClassPairs, outPath, fileName)
+        files = [fileName]
+    elif fileName is None:
+        files = [file for file in sorted(os.listdir(inPath)) if os.path.isfile(inPath+file) and not fa.isSidecar(file)]
+    else:
+        files = list(fileName)
 
-        elif mode.lower() == 's':
-            return [str(x.seq).lower() for x in sequences]
+    if mode.lower() == 's':
+        return _sequenceList(fa.parseFile(inPath+files[0], datatype), fragmentOptions)
 
-    else:
-        if fileName is None:
-            files = os.listdir(inPath)
-        else:
-            files = fileName
-        for file in files:
-            sequences = list(SeqIO.parse(inPath+file, datatype))
-            if mode.lower() == 'l':
-                sequenceToFile(sequences, termClassPairs, outPath, file)
-
-            elif mode.lower() == 's':
-                return [str(x.seq).lower() for x in sequences]
+    elif mode.lower() == 'l':
+        workers = min(workers or os.cpu_count(), len(files))
+        jobs = [(inPath+file, termClassPairs, outPath, fa.plainName(file), fileFormat, datatype, fragmentOptions) for file in files]
+        if workers <= 1:
+            return [_fileToSequences(*job) for job in jobs]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_fileToSequences, *zip(*jobs)))
+
+def _fileToSequences(path:str, termClassPairs, outPath:str, outfile:str, fileFormat:str, datatype:str, fragmentOptions:dict):
+    return sequenceToFile(fa.parseFile(path, datatype), termClassPairs, outPath, outfile, fileFormat, **fragmentOptions)
+
+def _sequenceList(sequences, fragmentOptions:dict):
+    sequences = (str(x.seq).lower() for x in sequences)
+    if fragmentOptions['fragmentLength'] is None:
+        return list(sequences)
+    return [fragment for fragment, _ in fr.fragmentRecords(((sequence, 0) for sequence in sequences), **fragmentOptions)]
 
 def separateSeqAndClass(fileName:str, inPath:str="data/kmers/"):
     '''
@@ -229,14 +378,62 @@ def separateSeqAndClass(fileName:str, inPath:str="data/kmers/"):
         windowSize: required to fetch the correct list of k-mers
 
         inPath: path in which the file is searched for, defaults to "data/kmers/"
-    '''
-    kmers = pd.read_csv(inPath+fileName, sep=',')
-    kmers.sort_values(by='class', inplace=True)
-    sequences = kmers['sequence'].tolist()
-    classes = kmers['class'].tolist()
-    return sequences, classes, kmers.value_counts('class', sort=False).tolist()
 
-def combineSequences(inPath:str="data/sequences/", outPath:str="data/combined_data/", outFile:str="combined_sequences.txt", skipFirst:bool=False):
+        Use streamSeqAndClass() instead when the k-mers don't fit in memory.
+    '''
+    sequences = []
+    classes = []
+    for chunkSequences, chunkClasses in streamSeqAndClass(fileName, inPath):
+        sequences.extend(chunkSequences)
+        classes.extend(chunkClasses)
+
+    if any(classes[x] > classes[x+1] for x in range(len(classes)-1)):
+        order = sorted(range(len(classes)), key=classes.__getitem__)
+        sequences = [sequences[x] for x in order]
+        classes = [classes[x] for x in order]
+
+    classCounts = {}
+    for classNo in classes:
+        classCounts[classNo] = classCounts.get(classNo, 0) + 1
+    return sequences, classes, [classCounts[classNo] for classNo in sorted(classCounts)]
+
+def streamSeqAndClass(fileName:str, inPath:str="data/kmers/", chunkSize:int=1000):
+    '''
+        Generator version of separateSeqAndClass(). Yields lists of at most
+        chunkSize k-mer documents and their classes, in file order, which is
+        already sorted by class for files written by createKmers().
+    '''
+    sequences = []
+    classes = []
+    with open(inPath+fileName) as infile:
+        next(infile, None)
+        for line in infile:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            sequence, classNo = line.rsplit(',', 1)
+            sequences.append(sequence)
+            classes.append(int(classNo))
+            if len(sequences) >= chunkSize:
+                yield sequences, classes
+                sequences = []
+                classes = []
+    if sequences:
+        yield sequences, classes
+
+def countClasses(fileName:str, inPath:str="data/kmers/"):
+    '''
+        Returns the amount of entries for each class in a k-mer file, sorted by
+        number of class, without keeping any of the k-mers in memory.
+    '''
+    classCounts = {}
+    for _, classes in streamSeqAndClass(fileName, inPath):
+        for classNo in classes:
+            classCounts[classNo] = classCounts.get(classNo, 0) + 1
+    return [classCounts[classNo] for classNo in sorted(classCounts)]
+
+@instr.timed('combine')
+def combineSequences(inPath:str="data/sequences/", outPath:str="data/combined_data/", outFile:str="combined_sequences.txt", skipFirst:bool=False, fileFormat:str='txt'):
     '''
         Takes a directory of sequences and combines them into one large csv-like
         file.
@@ -252,6 +449,15 @@ def combineSequences(inPath:str="data/sequences/", outPath:str="data/combined_da
 
         skipFirst: Use this when combining two or more already combined files,
                    and set to False (or omit)
+
+        Directories, such as sequence stores, and the ".fragments.tsv"
+        provenance files sequenceToFile() writes next to its output are
+        skipped when combining text files.
+
+        fileFormat: 'txt' to combine text files, 'store' to combine the sequence
+                    stores in inPath into a new store named outFile. Combining
+                    stores only concatenates their indexes, the sequences
+                    themselves are not copied. Defaults to 'txt'
     '''
     if not os.path.isdir(inPath):
         os.mkdir(inPath)
@@ -259,10 +465,17 @@ def combineSequences(inPath:str="data/sequences/", outPath:str="data/combined_da
         os.mkdir(outPath)
 
     fileNames = os.listdir(inPath)
+    if fileFormat == 'store':
+        ss.combineStores([inPath+file for file in sorted(fileNames) if ss.isStore(inPath+file)], outPath+outFile)
+        return
+
     with open(outPath+outFile, "w") as outfile:
         if not skipFirst:
             outfile.write("sequence class\n") 
         for file in fileNames:
+            # Stores and the provenance of fragmented files aren't sequence files
+            if not os.path.isfile(inPath+file) or file.endswith(fr.PROVENANCE_SUFFIX):
+                continue
             with open(inPath+file) as infile:
                 for line in infile:
                     outfile.write(line)
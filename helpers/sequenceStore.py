@@ -0,0 +1,233 @@
+import json
+import os
+import numpy as np
+from collections.abc import Iterable
+from helpers import kmerCounter as kc
+'''
+    Packed binary alternative to the "<sequence> <class>" text files written
+    by sequenceToFile() and combineSequences().
+
+    A store is a directory holding:
+        store.json     - list of (data file, ambiguity file) pairs the
+                         records live in, relative to the store
+        index.npy      - one row per record: file, byte offset, length,
+                         class and the range of its ambiguity runs
+        sequences.bin  - nucleotides packed 4 to a byte (a=0, c=1, g=2, t=3),
+                         every record starting on a byte boundary
+        ambiguity.bin  - runs of anything that isn't a, c, g or t, stored
+                         as (position, length, base) so they can be restored
+
+    Combining stores only concatenates their indexes and points at the data
+    files of the stores being combined, nothing is copied.
+'''
+
+INDEX_DTYPE = np.dtype([('file', '<i4'), ('offset', '<i8'), ('length', '<i8'), ('classNo', '<i4'), ('ambOffset', '<i8'), ('ambCount', '<i8')])
+AMBIGUITY_DTYPE = np.dtype([('position', '<i8'), ('length', '<i8'), ('base', 'u1')])
+
+# Everything a store writes itself. The data files of other stores a
+# combined store points at are never touched
+_OWN_FILES = ("store.json", "index.npy", "sequences.bin", "ambiguity.bin")
+
+_SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+_BASES = np.frombuffer(b'acgt', dtype=np.uint8)
+
+def isStore(path:str):
+    '''
+        Returns whether path is a sequence store directory.
+    '''
+    return os.path.isfile(os.path.join(path, "store.json"))
+
+class SequenceStore:
+    '''
+        Reads and appends records of a packed sequence store.
+
+        path: Directory of the store. Created if it doesn't exist
+
+        overwrite: Whether to discard the records of an existing store and
+                   start it empty, like opening a text file with "w" would.
+                   Defaults to False, which appends to it
+
+        Records are appended with append(), and only become visible to other
+        readers once close() is called, or the with block is left.
+    '''
+    def __init__(self, path:str, overwrite:bool=False):
+        self.path = path if path.endswith('/') else path+'/'
+        if overwrite:
+            for name in _OWN_FILES:
+                if os.path.isfile(self.path+name):
+                    os.remove(self.path+name)
+        self.files = []
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        if isStore(self.path):
+            with open(self.path+"store.json") as f:
+                self.files = json.load(f)['files']
+            self.index = np.load(self.path+"index.npy")
+        elif not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self._pending = []
+        self._maps = {}
+        self._output = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.index) + len(self._pending)
+
+    def append(self, sequence:str, classNo:int):
+        '''
+            Packs and appends a single record.
+        '''
+        if self._output is None:
+            self._openOutput()
+        fileId, data, ambiguity = self._output
+
+        text = sequence.lower().encode('ascii', 'replace')
+        raw = np.frombuffer(text, dtype=np.uint8)
+        codes = kc.encodeSequence(text)
+        invalid = codes < 0
+
+        runs = np.zeros(0, dtype=AMBIGUITY_DTYPE)
+        if invalid.any():
+            # A new run starts wherever the base differs from the previous one
+            positions = np.flatnonzero(invalid)
+            starts = np.ones(len(positions), dtype=bool)
+            starts[1:] = (np.diff(positions) != 1) | (raw[positions[1:]] != raw[positions[:-1]])
+            runStarts = np.flatnonzero(starts)
+            runs = np.zeros(len(runStarts), dtype=AMBIGUITY_DTYPE)
+            runs['position'] = positions[runStarts]
+            runs['length'] = np.diff(np.append(runStarts, len(positions)))
+            runs['base'] = raw[positions[runStarts]]
+
+        padded = np.zeros((len(codes)+3)//4*4, dtype=np.uint8)
+        padded[:len(codes)] = np.where(invalid, 0, codes)
+        packed = np.bitwise_or.reduce(padded.reshape(-1, 4) << _SHIFTS, axis=1).astype(np.uint8)
+
+        offset = data.tell()
+        ambOffset = ambiguity.tell()//AMBIGUITY_DTYPE.itemsize
+        data.write(packed.tobytes())
+        ambiguity.write(runs.tobytes())
+        self._pending.append((fileId, offset, len(codes), classNo, ambOffset, len(runs)))
+
+    def close(self):
+        '''
+            Flushes appended records and saves the index.
+        '''
+        if self._output is not None:
+            self._output[1].close()
+            self._output[2].close()
+            self._output = None
+        if self._pending or not isStore(self.path):
+            self.index = np.concatenate([self.index, np.array(self._pending, dtype=INDEX_DTYPE)])
+            self._pending = []
+            self._save()
+        self._maps = {}
+
+    def classes(self):
+        '''
+            Returns the class of every record, in store order.
+        '''
+        return self.index['classNo']
+
+    def classCounts(self):
+        '''
+            Returns the amount of records for each class, sorted by number of
+            class, the same as createKmers() does.
+        '''
+        return np.unique(self.index['classNo'], return_counts=True)[1].tolist()
+
+    def encoded(self, record:int):
+        '''
+            Returns the 2-bit codes of a record as an int8 array, with -1 for
+            ambiguous bases, the same as kmerCounter.encodeSequence() would.
+            Only the bytes of this record are read from disk.
+        '''
+        codes = self._unpack(record).astype(np.int8)
+        for run in self._ambiguity(record):
+            codes[run['position']:run['position']+run['length']] = -1
+        return codes
+
+    def sequence(self, record:int):
+        '''
+            Returns a record as a lower case string.
+        '''
+        bases = _BASES[self._unpack(record)]
+        for run in self._ambiguity(record):
+            bases[run['position']:run['position']+run['length']] = run['base']
+        return bases.tobytes().decode('ascii')
+
+    def iterByClass(self, classNo:int=None, encoded:bool=False):
+        '''
+            Generator over (sequence, class) in class order, or over the records
+            of a single class if classNo is given. With encoded=True the
+            sequences are returned as by encoded() instead of as strings.
+        '''
+        order = np.argsort(self.index['classNo'], kind='stable')
+        if classNo is not None:
+            order = order[self.index['classNo'][order] == classNo]
+        for record in order:
+            yield (self.encoded(record) if encoded else self.sequence(record)), int(self.index['classNo'][record])
+
+    def _unpack(self, record:int):
+        entry = self.index[record]
+        data, _ = self._map(int(entry['file']))
+        length = int(entry['length'])
+        packed = data[entry['offset']:entry['offset']+(length+3)//4]
+        return ((packed[:, None] >> _SHIFTS) & 3).ravel()[:length]
+
+    def _ambiguity(self, record:int):
+        entry = self.index[record]
+        if entry['ambCount'] == 0:
+            return []
+        _, ambiguity = self._map(int(entry['file']))
+        return ambiguity[entry['ambOffset']:entry['ambOffset']+entry['ambCount']]
+
+    def _map(self, fileId:int):
+        if fileId not in self._maps:
+            dataFile, ambiguityFile = (os.path.join(self.path, name) for name in self.files[fileId])
+            data = np.memmap(dataFile, dtype=np.uint8, mode='r') if os.path.getsize(dataFile) else np.zeros(0, dtype=np.uint8)
+            ambiguity = np.memmap(ambiguityFile, dtype=AMBIGUITY_DTYPE, mode='r') if os.path.getsize(ambiguityFile) else np.zeros(0, dtype=AMBIGUITY_DTYPE)
+            self._maps[fileId] = (data, ambiguity)
+        return self._maps[fileId]
+
+    def _openOutput(self):
+        own = ["sequences.bin", "ambiguity.bin"]
+        if own not in self.files:
+            self.files.append(own)
+        fileId = self.files.index(own)
+        self._maps.pop(fileId, None)
+        self._output = (fileId, open(self.path+own[0], "ab"), open(self.path+own[1], "ab"))
+
+    def _save(self):
+        np.save(self.path+"index.tmp.npy", self.index)
+        os.replace(self.path+"index.tmp.npy", self.path+"index.npy")
+        with open(self.path+"store.json.tmp", "w") as f:
+            json.dump({'version': 1, 'files': self.files}, f)
+        os.replace(self.path+"store.json.tmp", self.path+"store.json")
+
+def combineStores(inPaths:Iterable[str], outPath:str):
+    '''
+        Creates a store at outPath whose index is the concatenation of the
+        indexes of the stores in inPaths, replacing any store already there.
+        The data files are referenced, not copied, so the input stores have
+        to be kept around.
+    '''
+    combined = SequenceStore(outPath, overwrite=True)
+    indexes = [combined.index]
+    for inPath in inPaths:
+        store = SequenceStore(inPath)
+        remap = []
+        for dataFile, ambiguityFile in store.files:
+            pair = [os.path.relpath(os.path.join(store.path, name), combined.path) for name in (dataFile, ambiguityFile)]
+            if pair not in combined.files:
+                combined.files.append(pair)
+            remap.append(combined.files.index(pair))
+        index = store.index.copy()
+        index['file'] = np.array(remap, dtype=np.int32)[index['file']] if len(index) else index['file']
+        indexes.append(index)
+    combined.index = np.concatenate(indexes)
+    combined._save()
+    return combined
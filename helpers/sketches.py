@@ -0,0 +1,238 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from collections.abc import Iterable
+from helpers import kmerCounter as kc
+'''
+    MinHash sketches of whole sequences and a nearest neighbour classifier
+    over them, used by the 'msh' mode of predictionFunction().
+
+    Every sequence is reduced to a fixed size sketch of its set of canonical
+    k-mers (a k-mer and its reverse complement count as the same), using
+    one-permutation MinHash: each k-mer is hashed once, the hash picks one of
+    sketchSize bins, and a bin keeps the smallest hash that falls in it. The
+    share of bins two sketches agree on estimates the Jaccard similarity of
+    their k-mer sets, from which the Mash distance follows.
+
+    Sketches are kept in a single (sequences, sketchSize) uint64 array. For
+    lookups the bins are split into bands, every band is hashed to one key,
+    and the keys of each band are kept sorted, so the candidates sharing a
+    band with a query are found by binary search instead of comparing the
+    query to every sketch.
+'''
+
+EMPTY = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+def _mix(x:np.ndarray):
+    # splitmix64 finalizer, vectorized over uint64
+    with np.errstate(over='ignore'):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+def canonicalKmers(sequence, windowSize:int):
+    '''
+        Returns the unique canonical k-mer codes of a sequence, i.e. the
+        smaller of every k-mer's code and its reverse complement's.
+    '''
+    encoded = kc.encodeSequence(sequence)
+    codes, valid = kc.kmerCodes(encoded, windowSize)
+    # The complement of a base is 3-code, invalid bases stay negative
+    complement = np.where(encoded >= 0, 3-encoded, encoded).astype(np.int8)[::-1]
+    reverseCodes, _ = kc.kmerCodes(complement, windowSize)
+    return np.unique(np.minimum(codes, reverseCodes[::-1])[valid])
+
+def sketchSequence(sequence, windowSize:int=21, sketchSize:int=512, seed:int=64):
+    '''
+        Returns the MinHash sketch of a sequence as a uint64 array of
+        sketchSize bins. Bins no k-mer fell into hold EMPTY.
+
+        sequence: Raw nucleotide sequence, e.g. from getSequences(mode='s'),
+                  or an encoded array from SequenceStore.encoded()
+
+        windowSize: Length of the k-mers, at most 31
+
+        sketchSize: Amount of bins
+
+        seed: Seed of the hash. Only sketches with the same seed are comparable
+    '''
+    sketch = np.full(sketchSize, EMPTY, dtype=np.uint64)
+    kmers = canonicalKmers(sequence, windowSize)
+    if len(kmers):
+        hashes = _mix(kmers.astype(np.uint64) ^ _mix(np.array([seed], dtype=np.uint64)))
+        np.minimum.at(sketch, (hashes % np.uint64(sketchSize)).astype(np.int64), hashes)
+    return sketch
+
+def sketchSequences(sequences:Iterable, windowSize:int=21, sketchSize:int=512, seed:int=64, workers:int=None, chunkSize:int=16):
+    '''
+        Returns the sketches of all sequences as a (sequences, sketchSize)
+        uint64 array, built in parallel over a process pool.
+
+        workers: Amount of processes. Defaults to the amount of CPUs, 1 builds
+                 the sketches in this process
+
+        chunkSize: Amount of sequences sent to a worker at once
+    '''
+    sketch = partial(sketchSequence, windowSize=windowSize, sketchSize=sketchSize, seed=seed)
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1:
+        sketches = [sketch(sequence) for sequence in sequences]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            sketches = list(pool.map(sketch, sequences, chunksize=chunkSize))
+    if not sketches:
+        return np.zeros((0, sketchSize), dtype=np.uint64)
+    return np.vstack(sketches)
+
+def jaccard(sketch:np.ndarray, sketches:np.ndarray):
+    '''
+        Returns the estimated Jaccard similarity between a sketch and every
+        row of sketches. Bins that are empty in both are left out.
+    '''
+    filled = sketch != EMPTY
+    matches = ((sketches == sketch) & filled).sum(axis=1)
+    union = ((sketches != EMPTY) | filled).sum(axis=1)
+    return np.divide(matches, union, out=np.zeros(len(sketches)), where=union > 0)
+
+def mashDistance(similarity, windowSize:int):
+    '''
+        Converts Jaccard similarities into Mash distances, which approximate
+        the per-base mutation rate between two sequences.
+    '''
+    similarity = np.asarray(similarity, dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        distance = -np.log(2*similarity/(1+similarity))/windowSize
+    return np.minimum(distance, 1.0)
+
+class SketchIndex:
+    '''
+        Array-backed index of sketches with LSH banding.
+
+        bands: Amount of bands the bins are split into. More bands find less
+               similar neighbours, at the cost of more candidates per query.
+               Should divide sketchSize
+    '''
+    def __init__(self, sketchSize:int=512, bands:int=128):
+        if sketchSize % bands:
+            raise AttributeError("bands should divide sketchSize. Got: %i and %i" % (sketchSize, bands))
+        self.sketchSize = sketchSize
+        self.bands = bands
+        self.sketches = np.zeros((0, sketchSize), dtype=np.uint64)
+        self.sortedKeys = np.zeros((bands, 0), dtype=np.uint64)
+        self.sortedIds = np.zeros((bands, 0), dtype=np.int64)
+
+    def bandKeys(self, sketches:np.ndarray):
+        '''
+            Returns the (sketches, bands) key of every band. Bands with only
+            empty bins get EMPTY, which is never looked up.
+        '''
+        rows = self.sketchSize//self.bands
+        banded = sketches.reshape(len(sketches), self.bands, rows)
+        keys = np.zeros((len(sketches), self.bands), dtype=np.uint64)
+        for row in range(rows):
+            keys = _mix(keys ^ banded[:, :, row])
+        keys[(banded == EMPTY).all(axis=2)] = EMPTY
+        return keys
+
+    def add(self, sketches:np.ndarray):
+        '''
+            Adds sketches to the index. Their ids continue from the sketches
+            already in it.
+        '''
+        self.sketches = np.vstack([self.sketches, sketches])
+        keys = self.bandKeys(self.sketches).T
+        self.sortedIds = np.argsort(keys, axis=1, kind='stable')
+        self.sortedKeys = np.take_along_axis(keys, self.sortedIds, axis=1)
+
+    def candidates(self, sketch:np.ndarray):
+        '''
+            Returns the ids of the sketches sharing at least one band with sketch.
+        '''
+        keys = self.bandKeys(sketch[np.newaxis])[0]
+        found = []
+        for band in np.nonzero(keys != EMPTY)[0]:
+            low = np.searchsorted(self.sortedKeys[band], keys[band], 'left')
+            high = np.searchsorted(self.sortedKeys[band], keys[band], 'right')
+            if high > low:
+                found.append(self.sortedIds[band, low:high])
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def query(self, sketches:np.ndarray, neighbours:int=1):
+        '''
+            Returns the ids and estimated Jaccard similarities of the nearest
+            neighbours of every sketch, as two (sketches, neighbours) arrays.
+            When LSH finds no candidate for a sketch, it is compared to the
+            whole index instead. Missing neighbours have id -1.
+        '''
+        ids = np.full((len(sketches), neighbours), -1, dtype=np.int64)
+        similarities = np.zeros((len(sketches), neighbours))
+        for row, sketch in enumerate(sketches):
+            candidates = self.candidates(sketch)
+            if not len(candidates):
+                candidates = np.arange(len(self.sketches))
+            similarity = jaccard(sketch, self.sketches[candidates])
+            best = np.argsort(-similarity, kind='stable')[:neighbours]
+            ids[row, :len(best)] = candidates[best]
+            similarities[row, :len(best)] = similarity[best]
+        return ids, similarities
+
+    def save(self, path:str):
+        np.save(path, self.sketches)
+
+    @classmethod
+    def load(cls, path:str, bands:int=128):
+        sketches = np.load(path, mmap_mode='r')
+        index = cls(sketches.shape[1], bands)
+        index.add(sketches)
+        return index
+
+class SketchClassifier:
+    '''
+        Nearest neighbour classifier over MinHash sketches. fit() and
+        predict() take raw sequences instead of a feature matrix.
+
+        windowSize: Length of the k-mers that are sketched
+
+        sketchSize, bands: See SketchIndex
+
+        neighbours: Amount of nearest neighbours that vote on the class,
+                    weighted by their similarity
+
+        workers: Amount of processes building the sketches, see sketchSequences()
+    '''
+    def __init__(self, windowSize:int=21, sketchSize:int=512, bands:int=128, neighbours:int=1, workers:int=None, seed:int=64):
+        self.windowSize = windowSize
+        self.sketchSize = sketchSize
+        self.bands = bands
+        self.neighbours = neighbours
+        self.workers = workers
+        self.seed = seed
+
+    def _sketch(self, sequences):
+        return sketchSequences(sequences, self.windowSize, self.sketchSize, self.seed, self.workers)
+
+    def fit(self, sequences, classes):
+        self.classes_, self.labels = np.unique(np.asarray(classes), return_inverse=True)
+        self.index = SketchIndex(self.sketchSize, self.bands)
+        self.index.add(self._sketch(sequences))
+        return self
+
+    def kneighbors(self, sequences):
+        '''
+            Returns the ids of the nearest training sequences and their Mash
+            distances.
+        '''
+        ids, similarities = self.index.query(self._sketch(sequences), self.neighbours)
+        return ids, mashDistance(similarities, self.windowSize)
+
+    def predict(self, sequences):
+        ids, similarities = self.index.query(self._sketch(sequences), self.neighbours)
+        votes = np.zeros((len(ids), len(self.classes_)))
+        found = ids >= 0
+        rows = np.nonzero(found)[0]
+        # A small constant lets neighbours with no shared bins still vote
+        np.add.at(votes, (rows, self.labels[ids[found]]), similarities[found]+1e-9)
+        return self.classes_[votes.argmax(axis=1)]
@@ -0,0 +1,62 @@
+from collections import deque
+from collections.abc import Iterable
+'''
+    Aho-Corasick matcher used to find which of many terms appear in a record
+    description with a single pass over the description, instead of one
+    substring search per term.
+'''
+
+class TermMatcher:
+    '''
+        Case insensitive multi-pattern matcher.
+
+        terms: Iterable of the terms to look for. Duplicate terms are allowed
+               and are reported under each of their positions
+    '''
+    def __init__(self, terms:Iterable[str]):
+        self.terms = [term.lower() for term in terms]
+        self.transitions = [{}]
+        self.fail = [0]
+        self.outputs = [set()]
+
+        for position, term in enumerate(self.terms):
+            state = 0
+            for char in term:
+                if char not in self.transitions[state]:
+                    self.transitions.append({})
+                    self.fail.append(0)
+                    self.outputs.append(set())
+                    self.transitions[state][char] = len(self.transitions)-1
+                state = self.transitions[state][char]
+            self.outputs[state].add(position)
+
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nextState in self.transitions[state].items():
+                queue.append(nextState)
+                fallback = self.fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nextState] = self.transitions[fallback].get(char, 0)
+                if self.fail[nextState] == nextState:
+                    self.fail[nextState] = 0
+                self.outputs[nextState] |= self.outputs[self.fail[nextState]]
+
+    def match(self, text:str):
+        '''
+            Returns the sorted positions, within terms, of every term found in
+            text.
+        '''
+        found = set()
+        state = 0
+        transitions = self.transitions
+        for char in text.lower():
+            while state and char not in transitions[state]:
+                state = self.fail[state]
+            state = transitions[state].get(char, 0)
+            if self.outputs[state]:
+                found |= self.outputs[state]
+        if '' in self.terms:
+            found.update(position for position, term in enumerate(self.terms) if term == '')
+        return sorted(found)
@@ -1,25 +1,41 @@
-from helpers import predictions as pred
-from helpers import sequenceFetch as sf
+from helpers.experiments import ExperimentRunner
+from helpers.featureCache import cachedVectorize
+from helpers import instrumentation
 
 if __name__ == '__main__':
     
+    # Records time and memory of every stage as JSON next to each report, and profiles the named stage
+    # instrumentation.enable(profileStage='fit')
+
+    # The data is fetched and prepared by the stages in pipeline.json (getData, getSequences,
+    # combineSequences, createKmers). Only stages whose inputs or parameters changed are rerun:
+    #     python -m helpers.pipeline pipeline.json
+    # If you're going to create a training and validation dataset that have similar names or entries,
+    # I recommend you split the term-class pairs into multiple lists and outputting to different folders,
+    # as pipeline.json does for hosts and viruses.
     # window = 3
     # hostClassPairs = [("beak and feather disease virus", 4), ("influenza a virus", 7), ("agapornis roseicollis", 3), ("cacatua moluccensis", 5), ("avian paramyxovirus", 6)]
     # virusClassPairs = [("influenza a virus", 0), ("avian paramyxovirus", 1), ("beak and feather disease virus", 2)]
-    # terms = ["agapornis roseicollis[Orgn]", "cacatua moluccensis[Orgn]", "beak and feather disease virus host", "influenza a virus host", "avian paramyxovirus complete genome", "beak and feather disease virus[Orgn]", "influenza a virus[Orgn]"]
-    # If you're going to create a training and validation dataset that have similar names or entries,
-    # I recommend you split the term-class pairs into multiple lists and outputting to different folders.
-    # sf.getData(terms, 100, 10, "your email here")
-    # sf.getSequences(hostClassPairs, outPath="data/sequences/hosts/")
-    # sf.getSequences(virusClassPairs, outPath="data/sequences/viruses/")
-    # sf.combineSequences(inPath="data/sequences/hosts/", outPath="data/partial_data/", outFile="hosts.txt", skipFirst=True)
-    # sf.combineSequences(inPath="data/sequences/viruses/", outPath="data/partial_data/", outFile="viruses.txt", skipFirst=True)
-    # sf.combineSequences(inPath="data/partial_data/")
-    # sf.createKmers(windowSize=window)
-
-    sequences, classes, classCounts = sf.separateSeqAndClass("kmers.txt")
+
+    # Vectorized data is cached in data/cache/features/ and only rebuilt when kmers.txt or the parameters change
+    vectorizedData, classes, classCounts, vocabulary = cachedVectorize("kmers.txt", (1, 4), 'cvec')
+    # The same matrix can be built straight from the raw sequences, skipping kmers.txt:
+    # vectorizedData, classes, classCounts, vocabulary = cachedVectorize("combined_sequences.txt", (1, 4), 'kvec', windowSize=window)
+    # Or kept up to date as entry files are added, counting k-mers only for records that are new:
+    # from helpers.incrementalCorpus import IncrementalCorpus
+    # corpus = IncrementalCorpus("data/corpus/", windowSize=window, ngramRange=(1, 4))
+    # corpus.update(hostClassPairs+virusClassPairs)
+    # vectorizedData, classes, classCounts, vocabulary = corpus.matrix()
+
+    # Optionally, columns present in fewer than 5 records can be pruned once, and every split below reuses the reduced matrix.
+    # The supervised 'chi2' and 'mi' methods should only be fitted on the training rows of a split.
+    # reductionReport() compares methods by accuracy, dimension and fit time to pick an operating point:
+    # from helpers.featureReduction import FeatureReducer, reductionReport
+    # reductionReport(vectorizedData, classes, [('mindf', None, 5), ('chi2', 20000), ('mi', 20000), ('projection', 4096), ('hashing', 2**16)], mode='svc')
+    # reducer = FeatureReducer('mindf', minDf=5).fit(vectorizedData)
+    # vectorizedData = reducer.transform(vectorizedData)
+    # vocabulary = reducer.reduceVocabulary(vocabulary)
     viralClassCount = classCounts[0]+classCounts[1]+classCounts[2]
-    vectorizedData = pred.vectorizeData(sequences, (1, 4), 'cvec')
     viralData = vectorizedData[:viralClassCount, :]
     viralClasses = classes[:viralClassCount]
     hostData = vectorizedData[viralClassCount:, :]
@@ -36,28 +52,49 @@ if __name__ == '__main__':
         Third is a variation of the second, where the training data are the hosts, and the
         validation data are each of the viral genomes
     '''
-    classNames = ["Alphainfluenzavirus", "Avian paramyxovirus", "Beak and feather disease virus", "Agapornis roseicollis", "BFDV Host", "Cacatua moluccensis", "Avian paramyxovirus Host", "IAV Host"]
-    pred.predictionFunction('cnb', trainingData=vectorizedData.toarray(), classes=classes, testSize=0.2, classNames=classNames)
-    pred.predictionFunction('cnn', trainingData=vectorizedData, classes=classes, testSize=0.2, classNames=classNames)
-    pred.predictionFunction('dtc', trainingData=vectorizedData, classes=classes, testSize=0.2, classNames=classNames)
-    pred.predictionFunction('svc', trainingData=vectorizedData, classes=classes, testSize=0.2, iterations=8192, classNames=classNames)
+    runner = ExperimentRunner()
+    runner.addDataset("all", vectorizedData, classes)
+    runner.addDataset("viral", viralData, viralClasses)
+    runner.addDataset("host", hostData, hostClasses)
+
+    classNames = allClassNames = ["Alphainfluenzavirus", "Avian paramyxovirus", "Beak and feather disease virus", "Agapornis roseicollis", "BFDV Host", "Cacatua moluccensis", "Avian paramyxovirus Host", "IAV Host"]
+    # 'mnb' fits the sparse counts directly, and runs alongside the dense 'cnb' baseline to compare against
+    runner.addDataset("all dense", vectorizedData.toarray(), classes)
+    runner.addJob('cnb', "all dense", classNames, testSize=0.2)
+    runner.addJob('mnb', "all", classNames, testSize=0.2)
+    runner.addJob('cnn', "all", classNames, testSize=0.2)
+    runner.addJob('dtc', "all", classNames, testSize=0.2)
+    runner.addJob('svc', "all", classNames, testSize=0.2, iterations=8192)
 
     offset = 0
     classNames = ["Alphainfluenzavirus", "Avian paramyxovirus", "Beak and feather disease virus"]
     for term, amount in [("Agapornis roseicollis", classCounts[3]), ("Cacatua moluccensis", classCounts[5]), ("BFDV Host", classCounts[4]), ("Influenza A virus Host", classCounts[7]), ("Avian paramyxovirus", classCounts[6])]:
-        print("Predicting for " + term)
-        curHost = viralData[offset:offset+amount, :]
-        pred.predictionFunction('cnn', trainingData=viralData, classes=viralClasses, testSize=amount, classNames=classNames, termPath=term+"/", layers=(32, 16, 8), testData=curHost)
-        pred.predictionFunction('dtc', trainingData=viralData, classes=viralClasses, testSize=amount, classNames=classNames, termPath=term+"/", testData=curHost)
-        pred.predictionFunction('svc', trainingData=viralData, classes=viralClasses, testSize=amount, iterations=8192, classNames=classNames, termPath=term+"/", testData=curHost)
+        runner.addDataset("host "+term, viralData[offset:offset+amount, :])
+        runner.addJob('cnn', "viral", classNames, test="host "+term, testSize=amount, termPath=term+"/", layers=(32, 16, 8))
+        runner.addJob('dtc', "viral", classNames, test="host "+term, testSize=amount, termPath=term+"/")
+        runner.addJob('svc', "viral", classNames, test="host "+term, testSize=amount, iterations=8192, termPath=term+"/")
         offset+=amount
 
     offset = 0
     classNames = ["Agapornis roseicollis", "BFDV Host", "Cacatua moluccensis", "Avian paramyxovirus Host", "IAV Host"]
     for term, amount in [("Influenza A virus", classCounts[0]), ("Avian paramyxovirus", classCounts[1]), ("BFDV", classCounts[2])]:
-        print("Predicting for " + term)
-        curHost = viralData[offset:offset+amount, :]
-        pred.predictionFunction('cnn', trainingData=hostData, classes=hostClasses, testSize=amount, classNames=classNames, termPath=term+"/", layers=(32, 16, 8), testData=curHost)
-        pred.predictionFunction('dtc', trainingData=hostData, classes=hostClasses, testSize=amount, classNames=classNames, termPath=term+"/", testData=curHost)
-        pred.predictionFunction('svc', trainingData=hostData, classes=hostClasses, testSize=amount, iterations=8192, classNames=classNames, termPath=term+"/", testData=curHost)
+        runner.addDataset("virus "+term, viralData[offset:offset+amount, :])
+        runner.addJob('cnn', "host", classNames, test="virus "+term, testSize=amount, termPath=term+"/", layers=(32, 16, 8))
+        runner.addJob('dtc', "host", classNames, test="virus "+term, testSize=amount, termPath=term+"/")
+        runner.addJob('svc', "host", classNames, test="virus "+term, testSize=amount, iterations=8192, termPath=term+"/")
         offset+=amount
+
+    runner.run()
+
+    # 5-fold cross-validation of the first split, with every fold scaled once for all models
+    # from helpers.crossValidation import crossValidate
+    # crossValidate(['cnn', 'dtc', 'svc', 'mnb'], vectorizedData, classes, allClassNames, folds=5, iterations=8192)
+
+    # Whole genome classification by MinHash sketches works on the raw sequences instead of the vectorized k-mers
+    # from helpers import sequenceFetch as sf
+    # from helpers.predictions import predictionFunction
+    # sequences, sequenceClasses = zip(*sf.readSequences("combined_sequences.txt"))
+    # predictionFunction('msh', list(sequences), list(sequenceClasses), allClassNames, windowSize=21, termPath="sketches/")
+
+    if instrumentation.isEnabled():
+        instrumentation.writeRunSummary("data/predictions/run_summary.json")
@@ -0,0 +1,80 @@
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+'''
+    Local stand-in for the esearch, epost and efetch E-utilities, serving
+    FASTA records from memory, for testing the downloader without NCBI.
+
+    Sample use:
+        with EntrezStub({"term": [("ID1", "description", "acgt")]}) as stub:
+            client = EntrezClient("test@example.com", baseUrl=stub.url, backoff=0, rate=1000)
+'''
+
+ESEARCH = '''<?xml version="1.0" encoding="UTF-8" ?>
+<!DOCTYPE eSearchResult PUBLIC "-//NLM//DTD esearch 20060628//EN" "https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20060628/esearch.dtd">
+<eSearchResult><Count>%i</Count><RetMax>%i</RetMax><RetStart>0</RetStart><IdList>%s</IdList><TranslationSet/><QueryTranslation>%s</QueryTranslation></eSearchResult>
+'''
+
+EPOST = '''<?xml version="1.0" encoding="UTF-8" ?>
+<!DOCTYPE ePostResult PUBLIC "-//NLM//DTD epost 20090526//EN" "https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20090526/epost.dtd">
+<ePostResult><QueryKey>1</QueryKey><WebEnv>%s</WebEnv></ePostResult>
+'''
+
+class EntrezStub:
+    '''
+        records: {term: [(id, description, sequence), ...]}
+
+        failures: Amount of efetch requests answered with 503 before the
+                  stub starts answering them, to exercise the retries
+    '''
+    def __init__(self, records:dict, failures:int=0):
+        self.records = {identifier: (description, sequence) for entries in records.values() for identifier, description, sequence in entries}
+        self.terms = {term: [identifier for identifier, _, _ in entries] for term, entries in records.items()}
+        self.failures = failures
+        self.sessions = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                params = {name: values[0] for name, values in urllib.parse.parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode()).items()}
+                status, body = stub.answer(self.path.rsplit('/', 1)[-1], params)
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%i/" % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def answer(self, utility:str, params:dict):
+        with self.lock:
+            self.requests.append((utility, params))
+            if utility == 'esearch.fcgi':
+                ids = self.terms.get(params['term'], [])[:int(params['retmax'])]
+                return 200, (ESEARCH % (len(ids), len(ids), ''.join('<Id>%s</Id>' % identifier for identifier in ids), params['term'])).encode()
+            if utility == 'epost.fcgi':
+                webenv = "session%i" % len(self.sessions)
+                self.sessions[webenv] = params['id'].split(',')
+                return 200, (EPOST % webenv).encode()
+            if utility == 'efetch.fcgi':
+                if self.failures:
+                    self.failures -= 1
+                    return 503, b'Service unavailable'
+                start = int(params['retstart'])
+                ids = self.sessions[params['WebEnv']][start:start+int(params['retmax'])]
+                return 200, ''.join(">%s %s\n%s\n" % (identifier, *self.records[identifier]) for identifier in ids).encode()
+        return 404, b'Unknown utility'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,45 @@
+import time
+import tracemalloc
+import pytest
+from benchmarks import run
+from benchmarks import synthetic
+
+def test_measureTimesWithoutTracing():
+    calls = []
+    def stage(size):
+        calls.append(tracemalloc.is_tracing())
+        started = time.perf_counter()
+        data = [0]*size
+        return len(data), time.perf_counter()-started
+
+    (length, seconds), metrics = run.measure(stage, 100000)
+    assert length == 100000
+    assert calls == [True, False]
+    assert metrics['peakBytes'] >= 100000*8
+    assert metrics['seconds'] >= seconds
+
+def test_compareReportsOnlyRealSlowdowns():
+    baseline = {'sizes': {'100': {'fast': {'seconds': 0.001}, 'slow': {'seconds': 1.0}, 'same': {'seconds': 1.0}}}}
+    results = {'sizes': {'100': {'fast': {'seconds': 0.005}, 'slow': {'seconds': 2.0}, 'same': {'seconds': 1.1}, 'new': {'seconds': 9.0}}}}
+    assert run.compare(results, baseline, tolerance=0.25) == [('100', 'slow', 1.0, 2.0)]
+
+def test_syntheticRecordsAreSeeded(tmp_path):
+    records = synthetic.makeRecords(12, classes=3, meanLength=50, seed=7)
+    assert records == synthetic.makeRecords(12, classes=3, meanLength=50, seed=7)
+    assert [classNo for _, _, classNo in records] == [0, 1, 2]*4
+    synthetic.writeFasta(tmp_path/"records.fasta", records, lineWidth=20)
+    text = (tmp_path/"records.fasta").read_text()
+    assert text.count(">") == 12 and max(len(line) for line in text.splitlines() if not line.startswith(">")) <= 20
+
+def test_parsingIsMeasuredInProcess(tmp_path, monkeypatch):
+    # Worker processes would be invisible to tracemalloc in the parent
+    calls = []
+    class Stop(Exception):
+        pass
+    def measure(function, *args, **kwargs):
+        calls.append(kwargs)
+        raise Stop()
+    monkeypatch.setattr(run, "measure", measure)
+    with pytest.raises(Stop):
+        run.runSuite(synthetic.makeRecords(4, classes=2, meanLength=50), 2, str(tmp_path), [3], [(1, 1)], ['cvec'], ['mnb'])
+    assert calls[0]['workers'] == 1
@@ -0,0 +1,33 @@
+from helpers import sequenceFetch as sf
+
+RECORDS = [("acgtac", 2), ("ggtt", 0), ("tacgta", 1), ("cccg", 0), ("atat", 2)]
+
+def _writeSequences(path):
+    with open(path, "w") as f:
+        f.write("sequence class\n")
+        for sequence, classNo in RECORDS:
+            f.write(sequence+" "+str(classNo)+"\n")
+
+def test_chunkedOutputIsSortedAndIndependentOfChunkSize(tmp_path):
+    inPath = str(tmp_path)+"/combined/"
+    tmp_path.joinpath("combined").mkdir()
+    _writeSequences(inPath+"combined_sequences.txt")
+    outPath = str(tmp_path)+"/kmers/"
+    small = sf.createKmers(inPath, outPath, outFile="small.txt", windowSize=3, chunkSize=1)
+    large = sf.createKmers(inPath, outPath, outFile="large.txt", windowSize=3, chunkSize=1000)
+    assert small == large == [2, 1, 2]
+    with open(outPath+"small.txt") as f:
+        lines = f.read().splitlines()
+    with open(outPath+"large.txt") as f:
+        assert f.read().splitlines() == lines
+    assert lines == ["sequence,class", "ggt gtt ,0", "ccc ccg ,0", "tac acg cgt gta ,1", "acg cgt gta tac ,2", "ata tat ,2"]
+
+def test_separateSeqAndClass(tmp_path):
+    with open(tmp_path/"kmers.txt", "w") as f:
+        f.write("sequence,class\nacg cgt ,1\nggt ,0\ntta ,1\n")
+    sequences, classes, classCounts = sf.separateSeqAndClass("kmers.txt", str(tmp_path)+"/")
+    assert sequences == ["ggt ", "acg cgt ", "tta "]
+    assert classes == [0, 1, 1]
+    assert classCounts == [1, 2]
+    assert sf.countClasses("kmers.txt", str(tmp_path)+"/") == [1, 2]
+    assert [len(chunk) for chunk, _ in sf.streamSeqAndClass("kmers.txt", str(tmp_path)+"/", chunkSize=2)] == [2, 1]
@@ -0,0 +1,47 @@
+import numpy as np
+from scipy import sparse
+from helpers.crossValidation import crossValidate, foldIndexes
+
+def _data(groupsPerClass=(4, 4, 1), rowsPerGroup=5, seed=6):
+    rng = np.random.default_rng(seed)
+    classes, groups = [], []
+    for classNo, amount in enumerate(groupsPerClass):
+        for group in range(amount):
+            classes += [classNo]*rowsPerGroup
+            groups += ["%i-%i" % (classNo, group)]*rowsPerGroup
+    classes = np.array(classes)
+    data = rng.poisson(1.0, (len(classes), 9)) + np.eye(3, 9, dtype=int)[classes]*5
+    return sparse.csr_matrix(data), classes, np.array(groups)
+
+def test_groupsStayInOneFold():
+    _, classes, groups = _data()
+    folds = foldIndexes(classes, 3, groups)
+    assert sorted(np.concatenate([test for _, test in folds]).tolist()) == list(range(len(classes)))
+    for train, test in folds:
+        assert not set(groups[train]) & set(groups[test])
+
+def test_foldsMissingAClass(tmp_path):
+    # Class 2 is a single group, so two of the three test folds don't have it
+    data, classes, groups = _data()
+    scores = crossValidate(['dtc', 'mnb'], data, classes, ["a", "b", "c"], folds=3, groups=groups, outPath=str(tmp_path)+"/", workers=2)
+    assert set(scores) == {'dtc', 'mnb'} and all(len(values) == 3 for values in scores['dtc'].values())
+    report = (tmp_path/"crossValidation"/"dtc.txt").read_text()
+    assert "3-fold cross-validation, grouped" in report and "f1 c" in report
+
+def test_accuracyIsOverEveryRow(tmp_path):
+    data, classes, _ = _data((6, 6, 6))
+    scores = crossValidate(['mnb'], data, classes, ["a", "b", "c"], folds=3, outPath=str(tmp_path)+"/", workers=1)
+    assert np.mean(scores['mnb']['accuracy']) > 0.9
+
+def test_absentClassesAreLeftOutOfFoldScores(tmp_path):
+    # Separable enough that every fold is predicted perfectly, so any score
+    # below 1 would come from counting class 2 in the fold without it
+    data, classes, groups = _data((3, 3, 2), rowsPerGroup=4, seed=1)
+    assert any(2 not in classes[test] for _, test in foldIndexes(classes, 3, groups))
+    data = data + sparse.csr_matrix(np.eye(3, 9, dtype=int)[classes]*50)
+    scores = crossValidate(['mnb'], data, classes, ["a", "b", "c"], folds=3, groups=groups, outPath=str(tmp_path)+"/", workers=1)
+    assert scores['mnb']['accuracy'] == [1.0]*3
+    assert scores['mnb']['f1'] == [1.0]*3 and scores['mnb']['recall'] == [1.0]*3
+    report = (tmp_path/"crossValidation"/"mnb.txt").read_text()
+    assert "f1                   1.0000 +/- 0.0000" in report
+    assert "f1 c                 1.0000 +/- 0.0000" in report
@@ -0,0 +1,61 @@
+import os
+from Bio import SeqIO
+from helpers import entrezDownload as ed
+from helpers import fastaIndex as fa
+from tests.entrezStub import EntrezStub
+
+RECORDS = {
+    "influenza a virus": [("IAV%i" % number, "Influenza A virus segment %i" % number, "acgt"*(number+1)) for number in range(7)],
+    "avian paramyxovirus": [("APV%i" % number, "Avian paramyxovirus %i" % number, "ggcc"*(number+1)) for number in range(3)],
+}
+
+def _client(stub):
+    return ed.EntrezClient("test@example.com", baseUrl=stub.url, backoff=0, rate=1000)
+
+def _ids(path):
+    return [record.id for record in fa.parseFile(path)]
+
+def test_downloadsEveryTermInOrder(tmp_path):
+    outPath = str(tmp_path)+"/"
+    with EntrezStub(RECORDS, failures=2) as stub:
+        stats = ed.downloadTerms(list(RECORDS), 5, 2, _client(stub), outPath=outPath)
+    assert _ids(outPath+"influenza a virus.fasta") == ["IAV%i" % number for number in range(5)]
+    assert _ids(outPath+"avian paramyxovirus.fasta") == ["APV%i" % number for number in range(3)]
+    assert stats['overall']['records'] == 8
+    assert not os.path.exists(outPath+".parts/")
+
+def test_compressedDownload(tmp_path):
+    outPath = str(tmp_path)+"/"
+    with EntrezStub(RECORDS) as stub:
+        ed.downloadTerms(["avian paramyxovirus"], 3, 2, _client(stub), outPath=outPath, compress=True)
+    assert fa.compression(outPath+"avian paramyxovirus.fasta.gz") == 'bgzf'
+    assert [str(record.seq) for record in fa.parseFile(outPath+"avian paramyxovirus.fasta.gz")] == [sequence for _, _, sequence in RECORDS["avian paramyxovirus"]]
+
+def _interrupt(stub, outPath, maxRecords, batchSize, start=0):
+    # Leaves a manifest with a single finished batch behind, as a crash would
+    download = ed._TermDownload("influenza a virus", outPath, "fasta").prepare(_client(stub), maxRecords, batchSize)
+    download.fetch(_client(stub), start, "fasta")
+
+def test_resumesFromFinishedBatches(tmp_path):
+    outPath = str(tmp_path)+"/"
+    with EntrezStub(RECORDS) as stub:
+        _interrupt(stub, outPath, 6, 2)
+        ed.downloadTerms(["influenza a virus"], 6, 2, _client(stub), outPath=outPath)
+        fetched = [int(params['retstart']) for utility, params in stub.requests if utility == 'efetch.fcgi']
+    assert sorted(fetched) == [0, 2, 4]
+    assert _ids(outPath+"influenza a virus.fasta") == ["IAV%i" % number for number in range(6)]
+
+def test_changedBatchSizeStartsOver(tmp_path):
+    outPath = str(tmp_path)+"/"
+    with EntrezStub(RECORDS) as stub:
+        _interrupt(stub, outPath, 6, 2, start=2)
+        ed.downloadTerms(["influenza a virus"], 6, 4, _client(stub), outPath=outPath)
+    assert _ids(outPath+"influenza a virus.fasta") == ["IAV%i" % number for number in range(6)]
+    assert not os.path.exists(outPath+".parts/")
+
+def test_changedMaxRecordsSearchesAgain(tmp_path):
+    outPath = str(tmp_path)+"/"
+    with EntrezStub(RECORDS) as stub:
+        _interrupt(stub, outPath, 2, 2)
+        ed.downloadTerms(["influenza a virus"], 7, 2, _client(stub), outPath=outPath)
+    assert _ids(outPath+"influenza a virus.fasta") == ["IAV%i" % number for number in range(7)]
@@ -0,0 +1,62 @@
+import multiprocessing
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
+from helpers import predictions as pred
+from helpers import instrumentation as instr
+from helpers.experiments import ExperimentRunner, shareMatrix, attachMatrix, _runJob
+
+def _data(rows=60, columns=12, seed=1):
+    rng = np.random.default_rng(seed)
+    classes = np.repeat([0, 1, 2], rows//3)
+    data = rng.poisson(1.0, (rows, columns)) + np.eye(3, columns, dtype=int)[classes]*4
+    return sparse.csr_matrix(data), classes
+
+def test_sharedMatrixRoundTrip():
+    matrix, _ = _data()
+    for original in (matrix, matrix.toarray()):
+        handle, segments = shareMatrix(original)
+        try:
+            attached, attachedSegments = attachMatrix(handle)
+            same = (attached != original).nnz == 0 if sparse.issparse(original) else np.array_equal(attached, original)
+            assert same
+            del attached
+            for segment in attachedSegments:
+                segment.close()
+        finally:
+            for segment in segments:
+                segment.close()
+                segment.unlink()
+
+def test_runnerMatchesPredictionFunction(tmp_path):
+    data, classes = _data()
+    classNames = ["a", "b", "c"]
+    runner = ExperimentRunner(workers=2, outPath=str(tmp_path)+"/runner/")
+    runner.addDataset("all", data, classes)
+    runner.addJob('dtc', "all", classNames, testSize=0.2, termPath="all/")
+    runner.addJob('mnb', "all", classNames, testSize=0.2, termPath="all/")
+    runner.run()
+    for mode in ('dtc', 'mnb'):
+        pred.predictionFunction(mode, data, classes, classNames, testSize=0.2, outPath=str(tmp_path)+"/single/", termPath="all/")
+        with open(tmp_path/"runner"/"all"/(mode+".txt")) as f, open(tmp_path/"single"/"all"/(mode+".txt")) as g:
+            assert f.read() == g.read()
+
+def test_spawnedWorkersProfileTheSelectedStage(tmp_path):
+    data, classes = _data()
+    handle, segments = shareMatrix(data)
+    instr.enable(profileStage='fit', profilePath=str(tmp_path)+"/profiles/")
+    try:
+        job = {'mode': 'dtc', 'termPath': "t/", 'classNames': ["a", "b", "c"], 'layers': (8, 4), 'iterations': 10, 'randState': 64, 'instrument': instr.config(), 'x_train': handle, 'x_test': handle, 'y_train': classes, 'y_test': classes}
+        # Spawned workers don't inherit the enabled instrumentation of this process
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            result = pool.submit(_runJob, job, 1).result()
+    finally:
+        instr.disable()
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+    fit, predict = result['stages']
+    assert fit['stage'] == 'fit' and os.path.isfile(fit['profile'])
+    assert 'profile' not in predict
+    assert instr.config() is None
@@ -0,0 +1,51 @@
+import gzip
+import pytest
+from Bio import bgzf
+from helpers import fastaIndex as fa
+from helpers.incrementalCorpus import IncrementalCorpus
+
+FASTA = ">A1 influenza a virus one\nACGTAC\nGT\n>B1 avian paramyxovirus one\nGGGCCA\n>C1 empty\n>A2 influenza a virus two\nTTACGA\nTTAC\n"
+PAIRS = [("influenza a virus", 0), ("avian paramyxovirus", 1)]
+
+def _write(tmp_path, kind):
+    path = str(tmp_path/("entries.fasta"+("" if kind is None else ".gz")))
+    if kind == 'gzip':
+        with gzip.open(path, "wt") as f:
+            f.write(FASTA)
+    elif kind == 'bgzf':
+        with bgzf.BgzfWriter(path, "wb") as f:
+            f.write(FASTA.encode())
+    else:
+        with open(path, "w") as f:
+            f.write(FASTA)
+    return path
+
+@pytest.mark.parametrize("kind", [None, 'gzip', 'bgzf'])
+def test_parseAndFetch(tmp_path, kind):
+    path = _write(tmp_path, kind)
+    assert fa.compression(path) == kind
+    assert [(record.id, str(record.seq)) for record in fa.parseFile(path)] == [("A1", "ACGTACGT"), ("B1", "GGGCCA"), ("C1", ""), ("A2", "TTACGATTAC")]
+    with fa.FastaIndex(path) as index:
+        assert index.names() == ["A1", "B1", "C1", "A2"]
+        assert [index.fetch(name) for name in ("A2", "A1", "C1", "B1")] == ["ttacgattac", "acgtacgt", "", "gggcca"]
+        assert list(index.select(PAIRS, classes=[0])) == [("acgtacgt", 0), ("ttacgattac", 0)]
+
+def test_corpusReadsCompressedEntries(tmp_path):
+    path = _write(tmp_path, 'bgzf')
+    fa.buildIndex(path)
+    corpus = IncrementalCorpus(str(tmp_path)+"/corpus/", windowSize=3, ngramRange=(1, 1))
+    stats = corpus.update(PAIRS, str(tmp_path)+"/")
+    assert (stats['processed'], stats['added']) == (1, 3)
+    _, classes, _, _ = corpus.matrix()
+    assert classes.tolist() == [0, 0, 1]
+
+def test_indexDoesNotTakeTheSamtoolsName(tmp_path):
+    path = _write(tmp_path, 'bgzf')
+    with fa.FastaIndex(path) as index:
+        assert index.indexPath == path+".gcfai"
+    assert not (tmp_path/"entries.fasta.gz.fai").exists()
+    # samtools' own sidecars are skipped as entries too
+    (tmp_path/"entries.fasta.gz.fai").write_text("garbage\n")
+    (tmp_path/"entries.fasta.gz.gzi").write_bytes(b"\0")
+    stats = IncrementalCorpus(str(tmp_path)+"/corpus/", windowSize=3, ngramRange=(1, 1)).update(PAIRS, str(tmp_path)+"/")
+    assert stats['processed'] == 1
@@ -0,0 +1,42 @@
+import numpy as np
+from helpers import predictions as pred
+from helpers import sequenceFetch as sf
+from helpers.featureCache import FeatureCache, cachedVectorize
+
+def _writeKmers(path, lines):
+    with open(path, "w") as f:
+        f.write("sequence,class\n"+"".join(line+"\n" for line in lines))
+
+def test_hitReturnsTheSameMatrix(tmp_path):
+    _writeKmers(tmp_path/"kmers.txt", ["acg cgt gta ,0", "ttg tga ,1", "acg cgg ,1"])
+    cache = FeatureCache(str(tmp_path)+"/cache/")
+    inPath = str(tmp_path)+"/"
+    built = cachedVectorize("kmers.txt", (1, 2), 'cvec', inPath=inPath, cache=cache)
+    cached = cachedVectorize("kmers.txt", (1, 2), 'cvec', inPath=inPath, cache=cache)
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+    sequences, classes, classCounts = sf.separateSeqAndClass("kmers.txt", inPath)
+    expected, vocabulary = pred.vectorizeData(sequences, (1, 2), 'cvec', returnVocabulary=True)
+    for matrix, entryClasses, entryCounts, entryVocabulary in (built, cached):
+        assert np.array_equal(matrix.toarray(), expected.toarray())
+        assert list(entryClasses) == classes and entryCounts == classCounts
+        assert list(entryVocabulary) == list(vocabulary)
+
+def test_changedInputOrParametersMiss(tmp_path):
+    _writeKmers(tmp_path/"kmers.txt", ["acg cgt ,0", "ttg ,1"])
+    cache = FeatureCache(str(tmp_path)+"/cache/")
+    inPath = str(tmp_path)+"/"
+    cachedVectorize("kmers.txt", (1, 1), 'cvec', inPath=inPath, cache=cache)
+    cachedVectorize("kmers.txt", (1, 2), 'cvec', inPath=inPath, cache=cache)
+    _writeKmers(tmp_path/"kmers.txt", ["acg cgt ,0", "ttg tgg ,1"])
+    matrix, _, _, vocabulary = cachedVectorize("kmers.txt", (1, 1), 'cvec', inPath=inPath, cache=cache)
+    assert cache.stats()['misses'] == 3
+    assert "tgg" in list(vocabulary)
+
+def test_leastRecentlyUsedIsEvicted(tmp_path):
+    _writeKmers(tmp_path/"kmers.txt", ["acg cgt ,0", "ttg ,1"])
+    cache = FeatureCache(str(tmp_path)+"/cache/", maxBytes=1)
+    inPath = str(tmp_path)+"/"
+    cachedVectorize("kmers.txt", (1, 1), 'cvec', inPath=inPath, cache=cache)
+    cachedVectorize("kmers.txt", (1, 2), 'cvec', inPath=inPath, cache=cache)
+    assert cache.stats()['entries'] == 1 and cache.stats()['evictions'] == 1
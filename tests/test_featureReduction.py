@@ -0,0 +1,66 @@
+import json
+import numpy as np
+import pytest
+from scipy import sparse
+from sklearn.feature_selection import mutual_info_classif
+from helpers.featureReduction import FeatureReducer, mutualInformation, reductionReport
+
+def _matrix(seed=3):
+    rng = np.random.default_rng(seed)
+    matrix = sparse.random(40, 30, density=0.3, format='csr', random_state=seed, data_rvs=lambda size: rng.integers(1, 5, size))
+    classes = rng.integers(0, 3, 40)
+    return matrix, classes
+
+def test_mutualInformationMatchesSklearn():
+    matrix, classes = _matrix()
+    presence = (matrix.toarray() > 0).astype(int)
+    expected = mutual_info_classif(presence, classes, discrete_features=True)
+    assert np.allclose(mutualInformation(matrix, classes), expected)
+
+def test_minDf():
+    matrix = sparse.csr_matrix(np.array([[1, 0, 2, 0], [3, 0, 0, 0], [1, 1, 5, 0]]))
+    reducer = FeatureReducer('mindf', minDf=2).fit(matrix)
+    assert reducer.columns.tolist() == [0, 2]
+    assert reducer.transform(matrix).toarray().tolist() == [[1, 2], [3, 0], [1, 5]]
+    assert reducer.reduceVocabulary(["a", "b", "c", "d"]).tolist() == ["a", "c"]
+    # dimension keeps the most frequent columns
+    assert FeatureReducer('mindf', 1, minDf=1).fit(matrix).columns.tolist() == [0]
+    # Fitting in chunks gives the same columns
+    assert FeatureReducer('mindf', minDf=2, chunkSize=1).fit(matrix).columns.tolist() == [0, 2]
+
+@pytest.mark.parametrize("method", ['chi2', 'mi', 'projection', 'hashing'])
+def test_transformShapes(method):
+    matrix, classes = _matrix()
+    reduced = FeatureReducer(method, 8).fit_transform(matrix, classes)
+    assert sparse.issparse(reduced) and reduced.shape == (40, 8)
+    if method == 'mi':
+        scores = mutualInformation(matrix, classes)
+        kept = FeatureReducer(method, 8).fit(matrix, classes).columns
+        assert scores[kept].min() >= np.delete(scores, kept).max()
+
+def test_supervisedMethodsNeedClasses():
+    matrix, _ = _matrix()
+    with pytest.raises(AttributeError):
+        FeatureReducer('chi2', 8).fit(matrix)
+    with pytest.raises(Exception, match="original columns"):
+        FeatureReducer('hashing', 8).fit(matrix).reduceVocabulary(range(30))
+
+def test_unsignedHashingKeepsCounts():
+    matrix, classes = _matrix()
+    reduced = FeatureReducer('hashing', 8, signed=False).fit_transform(matrix)
+    assert reduced.min() >= 0
+    assert np.array_equal(np.asarray(reduced.sum(axis=1)), np.asarray(matrix.sum(axis=1)))
+
+@pytest.mark.parametrize("mode", ['mnb', 'dtc'])
+def test_reductionReport(tmp_path, mode):
+    matrix, classes = _matrix()
+    settings = [('mindf', None, 3), ('chi2', 8), ('projection', 8), ('hashing', 8)]
+    rows = reductionReport(matrix, classes, settings, mode=mode, outPath=str(tmp_path)+"/")
+    methods = ['none', 'mindf', 'chi2', 'hashing'] if mode == 'mnb' else ['none', 'mindf', 'chi2', 'projection', 'hashing']
+    assert [row['method'] for row in rows] == methods
+    assert rows[0]['dimension'] == 30 and all(row['dimension'] == 8 for row in rows[2:])
+    assert all(0 <= row['accuracy'] <= 1 for row in rows)
+    assert json.loads((tmp_path/"reduction"/("reduction_%s.json" % mode)).read_text()) == rows
+    table = (tmp_path/"reduction"/("reduction_%s.txt" % mode)).read_text().splitlines()
+    assert table[0].split() == ["method", "dimension", "nnz", "accuracy", "reduce", "s", "fit", "s"]
+    assert [line.split()[0] for line in table[1:]] == methods
@@ -0,0 +1,67 @@
+import numpy as np
+from helpers import fragments as fr
+from helpers import sequenceFetch as sf
+
+PAIRS = [("influenza a virus", 0), ("avian paramyxovirus", 1)]
+
+def test_fragmentStarts():
+    assert fr.fragmentStarts(10, 4).tolist() == [0, 4]
+    assert fr.fragmentStarts(10, 4, overlap=2).tolist() == [0, 2, 4, 6]
+    assert fr.fragmentStarts(10, 4, minLength=2).tolist() == [0, 4, 8]
+    # The full fragments already reach the end
+    assert fr.fragmentStarts(8, 4, minLength=1).tolist() == [0, 4]
+    # Records shorter than a fragment are kept whole, unless minLength says otherwise
+    assert fr.fragmentStarts(3, 4).tolist() == [0]
+    assert fr.fragmentStarts(0, 4).tolist() == []
+    assert fr.fragmentStarts(3, 4, minLength=3).tolist() == [0]
+    assert fr.fragmentStarts(3, 4, minLength=4).tolist() == []
+
+def test_samplerKeepsAtMostPerClass():
+    sampler = fr.FragmentSampler(10, perClass=5, seed=1)
+    sequences = ["".join(np.random.default_rng(seed).choice(list("acgt"), 95)) for seed in range(4)]
+    for record, sequence in enumerate(sequences):
+        sampler.add(sequence, record % 2, "r%i" % record)
+    assert sampler.classCounts() == {0: (18, 5), 1: (18, 5)}
+    for fragment, classNo, record, start in sampler.fragments():
+        number = int(record[1:])
+        assert number % 2 == classNo
+        assert sequences[number][start:start+10] == fragment
+
+def test_samplerIsUniform():
+    # Every one of 20 fragments should be kept about perClass/20 of the time
+    kept = np.zeros(20)
+    for seed in range(2000):
+        sampler = fr.FragmentSampler(1, perClass=5, seed=seed)
+        sampler.add("a"*10, 0, 0)
+        sampler.add("a"*10, 0, 1)
+        for _, _, record, start in sampler.fragments():
+            kept[record*10+start] += 1
+    assert np.allclose(kept/2000, 0.25, atol=0.05)
+
+def test_fragmentedSequencesCanBeCombined(tmp_path):
+    entries = tmp_path/"entries"
+    entries.mkdir()
+    (entries/"first.fasta").write_text(">A1 influenza a virus x\n"+"ACGT"*100+"\n>B1 avian paramyxovirus x\n"+"GGCA"*60+"\n")
+    sequencesPath = str(tmp_path)+"/sequences/"
+    combinedPath = str(tmp_path)+"/combined/"
+    sf.getSequences(PAIRS, inPath=str(entries)+"/", outPath=sequencesPath, fragmentLength=100, perClass=3, workers=1)
+    provenance = open(sequencesPath+"first.fasta.fragments.tsv").read().splitlines()
+    assert provenance[0] == "record\tclass\tstart\tend"
+    assert len(provenance) == 1+3+2
+
+    sf.combineSequences(sequencesPath, combinedPath)
+    records = list(sf.readSequences("combined_sequences.txt", combinedPath))
+    assert sorted(classNo for _, classNo in records) == [0, 0, 0, 1, 1]
+    assert all(len(sequence) == 100 for sequence, _ in records)
+    assert sf.createKmers(combinedPath, str(tmp_path)+"/kmers/", windowSize=3) == [3, 2]
+
+def test_classesOfShortRecordsSurvive(tmp_path):
+    entries = tmp_path/"entries"
+    entries.mkdir()
+    (entries/"first.fasta").write_text(">A1 influenza a virus x\n"+"ACGT"*50+"\n>B1 avian paramyxovirus x\n"+"GGCA"*5000+"\n")
+    sequencesPath = str(tmp_path)+"/sequences/"
+    combinedPath = str(tmp_path)+"/combined/"
+    sf.getSequences([("influenza a virus", 0), ("avian paramyxovirus", 3)], inPath=str(entries)+"/", outPath=sequencesPath, fragmentLength=1000, perClass=10, workers=1)
+    sf.combineSequences(sequencesPath, combinedPath)
+    assert sf.createKmers(combinedPath, str(tmp_path)+"/kmers/", windowSize=3) == [1, 10]
+    assert sf.createKmers(combinedPath, str(tmp_path)+"/kmers/", windowSize=3, fragmentLength=1000, minLength=500) == [10]
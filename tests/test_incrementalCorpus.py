@@ -0,0 +1,100 @@
+import os
+import numpy as np
+from sklearn.naive_bayes import MultinomialNB
+from helpers import inference as inf
+from helpers import kmerCounter as kc
+from helpers import sequenceFetch as sf
+from helpers.incrementalCorpus import IncrementalCorpus
+from helpers.featureReduction import FeatureReducer
+
+PAIRS = [("influenza a virus", 0), ("avian paramyxovirus", 1)]
+
+def _fasta(records):
+    return "".join(">%s %s\n%s\n" % (identifier, description, sequence.upper()) for identifier, description, sequence in records)
+
+FIRST = [("A1", "influenza a virus x", "acgtacgtta"), ("B1", "avian paramyxovirus x", "ggccggccaa"), ("C1", "unrelated", "tttttttt")]
+SECOND = [("A2", "influenza a virus y", "acgtttgaca"), ("B2", "avian paramyxovirus y", "ccggttaacc")]
+
+def _expected(records):
+    # The same records counted from scratch, in class order
+    matched = sorted([(sequence, classNo) for _, description, sequence in records for term, classNo in PAIRS if term in description], key=lambda record: record[1])
+    matrix, keys = kc.countKmers([sequence for sequence, _ in matched], 3, (1, 2))
+    return matrix, [classNo for _, classNo in matched], kc.kmerFeatureNames(keys, 3, (1, 2))
+
+def _assertSame(corpus, records):
+    matrix, classes, classCounts, names = corpus.matrix()
+    expected, expectedClasses, expectedNames = _expected(records)
+    # Columns of removed records stay in the append only vocabulary
+    used = np.flatnonzero(matrix.getnnz(axis=0))
+    order = used[np.argsort(np.asarray(names)[used])]
+    assert list(np.asarray(names)[order]) == sorted(expectedNames)
+    assert np.array_equal(matrix.toarray()[:, order], expected.toarray())
+    assert classes.tolist() == expectedClasses
+    assert classCounts == np.unique(expectedClasses, return_counts=True)[1].tolist()
+
+def test_updatesMatchAFullRecount(tmp_path):
+    entries = tmp_path/"entries"
+    entries.mkdir()
+    (entries/"first.fasta").write_text(_fasta(FIRST))
+    corpus = IncrementalCorpus(str(tmp_path)+"/corpus/", windowSize=3, ngramRange=(1, 2))
+    assert corpus.update(PAIRS, str(entries)+"/")['added'] == 2
+    _assertSame(corpus, FIRST)
+
+    (entries/"second.fasta").write_text(_fasta(SECOND))
+    corpus = IncrementalCorpus(str(tmp_path)+"/corpus/", windowSize=3, ngramRange=(1, 2))
+    stats = corpus.update(PAIRS, str(entries)+"/")
+    assert (stats['skipped'], stats['processed'], stats['added']) == (1, 1, 2)
+    _assertSame(corpus, FIRST+SECOND)
+
+    # Changing a file only counts its new record and drops the one that left it
+    (entries/"second.fasta").write_text(_fasta(SECOND[:1]+[("A3", "influenza a virus z", "gattaca")]))
+    stats = corpus.update(PAIRS, str(entries)+"/")
+    assert (stats['added'], stats['kept'], stats['removed']) == (1, 1, 1)
+    _assertSame(corpus, FIRST+SECOND[:1]+[("A3", "influenza a virus z", "gattaca")])
+
+def test_reducedVocabularyCanBeSaved(tmp_path):
+    entries = tmp_path/"entries"
+    entries.mkdir()
+    (entries/"first.fasta").write_text(_fasta(FIRST+SECOND))
+    corpus = IncrementalCorpus(str(tmp_path)+"/corpus/", windowSize=3, ngramRange=(1, 2))
+    corpus.update(PAIRS, str(entries)+"/")
+    matrix, classes, _, names = corpus.matrix()
+    reducer = FeatureReducer('mindf', minDf=2).fit(matrix)
+    reduced = reducer.transform(matrix)
+    model = MultinomialNB().fit(reduced, classes)
+    inf.savePipeline(str(tmp_path)+"/models/", {'mode': 'kvec', 'ngramRange': (1, 2), 'windowSize': 3, 'vocabulary': reducer.reduceVocabulary(names)}, None, model)
+    pipeline = inf.loadPipeline(str(tmp_path)+"/models/")
+    # Rows are ordered by class
+    sequences = [sequence for _, _, sequence in (FIRST[0], SECOND[0], FIRST[1], SECOND[1])]
+    assert np.array_equal(pipeline.vectorize(sequences).toarray(), reduced.toarray())
+
+def test_deletedFilesLeaveTheIndex(tmp_path):
+    entries = tmp_path/"entries"
+    entries.mkdir()
+    (entries/"first.fasta").write_text(_fasta(FIRST))
+    (entries/"second.fasta").write_text(_fasta(SECOND))
+    corpus = IncrementalCorpus(str(tmp_path)+"/corpus/", windowSize=3, ngramRange=(1, 2))
+    corpus.update(PAIRS, str(entries)+"/")
+    os.remove(entries/"second.fasta")
+    stats = corpus.update(PAIRS, str(entries)+"/")
+    assert (stats['skipped'], stats['deleted'], stats['removed']) == (1, 1, 2)
+    _assertSame(corpus, FIRST)
+
+def test_duplicateRecordsKeepTheirRows(tmp_path):
+    # The same record in two files, and twice in one, like the text pipeline keeps them
+    entries = tmp_path/"entries"
+    entries.mkdir()
+    (entries/"first.fasta").write_text(_fasta(FIRST+FIRST[:1]))
+    (entries/"second.fasta").write_text(_fasta(FIRST[:1]+SECOND))
+    corpus = IncrementalCorpus(str(tmp_path)+"/corpus/", windowSize=3, ngramRange=(1, 2))
+    corpus.update(PAIRS, str(entries)+"/")
+    _assertSame(corpus, FIRST+FIRST[:1]+FIRST[:1]+SECOND)
+    sf.getSequences(PAIRS, inPath=str(entries)+"/", outPath=str(tmp_path)+"/sequences/", workers=1)
+    sf.combineSequences(str(tmp_path)+"/sequences/", str(tmp_path)+"/combined/")
+    assert corpus.matrix()[0].shape[0] == len(list(sf.readSequences("combined_sequences.txt", str(tmp_path)+"/combined/")))
+
+    # Dropping one of the copies only removes that row
+    (entries/"first.fasta").write_text(_fasta(FIRST))
+    stats = corpus.update(PAIRS, str(entries)+"/")
+    assert (stats['added'], stats['kept'], stats['removed']) == (0, 2, 1)
+    _assertSame(corpus, FIRST+FIRST[:1]+SECOND)
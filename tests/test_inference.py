@@ -0,0 +1,68 @@
+import asyncio
+import json
+import numpy as np
+import pytest
+from helpers import inference as inf
+from helpers import predictions as pred
+
+CLASS_NAMES = ["Agapornis roseicollis", "BFDV Host", "Cacatua moluccensis", "Avian paramyxovirus Host", "IAV Host"]
+MOTIFS = ["aaaa", "cccc", "gggg", "tttt", "acac"]
+
+def _sequences(seed=5, perClass=8):
+    # Labels 3..7 as in the host split of main.py, each marked by a repeated motif
+    rng = np.random.default_rng(seed)
+    sequences, classes = [], []
+    for classNo, motif in zip(range(3, 8), MOTIFS):
+        for _ in range(perClass):
+            noise = "".join(rng.choice(list("acgt"), size=12))
+            sequences.append(noise[:6]+motif*4+noise[6:])
+            classes.append(classNo)
+    return sequences, np.array(classes)
+
+def _save(tmp_path, mode='svc'):
+    sequences, classes = _sequences()
+    matrix, vocabulary = pred.vectorizeData(sequences, (1, 1), 'kvec', windowSize=4, returnVocabulary=True)
+    vectorizer = {'mode': 'kvec', 'ngramRange': (1, 1), 'windowSize': 4, 'vocabulary': vocabulary}
+    pred.predictionFunction(mode, matrix, classes, CLASS_NAMES, testSize=0.2, outPath=str(tmp_path)+"/", termPath="save/", savePath=str(tmp_path)+"/models/", vectorizer=vectorizer)
+    return inf.loadPipeline(str(tmp_path)+"/models/")
+
+@pytest.mark.parametrize('mode', ['svc', 'mnb'])
+def test_classNamesFollowModelClasses(tmp_path, mode):
+    pipeline = _save(tmp_path, mode)
+    sequences = ["gt"+motif*4+"ca" for motif in MOTIFS]
+    predictions = pipeline.predict(sequences).tolist()
+    assert predictions == [3, 4, 5, 6, 7]
+    assert pipeline.namesOf(predictions) == CLASS_NAMES
+    assert pipeline.namesOf([0, 9]) == [None, None]
+
+def test_savingUnsupportedModesIsRejected(tmp_path):
+    sequences, classes = _sequences()
+    with pytest.raises(Exception, match="not supported"):
+        pred.predictionFunction('msh', sequences, classes, CLASS_NAMES, testSize=0.2, outPath=str(tmp_path)+"/", termPath="msh/", savePath=str(tmp_path)+"/models/", vectorizer={'mode': 'kvec'}, windowSize=4, sketchSize=16, bands=4, workers=1)
+
+async def _request(port, method, path, body=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = b'' if body is None else json.dumps(body).encode()
+    writer.write(("%s %s HTTP/1.1\r\nContent-Length: %i\r\n\r\n" % (method, path, len(payload))).encode()+payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+def test_serviceBatchesRequests(tmp_path):
+    pipeline = _save(tmp_path)
+    async def scenario():
+        batcher = inf.MicroBatcher(pipeline, maxBatchSize=64, maxWait=0.05)
+        worker = asyncio.create_task(batcher.run())
+        server = await asyncio.start_server(lambda reader, writer: inf._handle(batcher, reader, writer), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            responses = await asyncio.gather(*[_request(port, "POST", "/predict", {'sequences': ["tt"+motif*4]}) for motif in MOTIFS])
+            metrics = await _request(port, "GET", "/metrics")
+        finally:
+            server.close()
+            worker.cancel()
+        return responses, metrics
+    responses, metrics = asyncio.run(scenario())
+    assert [response['classNames'][0] for response in responses] == CLASS_NAMES
+    assert metrics['sequences'] == 5 and metrics['batches'] < 5
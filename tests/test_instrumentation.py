@@ -0,0 +1,38 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from helpers import instrumentation as instr
+
+def _profiledFit(profilePath):
+    instr.enable(profileStage='fit', profilePath=profilePath)
+    with instr.stage('fit', mode='dtc'):
+        sum(range(1000))
+    return instr.records()[0]['profile']
+
+def test_stagesAreRecordedOnlyWhenEnabled():
+    instr.disable()
+    with instr.stage('parse') as info:
+        info['files'] = 1
+    instr.enable()
+    try:
+        @instr.timed('kmer')
+        def count():
+            return 3
+        assert count() == 3
+        with instr.stage('parse', files=2):
+            pass
+        stages = [(record['stage'], record.get('function'), record.get('files')) for record in instr.records()]
+        assert stages == [('kmer', 'count', None), ('parse', None, 2)]
+        assert instr.runSummary()['totals']['parse']['count'] == 1
+    finally:
+        instr.disable()
+
+def test_profilesOfWorkerProcessesDontCollide(tmp_path):
+    profilePath = str(tmp_path)+"/profiles/"
+    try:
+        with ProcessPoolExecutor(max_workers=3) as pool:
+            paths = list(pool.map(_profiledFit, [profilePath]*6))
+    finally:
+        instr.disable()
+    assert len(set(paths)) == 6
+    assert sorted(os.listdir(profilePath)) == sorted(os.path.basename(path) for path in paths)
+    assert all(os.path.basename(path).startswith("fit_dtc_") for path in paths)
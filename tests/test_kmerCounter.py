@@ -0,0 +1,31 @@
+import numpy as np
+from helpers import kmerCounter as kc
+from helpers import predictions as pred
+from helpers.sequenceFetch import kmerDocument
+
+SEQUENCES = ["acgtacgtacggt", "ttttgcaacgt", "ac", "ggcatcgatcgatcgacg"]
+
+def _columns(matrix, names):
+    order = np.argsort(names)
+    return np.asarray(names)[order], matrix.toarray()[:, order]
+
+def test_kvecMatchesCvec():
+    for windowSize, ngramRange in ((2, (1, 1)), (3, (1, 4)), (4, (2, 3))):
+        documents = [kmerDocument(sequence, windowSize) for sequence in SEQUENCES]
+        expected, expectedNames = pred.vectorizeData(documents, ngramRange, 'cvec', returnVocabulary=True)
+        counted, names = pred.vectorizeData(SEQUENCES, ngramRange, 'kvec', windowSize=windowSize, returnVocabulary=True)
+        expectedNames, expected = _columns(expected, expectedNames)
+        names, counted = _columns(counted, names)
+        assert list(names) == list(expectedNames)
+        assert np.array_equal(counted, expected)
+
+def test_featureKeysRoundTrip():
+    matrix, vocabulary = kc.countKmers(SEQUENCES, 3, (1, 2))
+    names = kc.kmerFeatureNames(vocabulary, 3, (1, 2))
+    assert np.array_equal(kc.kmerFeatureKeys(names, 3, (1, 2)), vocabulary)
+    assert np.array_equal(kc.transformKmers(SEQUENCES, vocabulary, 3, (1, 2)).toarray(), matrix.toarray())
+
+def test_ambiguousKmersDropped():
+    matrix, vocabulary = kc.countKmers(["acgnacg"], 3)
+    assert list(kc.kmerFeatureNames(vocabulary, 3)) == ["acg"]
+    assert matrix.toarray().tolist() == [[2]]
@@ -0,0 +1,22 @@
+import numpy as np
+from scipy import sparse
+from sklearn.naive_bayes import MultinomialNB
+from helpers import predictions as pred
+
+def test_chunkedFitMatchesMultinomialNB():
+    rng = np.random.default_rng(4)
+    classes = rng.integers(3, 6, 250)
+    matrix = sparse.random(250, 40, density=0.2, format='csr', random_state=4, data_rvs=lambda size: rng.integers(1, 9, size))
+    chunked = pred.ChunkedMultinomialNB(chunkSize=37).fit(matrix, classes)
+    reference = MultinomialNB().fit(matrix.toarray(), classes)
+    assert np.array_equal(chunked.classes_, reference.classes_)
+    assert np.allclose(chunked.feature_log_prob_, reference.feature_log_prob_)
+    assert np.allclose(chunked.predict_log_proba(matrix), reference.predict_log_proba(matrix.toarray()))
+
+def test_refitForgetsEarlierData():
+    first = sparse.csr_matrix(np.array([[3, 0], [0, 2]]))
+    second = sparse.csr_matrix(np.array([[1, 1], [0, 4], [5, 0]]))
+    model = pred.ChunkedMultinomialNB(chunkSize=1).fit(first, [0, 1])
+    model.fit(second, [1, 2, 2])
+    assert model.classes_.tolist() == [1, 2]
+    assert np.array_equal(model.class_count_, [1, 2])
@@ -0,0 +1,63 @@
+import json
+import re
+import numpy as np
+import pytest
+from helpers import outOfCore as ooc
+from helpers import predictions as pred
+from helpers import instrumentation as instr
+from sklearn.metrics import classification_report
+
+def _writeKmers(path, perClass=40, seed=2):
+    rng = np.random.default_rng(seed)
+    words = {0: ["aaa", "aac", "aca"], 1: ["ggg", "ggt", "gtg"], 2: ["ttt", "tta", "tat"]}
+    with open(path, "w") as f:
+        f.write("sequence,class\n")
+        for classNo, motif in words.items():
+            for _ in range(perClass):
+                f.write(" ".join(rng.choice(motif+["cgc", "gcg"], size=10))+" ,"+str(classNo)+"\n")
+
+def test_reportSupportIsAnIntegerCount(tmp_path):
+    _writeKmers(tmp_path/"kmers.txt")
+    ooc.outOfCorePrediction(str(tmp_path/"kmers.txt"), ["a", "g", "t"], testSize=0.25, estimator='nb', ngramRange=(1, 1), nFeatures=2**10, batchSize=16, outPath=str(tmp_path)+"/", termPath="ooc/")
+    report = (tmp_path/"ooc"/"ooc_nb.txt").read_text()
+    supports = [line.split()[-1] for line in report.splitlines() if re.match(r"\s+[agt]\s", line)]
+    assert len(supports) == 3 and all(support.isdigit() for support in supports)
+    assert re.search(r"accuracy\s+1\.00\s+(\d+)\n", report)
+
+def test_holdoutIsStable():
+    positions = np.arange(10000)
+    first = ooc._holdout(1, positions, 0.2, 64)
+    assert np.array_equal(first, ooc._holdout(1, positions, 0.2, 64))
+    assert abs(first.mean()-0.2) < 0.02
+    assert not np.array_equal(first, ooc._holdout(2, positions, 0.2, 64))
+
+def test_batchesMixEveryClass(tmp_path):
+    _writeKmers(tmp_path/"kmers.txt", perClass=30)
+    batches = list(ooc.streamBatches(str(tmp_path/"kmers.txt"), batchSize=9))
+    assert all(set(classes.tolist()) == {0, 1, 2} for _, classes, _ in batches[:-1])
+    assert sum(len(documents) for documents, _, _ in batches) == 90
+
+def test_integerTestSizeIsRejected(tmp_path):
+    _writeKmers(tmp_path/"kmers.txt")
+    with pytest.raises(AttributeError):
+        pred.predictionFunction('ooc', str(tmp_path/"kmers.txt"), None, ["a", "g", "t"], testSize=20, outPath=str(tmp_path)+"/", termPath="ooc/")
+
+def test_confusionReportMatchesClassificationReport():
+    labels = np.array([2, 5, 7, 9])
+    # Class 9 is never in the test records and is never predicted right
+    confusion = np.array([[5, 1, 0, 0], [2, 3, 0, 1], [0, 0, 4, 0], [0, 0, 0, 0]])
+    true = np.repeat(np.repeat(labels, 4), confusion.ravel())
+    predicted = np.repeat(np.tile(labels, 4), confusion.ravel())
+    expected = classification_report(true, predicted, labels=labels, target_names=list("abcd"), zero_division=0.0)
+    assert ooc.confusionReport(confusion, labels, list("abcd")) == expected
+
+def test_metricsAreWritten(tmp_path):
+    _writeKmers(tmp_path/"kmers.txt")
+    instr.enable()
+    try:
+        pred.predictionFunction('ooc', str(tmp_path/"kmers.txt"), None, ["a", "g", "t"], testSize=0.25, estimator='nb', ngramRange=(1, 1), nFeatures=2**10, batchSize=16, outPath=str(tmp_path)+"/", termPath="ooc/")
+    finally:
+        instr.disable()
+    metrics = json.loads((tmp_path/"ooc"/"ooc_nb.json").read_text())
+    assert metrics['mode'] == 'ooc'
+    assert {'fit', 'predict'} <= {record['stage'] for record in metrics['stages']}
@@ -0,0 +1,78 @@
+import os
+import pytest
+from helpers import pipeline as pl
+
+FASTA = ">A1 influenza a virus one\nACGTACGT\n>B1 avian paramyxovirus one\nGGGCCA\n"
+PAIRS = [["influenza a virus", 0], ["avian paramyxovirus", 1]]
+
+def _pipeline(tmp_path):
+    root = str(tmp_path)+"/"
+    if not os.path.isdir(root+"entries"):
+        os.makedirs(root+"entries")
+        with open(root+"entries/first.fasta", "w") as f:
+            f.write(FASTA)
+    config = {'stages': {
+        'parse': {'function': 'getSequences', 'params': {'termClassPairs': PAIRS, 'inPath': root+"entries/", 'outPath': root+"sequences/", 'workers': 1}, 'inputs': [root+"entries/"], 'outputs': [root+"sequences/"]},
+        'combine': {'function': 'combineSequences', 'params': {'inPath': root+"sequences/", 'outPath': root+"combined/"}, 'inputs': [root+"sequences/"], 'outputs': [root+"combined/combined_sequences.txt"]},
+        'kmers': {'function': 'createKmers', 'params': {'inPath': root+"combined/", 'outPath': root+"kmers/", 'windowSize': 3}, 'inputs': [root+"combined/combined_sequences.txt"], 'outputs': [root+"kmers/kmers.txt"]},
+    }}
+    return pl.Pipeline(config, root+"state.json")
+
+def test_dependenciesFollowPaths(tmp_path):
+    pipeline = _pipeline(tmp_path)
+    assert pipeline.dependencies == {'parse': set(), 'combine': {'parse'}, 'kmers': {'combine'}}
+
+def test_cyclesAreRejected():
+    stages = {'a': {'function': 'createKmers', 'inputs': ["x"], 'outputs': ["y"]}, 'b': {'function': 'createKmers', 'inputs': ["y"], 'outputs': ["x"]}}
+    with pytest.raises(Exception, match="cycle"):
+        pl.Pipeline({'stages': stages})
+
+def test_unchangedStagesAreSkipped(tmp_path):
+    assert _pipeline(tmp_path).run() == {'parse': 'ran', 'combine': 'ran', 'kmers': 'ran'}
+    assert _pipeline(tmp_path).run() == {'parse': 'skipped', 'combine': 'skipped', 'kmers': 'skipped'}
+
+def test_changedInputsRerunDependents(tmp_path):
+    _pipeline(tmp_path).run()
+    # A record that matches no term leaves the parsed sequences as they were
+    with open(str(tmp_path)+"/entries/first.fasta", "a") as f:
+        f.write(">C1 unrelated\nTTTT\n")
+    assert _pipeline(tmp_path).run() == {'parse': 'ran', 'combine': 'skipped', 'kmers': 'skipped'}
+
+    with open(str(tmp_path)+"/entries/first.fasta", "a") as f:
+        f.write(">A2 influenza a virus two\nTTAC\n")
+    assert _pipeline(tmp_path).run() == {'parse': 'ran', 'combine': 'ran', 'kmers': 'ran'}
+    with open(str(tmp_path)+"/kmers/kmers.txt") as f:
+        assert f.read().count("\n") == 4
+
+def test_removedOutputsAreRebuilt(tmp_path):
+    _pipeline(tmp_path).run()
+    os.remove(str(tmp_path)+"/kmers/kmers.txt")
+    assert _pipeline(tmp_path).run() == {'parse': 'skipped', 'combine': 'skipped', 'kmers': 'ran'}
+
+def test_force(tmp_path):
+    _pipeline(tmp_path).run()
+    # The forced stage writes the same output, so its dependents stay skipped
+    assert _pipeline(tmp_path).run(force=['combine']) == {'parse': 'skipped', 'combine': 'ran', 'kmers': 'skipped'}
+
+def test_dryRun(tmp_path):
+    _pipeline(tmp_path).run()
+    with open(str(tmp_path)+"/entries/first.fasta", "a") as f:
+        f.write(">A2 influenza a virus two\nTTAC\n")
+    with open(str(tmp_path)+"/state.json") as f:
+        state = f.read()
+    assert _pipeline(tmp_path).run(dryRun=True) == {'parse': 'ran', 'combine': 'ran', 'kmers': 'ran'}
+    with open(str(tmp_path)+"/state.json") as f:
+        assert f.read() == state
+    with open(str(tmp_path)+"/combined/combined_sequences.txt") as f:
+        assert "ttac" not in f.read()
+
+def test_failuresResume(tmp_path, monkeypatch):
+    def fail(**params):
+        raise OSError("disk full")
+    combine = pl.FUNCTIONS['combineSequences']
+    monkeypatch.setitem(pl.FUNCTIONS, 'combineSequences', fail)
+    assert _pipeline(tmp_path).run() == {'parse': 'ran', 'combine': 'failed', 'kmers': 'failed'}
+    assert not os.path.exists(str(tmp_path)+"/kmers/")
+
+    monkeypatch.setitem(pl.FUNCTIONS, 'combineSequences', combine)
+    assert _pipeline(tmp_path).run() == {'parse': 'skipped', 'combine': 'ran', 'kmers': 'ran'}
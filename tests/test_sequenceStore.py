@@ -0,0 +1,55 @@
+import numpy as np
+from helpers import kmerCounter as kc
+from helpers import sequenceFetch as sf
+from helpers import sequenceStore as ss
+
+RECORDS = [("acgtnnacgtrryacg", 1), ("ggg", 0), ("", 2), ("ttacgatcgatcgattgca", 0), ("NNNN", 1)]
+FASTA = ">A1 influenza a virus one\nACGTNNACGT\n>B1 avian paramyxovirus one\nGGGCCA\n>A2 influenza a virus two\nTTAC\n"
+PAIRS = [("influenza a virus", 0), ("avian paramyxovirus", 1)]
+
+def test_roundTrip(tmp_path):
+    with ss.SequenceStore(str(tmp_path/"test.store")) as store:
+        for sequence, classNo in RECORDS:
+            store.append(sequence, classNo)
+    store = ss.SequenceStore(str(tmp_path/"test.store"))
+    assert [store.sequence(record) for record in range(len(store))] == [sequence.lower() for sequence, _ in RECORDS]
+    assert store.classCounts() == [2, 2, 1]
+    assert [classNo for _, classNo in store.iterByClass()] == [0, 0, 1, 1, 2]
+    for record, (sequence, _) in enumerate(RECORDS):
+        assert np.array_equal(store.encoded(record), kc.encodeSequence(sequence.lower()))
+
+def _writeEntries(tmp_path):
+    entries = tmp_path/"entries"
+    entries.mkdir()
+    for name in ("first.fasta", "second.fasta"):
+        (entries/name).write_text(FASTA)
+    return str(entries)+"/"
+
+def _read(path):
+    store = ss.SequenceStore(path)
+    return [(store.sequence(record), int(store.classes()[record])) for record in range(len(store))]
+
+def test_rerunsReplaceTheirOutput(tmp_path):
+    inPath = _writeEntries(tmp_path)
+    sequencesPath = str(tmp_path)+"/sequences/"
+    combinedPath = str(tmp_path)+"/combined/"
+    for _ in range(3):
+        sf.getSequences(PAIRS, inPath=inPath, outPath=sequencesPath, fileFormat='store', workers=1)
+        sf.combineSequences(sequencesPath, combinedPath, "combined.store", fileFormat='store')
+    expected = [("acgtnnacgt", 0), ("gggcca", 1), ("ttac", 0)]
+    assert _read(sequencesPath+"first.fasta.store") == expected
+    assert _read(combinedPath+"combined.store") == expected*2
+    assert ss.SequenceStore(combinedPath+"combined.store").classCounts() == [4, 2]
+
+def test_kmersFromStoreMatchText(tmp_path):
+    inPath = _writeEntries(tmp_path)
+    sf.getSequences(PAIRS, inPath=inPath, outPath=str(tmp_path)+"/txt/", workers=1)
+    sf.getSequences(PAIRS, inPath=inPath, outPath=str(tmp_path)+"/store/", fileFormat='store', workers=1)
+    sf.combineSequences(str(tmp_path)+"/txt/", str(tmp_path)+"/combined/")
+    sf.combineSequences(str(tmp_path)+"/store/", str(tmp_path)+"/combined/", "combined.store", fileFormat='store')
+    kmerPath = str(tmp_path)+"/kmers/"
+    fromText = sf.createKmers(str(tmp_path)+"/combined/", kmerPath, outFile="text.txt", windowSize=3)
+    fromStore = sf.createKmers(str(tmp_path)+"/combined/", kmerPath, inFile="combined.store", outFile="store.txt", windowSize=3)
+    assert fromText == list(fromStore)
+    with open(kmerPath+"text.txt") as f, open(kmerPath+"store.txt") as g:
+        assert sorted(f) == sorted(g)
@@ -0,0 +1,48 @@
+import numpy as np
+from helpers import sketches as sk
+
+COMPLEMENT = str.maketrans("acgt", "tgca")
+
+def _genome(rng, length):
+    return "".join(rng.choice(list("acgt"), size=length))
+
+def _mutate(rng, sequence, rate):
+    bases = np.array(list(sequence))
+    positions = rng.random(len(bases)) < rate
+    bases[positions] = rng.choice(list("acgt"), size=positions.sum())
+    return "".join(bases)
+
+def test_canonicalKmersIgnoreStrand():
+    sequence = "acgttgcaaggctnacgt"
+    reverse = sequence.translate(COMPLEMENT)[::-1]
+    assert np.array_equal(sk.canonicalKmers(sequence, 5), sk.canonicalKmers(reverse, 5))
+
+def test_jaccardEstimate():
+    rng = np.random.default_rng(8)
+    first = _genome(rng, 20000)
+    second = first[:15000]+_genome(rng, 5000)
+    kmers = [set(sk.canonicalKmers(sequence, 15).tolist()) for sequence in (first, second)]
+    exact = len(kmers[0] & kmers[1])/len(kmers[0] | kmers[1])
+    sketches = sk.sketchSequences([first, second], 15, 1024, workers=1)
+    assert sk.jaccard(sketches[0], sketches)[0] == 1.0
+    assert abs(sk.jaccard(sketches[0], sketches[1:])[0]-exact) < 0.05
+    assert sk.mashDistance(1.0, 15) == 0.0 and sk.mashDistance(0.0, 15) == 1.0
+
+def test_lshFindsTheNearestSketch():
+    rng = np.random.default_rng(9)
+    genomes = [_genome(rng, 3000) for _ in range(40)]
+    index = sk.SketchIndex(256, 64)
+    index.add(sk.sketchSequences(genomes, 15, 256, workers=1))
+    queries = sk.sketchSequences([_mutate(rng, genome, 0.01) for genome in genomes], 15, 256, workers=1)
+    ids, _ = index.query(queries)
+    assert ids[:, 0].tolist() == list(range(40))
+    assert len(index.candidates(queries[0])) < 5
+
+def test_classifierPredictsTheGenomeItWasMutatedFrom():
+    rng = np.random.default_rng(10)
+    references = [_genome(rng, 4000) for _ in range(4)]
+    training = [_mutate(rng, references[classNo], 0.02) for classNo in range(4) for _ in range(3)]
+    classes = [classNo+3 for classNo in range(4) for _ in range(3)]
+    model = sk.SketchClassifier(15, 256, 64, neighbours=3, workers=1).fit(training, classes)
+    tests = [_mutate(rng, reference, 0.02) for reference in references]
+    assert model.predict(tests).tolist() == [3, 4, 5, 6]
@@ -0,0 +1,27 @@
+import numpy as np
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from helpers import sequenceFetch as sf
+from helpers.termMatcher import TermMatcher
+
+def _naive(terms, text):
+    return [position for position, term in enumerate(terms) if term.lower() in text.lower()]
+
+def test_matchesLikeSubstringSearch():
+    terms = ["influenza a virus", "virus", "a virus", "Avian paramyxovirus", "para", "aa", "aaa", "virus"]
+    rng = np.random.default_rng(3)
+    words = ["Influenza", "A", "virus", "avian", "paramyxovirus", "aaaa", "segment", "para"]
+    for _ in range(200):
+        text = " ".join(rng.choice(words, size=rng.integers(0, 8)))
+        assert TermMatcher(terms).match(text) == _naive(terms, text)
+
+def test_sequenceToFileWritesOncePerTerm(tmp_path):
+    records = [
+        SeqRecord(Seq("ACGT"), id="A", description="A Influenza A virus in Agapornis roseicollis"),
+        SeqRecord(Seq("GGCC"), id="B", description="B unrelated"),
+        SeqRecord(Seq("TTAA"), id="C", description="C agapornis roseicollis"),
+    ]
+    pairs = [("agapornis roseicollis", 3), ("influenza a virus", 0)]
+    stats = sf.sequenceToFile(iter(records), pairs, str(tmp_path)+"/", "out")
+    assert (tmp_path/"out.txt").read_text() == "acgt 3\nacgt 0\nttaa 3\n"
+    assert (stats['records'], stats['written'], stats['unmatched']) == (3, 3, 1)